@@ -0,0 +1,240 @@
+import json
+import logging
+from datetime import datetime, date, time, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TextIO
+
+import numpy as np
+
+from models import Appointment
+from epoch_time import EPOCH, to_epoch_seconds
+from interval_index import NON_BLOCKING_STATUSES
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Keys of to_dicts() and the NDJSON objects, as in Appointment.to_dict()
+RECORD_KEYS = (
+    'id', 'doctor_id', 'patient_id', 'start_time', 'end_time', 'appointment_type', 'urgency_level', 'status'
+)
+NDJSON_TEMPLATE = (
+    '{{"id": {}, "doctor_id": {}, "patient_id": {}, "start_time": "{}", "end_time": "{}", '
+    '"appointment_type": {}, "urgency_level": {}, "status": {}}}\n'
+)
+
+
+def _encode(values) -> Tuple[np.ndarray, Tuple]:
+    """Dictionary encode values: int16 codes into the tuple of distinct values, in order of appearance"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int16, count=len(values))
+    return codes, tuple(index)
+
+
+def _decode(codes: np.ndarray, values: Tuple) -> np.ndarray:
+    lookup = np.empty(len(values), dtype=object)
+    lookup[:] = values
+    return lookup[codes]
+
+
+def _iso_strings(seconds: np.ndarray) -> np.ndarray:
+    # Same text as datetime.isoformat() for whole-second times
+    return np.datetime_as_string(seconds.astype('datetime64[s]'), unit='s')
+
+
+class AppointmentBatch:
+    """
+    Appointments as columns of NumPy arrays instead of one object per row
+
+    Start and end times are int64 seconds since the epoch (naive times taken as
+    UTC, see epoch_time.py), IDs int32 (appointment IDs int64), urgency int8,
+    and appointment types and statuses are dictionary encoded as int16 codes
+    into the types and statuses tuples. Filters return new batches sharing
+    those tuples and never build per-row Python objects; to_dicts(),
+    iter_ndjson() and to_appointments() convert whole columns at once.
+    """
+
+    def __init__(
+            self,
+            ids: np.ndarray,
+            doctor_ids: np.ndarray,
+            patient_ids: np.ndarray,
+            starts: np.ndarray,
+            ends: np.ndarray,
+            type_codes: np.ndarray,
+            types: Tuple[str, ...],
+            urgency_levels: np.ndarray,
+            status_codes: np.ndarray,
+            statuses: Tuple[str, ...]
+    ):
+        self.ids = ids
+        self.doctor_ids = doctor_ids
+        self.patient_ids = patient_ids
+        self.starts = starts
+        self.ends = ends
+        self.type_codes = type_codes
+        self.types = types
+        self.urgency_levels = urgency_levels
+        self.status_codes = status_codes
+        self.statuses = statuses
+
+    @classmethod
+    def empty(cls) -> "AppointmentBatch":
+        return cls.from_rows([])
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple]) -> "AppointmentBatch":
+        """
+        Build from (id, doctor_id, patient_id, start, end, appointment_type,
+        urgency_level, status) tuples, start and end in epoch seconds
+        """
+        rows = list(rows)
+        if not rows:
+            columns = [()] * 8
+        else:
+            columns = list(zip(*rows))
+
+        ids, doctor_ids, patient_ids, starts, ends, types, urgency_levels, statuses = columns
+        type_codes, type_values = _encode(types)
+        status_codes, status_values = _encode(statuses)
+        return cls(
+            np.array(ids, dtype=np.int64),
+            np.array(doctor_ids, dtype=np.int32),
+            np.array(patient_ids, dtype=np.int32),
+            np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64),
+            type_codes, type_values,
+            np.array(urgency_levels, dtype=np.int8),
+            status_codes, status_values
+        )
+
+    @classmethod
+    def from_cursor(cls, cursor) -> "AppointmentBatch":
+        """Build from an executed cursor whose rows are in from_rows() order"""
+        return cls.from_rows(cursor.fetchall())
+
+    @classmethod
+    def from_appointments(cls, appointments: Iterable[Appointment]) -> "AppointmentBatch":
+        return cls.from_rows(
+            (appt.id, appt.doctor_id, appt.patient_id, to_epoch_seconds(appt.start_time),
+             to_epoch_seconds(appt.end_time), appt.appointment_type, appt.urgency_level, appt.status)
+            for appt in appointments
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _take(self, selection) -> "AppointmentBatch":
+        """Rows picked by a boolean mask or an index array"""
+        return AppointmentBatch(
+            self.ids[selection], self.doctor_ids[selection], self.patient_ids[selection],
+            self.starts[selection], self.ends[selection],
+            self.type_codes[selection], self.types,
+            self.urgency_levels[selection],
+            self.status_codes[selection], self.statuses
+        )
+
+    def _status_mask(self, statuses: Iterable[str]) -> np.ndarray:
+        statuses = set(statuses)
+        codes = [code for code, status in enumerate(self.statuses) if status in statuses]
+        return np.isin(self.status_codes, codes)
+
+    def for_doctors(self, doctor_ids: Iterable[int]) -> "AppointmentBatch":
+        return self._take(np.isin(self.doctor_ids, list(doctor_ids)))
+
+    def overlapping(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> "AppointmentBatch":
+        """Appointments overlapping [start, end), either bound optional"""
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.ends > to_epoch_seconds(start)
+        if end is not None:
+            mask &= self.starts < to_epoch_seconds(end)
+        return self._take(mask)
+
+    def starting_on(self, date_obj: date) -> "AppointmentBatch":
+        day_start = to_epoch_seconds(datetime.combine(date_obj, time(0, 0)))
+        return self._take((self.starts >= day_start) & (self.starts < day_start + SECONDS_PER_DAY))
+
+    def with_status(self, *statuses: str) -> "AppointmentBatch":
+        return self._take(self._status_mask(statuses))
+
+    def blocking(self) -> "AppointmentBatch":
+        """Appointments that occupy the doctor's time (not cancelled)"""
+        return self._take(~self._status_mask(NON_BLOCKING_STATUSES))
+
+    def sorted_by_start(self) -> "AppointmentBatch":
+        return self._take(np.argsort(self.starts, kind='stable'))
+
+    def by_doctor(self) -> Dict[int, "AppointmentBatch"]:
+        """Split into one batch per doctor, with one sort instead of a filter per doctor"""
+        order = np.argsort(self.doctor_ids, kind='stable')
+        boundaries = np.flatnonzero(np.diff(self.doctor_ids[order])) + 1
+        return {
+            int(self.doctor_ids[positions[0]]): self._take(positions)
+            for positions in np.split(order, boundaries) if len(positions)
+        }
+
+    def count_by_doctor_day(self) -> Dict[Tuple[int, date], int]:
+        """Number of appointments per (doctor_id, start date)"""
+        if not len(self):
+            return {}
+        days = self.starts // SECONDS_PER_DAY
+        keys, counts = np.unique(
+            np.stack([self.doctor_ids.astype(np.int64), days]), axis=1, return_counts=True
+        )
+        epoch_date = EPOCH.date()
+        return {
+            (doctor_id, epoch_date + timedelta(days=day)): count
+            for (doctor_id, day), count in zip(keys.T.tolist(), counts.tolist())
+        }
+
+    def start_times(self) -> List[datetime]:
+        return self.starts.astype('datetime64[s]').tolist()
+
+    def end_times(self) -> List[datetime]:
+        return self.ends.astype('datetime64[s]').tolist()
+
+    def _columns(self) -> list:
+        """Every column as a list of plain Python values, in RECORD_KEYS order"""
+        return [
+            self.ids.tolist(),
+            self.doctor_ids.tolist(),
+            self.patient_ids.tolist(),
+            _iso_strings(self.starts).tolist(),
+            _iso_strings(self.ends).tolist(),
+            _decode(self.type_codes, self.types).tolist(),
+            self.urgency_levels.tolist(),
+            _decode(self.status_codes, self.statuses).tolist()
+        ]
+
+    def to_dicts(self) -> List[Dict]:
+        """Rows as dicts with the keys of Appointment.to_dict() (times as ISO strings)"""
+        return [dict(zip(RECORD_KEYS, row)) for row in zip(*self._columns())]
+
+    def iter_ndjson(self) -> Iterator[str]:
+        """
+        Rows as newline-terminated JSON objects, the same as json.dumps() of
+        to_dicts(). Every distinct type and status is JSON encoded only once.
+        """
+        type_json = _decode(self.type_codes, tuple(json.dumps(value) for value in self.types)).tolist()
+        status_json = _decode(self.status_codes, tuple(json.dumps(value) for value in self.statuses)).tolist()
+        columns = self._columns()
+        columns[5] = type_json
+        columns[7] = status_json
+        for row in zip(*columns):
+            yield NDJSON_TEMPLATE.format(*row)
+
+    def write_ndjson(self, file: TextIO) -> int:
+        """Write iter_ndjson() to file, returns the number of rows"""
+        file.writelines(self.iter_ndjson())
+        return len(self)
+
+    def to_appointments(self) -> List[Appointment]:
+        return [
+            Appointment(appointment_id, doctor_id, patient_id, start_time, end_time, appointment_type, urgency, status)
+            for appointment_id, doctor_id, patient_id, start_time, end_time, appointment_type, urgency, status in zip(
+                self.ids.tolist(), self.doctor_ids.tolist(), self.patient_ids.tolist(),
+                self.start_times(), self.end_times(),
+                _decode(self.type_codes, self.types).tolist(), self.urgency_levels.tolist(),
+                _decode(self.status_codes, self.statuses).tolist()
+            )
+        ]
\ No newline at end of file
@@ -1,13 +1,17 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any, Union
 
 # Use SQLite database
-from database_sqlite import db_client
+from database_sqlite import db_client, async_db_client
 from models import Appointment, Doctor, Patient, AppointmentSlot
 from scheduler import AppointmentScheduler
+from interval_index import is_blocking
+from batch_scheduler import BatchScheduler, BatchRequest, BatchAssignment
 from calendar_integration import GoogleCalendarService
 from SoplexAITeam.medchatbot.config import APPOINTMENT_TYPES
+from config import LOOKAHEAD_DAYS
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,7 @@ class AppointmentManager:
 
     def __init__(self):
         self.db = db_client
+        self.async_db = async_db_client
         self.scheduler = AppointmentScheduler()
         try:
             self.calendar_service = GoogleCalendarService()
@@ -33,7 +38,7 @@ class AppointmentManager:
         if not result.get('data') or not result['data']:
             return None
 
-        return Appointment.from_dict(result['data'][0])
+        return Appointment.from_db(result['data'][0])
 
     def suggest_appointment_slots(
             self,
@@ -99,6 +104,10 @@ class AppointmentManager:
             max_slots=max_slots
         )
 
+    async def suggest_appointment_slots_async(self, *args, **kwargs) -> List[AppointmentSlot]:
+        """Async suggest_appointment_slots (same arguments), the search runs on the database executor"""
+        return await self.async_db.run(self.suggest_appointment_slots, *args, **kwargs)
+
     def create_appointment(
             self,
             doctor_id: int,
@@ -117,24 +126,94 @@ class AppointmentManager:
             raise ValueError(f"Invalid appointment type: {appointment_type}")
 
         # Validate doctor and patient
-        doctor_result = self.db.get_doctor(doctor_id)
+        doctor = self._validate_participants(doctor_id, patient_id, self.db.get_doctor(doctor_id),
+                                             self.db.get_patient(patient_id))
+
+        # Check for conflicts and insert into database
+        new_appointment = self._insert_appointment(
+            self._appointment_record(doctor_id, patient_id, start_time, end_time, appointment_type, urgency_level, notes),
+            start_time, end_time
+        )
+
+        # Sync with Google Calendar if doctor has a calendar ID and calendar service is available
+        self._sync_new_appointment(doctor, new_appointment)
+
+        return new_appointment.to_dict()
+
+    async def create_appointment_async(
+            self,
+            doctor_id: int,
+            patient_id: int,
+            start_time: datetime,
+            end_time: datetime,
+            appointment_type: str,
+            urgency_level: int = 3,
+            notes: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Async create_appointment
+
+        The doctor and patient are looked up concurrently, and the calendar sync
+        runs off the event loop. The conflict check and the insert share one
+        database transaction, so concurrent bookings for the same doctor are
+        serialized by its write lock.
+        """
+        if appointment_type not in APPOINTMENT_TYPES:
+            raise ValueError(f"Invalid appointment type: {appointment_type}")
+
+        doctor_result, patient_result = await asyncio.gather(
+            self.async_db.get_doctor(doctor_id),
+            self.async_db.get_patient(patient_id)
+        )
+        doctor = self._validate_participants(doctor_id, patient_id, doctor_result, patient_result)
+
+        new_appointment = await self.async_db.run(
+            self._insert_appointment,
+            self._appointment_record(doctor_id, patient_id, start_time, end_time, appointment_type,
+                                     urgency_level, notes),
+            start_time, end_time
+        )
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._sync_new_appointment, doctor, new_appointment)
+
+        return new_appointment.to_dict()
+
+    def _validate_participants(self, doctor_id: int, patient_id: int, doctor_result, patient_result) -> Doctor:
+        """Raise if the doctor or patient lookup came back empty, returns the doctor"""
         if not doctor_result.get('data'):
             raise ValueError(f"Doctor with ID {doctor_id} not found")
 
-        patient_result = self.db.get_patient(patient_id)
         if not patient_result.get('data'):
             raise ValueError(f"Patient with ID {patient_id} not found")
 
-        # Check for conflicts
-        day_start = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-
-        existing_appointments = self.scheduler.get_doctor_appointments(doctor_id, day_start, day_end)
+        return Doctor.from_db(doctor_result['data'][0])
 
-        for appt in existing_appointments:
-            if (start_time < appt.end_time and end_time > appt.start_time):
-                raise ValueError(f"Appointment conflict detected with appointment ID {appt.id}")
+    def _check_conflict(self, doctor_id: int, start_time: datetime, end_time: datetime, exclude=None):
+        """
+        Raise if a blocking appointment of the doctor overlaps [start_time, end_time)
 
+        An indexed overlap query on the database, so bookings made by any other
+        writer count. Call it inside the transaction that writes the booking: its
+        write lock keeps anyone else from booking in between.
+        """
+        result = self.db.get_doctor_appointments(doctor_id, start_time, end_time)
+        for appt_data in result.get('data') or []:
+            appointment = Appointment.from_db(appt_data)
+            if (appointment.id != exclude and is_blocking(appointment)
+                    and start_time < appointment.end_time and end_time > appointment.start_time):
+                raise ValueError(f"Appointment conflict detected with appointment ID {appointment.id}")
+
+    def _appointment_record(
+            self,
+            doctor_id: int,
+            patient_id: int,
+            start_time: datetime,
+            end_time: datetime,
+            appointment_type: str,
+            urgency_level: int,
+            notes: Optional[str]
+    ) -> Dict[str, Any]:
         # Create appointment record
         appointment_data = {
             'doctor_id': doctor_id,
@@ -149,34 +228,123 @@ class AppointmentManager:
         if notes:
             appointment_data['notes'] = notes
 
-        # Insert into database
-        result = self.db.create_appointment(appointment_data)
+        return appointment_data
 
-        if not result.get('data') or not result['data']:
-            raise Exception("Failed to create appointment")
+    def _insert_appointment(self, appointment_data: Dict[str, Any], start_time: datetime,
+                            end_time: datetime) -> Appointment:
+        """
+        Check for conflicts, insert an appointment and count it in the patient's
+        time preferences in one transaction (the client invalidates the doctor's
+        cached free time once it commits)
+        """
+        with self.db.transaction():
+            self._check_conflict(appointment_data['doctor_id'], start_time, end_time)
+            result = self.db.create_appointment(appointment_data)
+            if not result.get('data') or not result['data']:
+                raise Exception("Failed to create appointment")
 
-        new_appointment = Appointment.from_dict(result['data'][0])
+            new_appointment = Appointment.from_db(result['data'][0])
+            self.scheduler.preferences.record_booking(new_appointment)
 
-        # Sync with Google Calendar if doctor has a calendar ID and calendar service is available
-        doctor = Doctor.from_dict(doctor_result['data'][0])
+        return new_appointment
+
+    def schedule_batch(
+            self,
+            requests: List[BatchRequest],
+            start_date: Optional[datetime] = None,
+            end_date: Optional[datetime] = None,
+            commit: bool = False
+    ) -> List[BatchAssignment]:
+        """
+        Assign a whole waitlist of requests to slots in one optimization pass
 
+        Args:
+            requests: Requests to place (type, urgency, preferred time, candidate doctors)
+            start_date: Start date for the search (defaults to now)
+            end_date: End date for the search (defaults to LOOKAHEAD_DAYS ahead)
+            commit: Book the plan in a single transaction
+
+        Returns:
+            One BatchAssignment per request, in request order (slot is None if it could not be placed)
+        """
+        for request in requests:
+            if request.appointment_type not in APPOINTMENT_TYPES:
+                raise ValueError(f"Invalid appointment type: {request.appointment_type}")
+
+        for patient_id in {request.patient_id for request in requests}:
+            if not self.db.get_patient(patient_id).get('data'):
+                raise ValueError(f"Patient with ID {patient_id} not found")
+
+        if not start_date:
+            start_date = datetime.now()
+        if not end_date:
+            end_date = start_date + timedelta(days=LOOKAHEAD_DAYS)
+
+        default_doctor_ids = []
+        if any(not request.doctor_ids for request in requests):
+            doctor_result = self.db.table("doctors").select("id").eq("active", True).execute()
+            default_doctor_ids = [doc['id'] for doc in doctor_result.get('data') or []]
+
+        plan = BatchScheduler(self.scheduler).plan(requests, default_doctor_ids, start_date, end_date)
+
+        if commit:
+            self.commit_batch_plan(plan)
+
+        return plan
+
+    def commit_batch_plan(self, plan: List[BatchAssignment]) -> List[Dict[str, Any]]:
+        """
+        Book every placed assignment of a batch plan in one transaction
+
+        The plan is checked against the current bookings in the same transaction;
+        if any slot has been taken in the meantime nothing is booked.
+        """
+        placed = [assignment for assignment in plan if assignment.slot is not None]
+
+        new_appointments = []
+        with self.db.transaction():
+            for assignment in placed:
+                slot = assignment.slot
+                self._check_conflict(slot.doctor_id, slot.start_time, slot.end_time)
+
+            for assignment in placed:
+                request, slot = assignment.request, assignment.slot
+                result = self.db.create_appointment(self._appointment_record(
+                    slot.doctor_id, request.patient_id, slot.start_time, slot.end_time,
+                    request.appointment_type, request.urgency_level, request.notes
+                ))
+                appointment = Appointment.from_db(result['data'][0])
+                self.scheduler.preferences.record_booking(appointment)
+                new_appointments.append(appointment)
+
+        doctors = {}
+        for appointment in new_appointments:
+            if appointment.doctor_id not in doctors:
+                doctor_result = self.db.get_doctor(appointment.doctor_id)
+                doctors[appointment.doctor_id] = Doctor.from_db(doctor_result['data'][0])
+            self._sync_new_appointment(doctors[appointment.doctor_id], appointment)
+
+        logger.info(f"Booked {len(new_appointments)} appointments from batch plan")
+
+        return [appointment.to_dict() for appointment in new_appointments]
+
+    def _sync_new_appointment(self, doctor: Doctor, appointment: Appointment):
+        """Sync with Google Calendar if doctor has a calendar ID and calendar service is available"""
         if doctor.calendar_id and self.calendar_service:
-            logger.info(f"Syncing appointment to Google Calendar for doctor {doctor_id}")
+            logger.info(f"Syncing appointment to Google Calendar for doctor {doctor.id}")
 
             event_id = self.calendar_service.create_event(
                 calendar_id=doctor.calendar_id,
-                appointment=new_appointment
+                appointment=appointment
             )
 
             if event_id:
                 # Update appointment with calendar event ID
                 self.db.update_appointment(
-                    new_appointment.id,
+                    appointment.id,
                     {'google_calendar_event_id': event_id}
                 )
-                new_appointment.google_calendar_event_id = event_id
-
-        return new_appointment.to_dict()
+                appointment.google_calendar_event_id = event_id
 
     def update_appointment(
             self,
@@ -198,29 +366,24 @@ class AppointmentManager:
         if not current_appointment:
             raise ValueError(f"Appointment with ID {appointment_id} not found")
 
-        # Check for conflicts if changing time
-        if 'start_time' in updates or 'end_time' in updates:
-            start_time = updates.get('start_time', current_appointment.start_time)
-            end_time = updates.get('end_time', current_appointment.end_time)
-
-            day_start = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
+        # Check for conflicts if changing time, then update in database together
+        # with the patient's time preferences
+        with self.db.transaction():
+            if 'start_time' in updates or 'end_time' in updates:
+                start_time = updates.get('start_time', current_appointment.start_time)
+                end_time = updates.get('end_time', current_appointment.end_time)
 
-            existing_appointments = self.scheduler.get_doctor_appointments(
-                current_appointment.doctor_id, day_start, day_end
-            )
+                self._check_conflict(current_appointment.doctor_id, start_time, end_time, exclude=appointment_id)
 
-            for appt in existing_appointments:
-                if appt.id != appointment_id and (start_time < appt.end_time and end_time > appt.start_time):
-                    raise ValueError(f"Appointment conflict detected with appointment ID {appt.id}")
+            result = self.db.update_appointment(appointment_id, updates)
 
-        # Update in database
-        result = self.db.update_appointment(appointment_id, updates)
+            if not result.get('data') or not result['data']:
+                raise Exception("Failed to update appointment")
 
-        if not result.get('data') or not result['data']:
-            raise Exception("Failed to update appointment")
+            updated_appointment = Appointment.from_db(result['data'][0])
+            self.scheduler.preferences.forget_booking(current_appointment)
+            self.scheduler.preferences.record_booking(updated_appointment)
 
-        updated_appointment = Appointment.from_dict(result['data'][0])
 
         # If we have a Google Calendar event ID, update it
         if updated_appointment.google_calendar_event_id and self.calendar_service:
@@ -228,7 +391,7 @@ class AppointmentManager:
             doctor_result = self.db.get_doctor(updated_appointment.doctor_id)
 
             if doctor_result.get('data') and doctor_result['data'][0].get('calendar_id'):
-                doctor = Doctor.from_dict(doctor_result['data'][0])
+                doctor = Doctor.from_db(doctor_result['data'][0])
 
                 self.calendar_service.update_event(
                     calendar_id=doctor.calendar_id,
@@ -248,62 +411,95 @@ class AppointmentManager:
             raise ValueError(f"Appointment with ID {appointment_id} not found")
 
         # Update status
-        result = self.db.update_appointment(appointment_id, {'status': 'cancelled'})
+        updated_appointment = self._cancel(current_appointment)
 
-        if not result.get('data') or not result['data']:
-            raise Exception("Failed to cancel appointment")
+        # If we have a Google Calendar event ID, delete it
+        self._delete_calendar_event(updated_appointment)
 
-        updated_appointment = Appointment.from_dict(result['data'][0])
+        return updated_appointment.to_dict()
 
-        # If we have a Google Calendar event ID, delete or update it
-        if updated_appointment.google_calendar_event_id and self.calendar_service:
+    async def cancel_appointment_async(self, appointment_id: int) -> Dict[str, Any]:
+        """Async cancel_appointment, the database work and calendar event deletion run off the event loop"""
+        current_appointment = await self.async_db.run(self.get_appointment, appointment_id)
+        if not current_appointment:
+            raise ValueError(f"Appointment with ID {appointment_id} not found")
+
+        updated_appointment = await self.async_db.run(self._cancel, current_appointment)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._delete_calendar_event, updated_appointment)
+
+        return updated_appointment.to_dict()
+
+    def _cancel(self, current_appointment: Appointment) -> Appointment:
+        """
+        Mark an appointment cancelled and drop it from the patient's time
+        preferences in one transaction
+        """
+        with self.db.transaction():
+            result = self.db.update_appointment(current_appointment.id, {'status': 'cancelled'})
+            if not result.get('data') or not result['data']:
+                raise Exception("Failed to cancel appointment")
+
+            updated_appointment = Appointment.from_db(result['data'][0])
+            self.scheduler.preferences.forget_booking(current_appointment)
+
+        return updated_appointment
+
+    def _delete_calendar_event(self, appointment: Appointment):
+        if appointment.google_calendar_event_id and self.calendar_service:
             # Get doctor's calendar ID
-            doctor_result = self.db.get_doctor(updated_appointment.doctor_id)
+            doctor_result = self.db.get_doctor(appointment.doctor_id)
 
             if doctor_result.get('data') and doctor_result['data'][0].get('calendar_id'):
-                doctor = Doctor.from_dict(doctor_result['data'][0])
+                doctor = Doctor.from_db(doctor_result['data'][0])
 
                 self.calendar_service.delete_event(
                     calendar_id=doctor.calendar_id,
-                    event_id=updated_appointment.google_calendar_event_id
+                    event_id=appointment.google_calendar_event_id
                 )
 
-        return updated_appointment.to_dict()
-
     def get_doctor_schedule(
             self,
             doctor_id: int,
             start_date: Optional[datetime] = None,
-            end_date: Optional[datetime] = None
+            end_date: Optional[datetime] = None,
+            limit: Optional[int] = None,
+            offset: int = 0
     ) -> List[Dict[str, Any]]:
         """
-        Get a doctor's appointment schedule
+        Get a doctor's appointment schedule (one page of it in start time order with limit)
         """
         if not start_date:
             start_date = datetime.now()
         if not end_date:
             end_date = start_date + timedelta(days=7)  # Default to one week
 
-        appointments = self.scheduler.get_doctor_appointments(doctor_id, start_date, end_date)
+        appointments = self.scheduler.get_doctor_appointments(doctor_id, start_date, end_date, limit, offset)
         return [appt.to_dict() for appt in appointments]
 
     def get_patient_appointments(
             self,
             patient_id: int,
-            include_past: bool = False
+            include_past: bool = False,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            since: Optional[datetime] = None
     ) -> List[Dict[str, Any]]:
         """
-        Get a patient's appointments
+        Get a patient's appointments in start time order (one page of them with limit)
+
+        Unless include_past, only those starting at or after since (defaults to
+        now). Pass the same since for every page so the pages line up.
         """
-        result = self.db.get_patient_appointments(patient_id)
+        query = self.db.table("appointments").select("*").eq("patient_id", patient_id)
 
-        if not result.get('data'):
-            return []
+        if not include_past:
+            query = query.gte("start_time", (since or datetime.now()).isoformat())
 
-        appointments = [Appointment.from_dict(appt_data) for appt_data in result['data']]
+        result = query.order_by("start_time").order_by("id").limit(limit).offset(offset).execute()
 
-        if not include_past:
-            now = datetime.now()
-            appointments = [appt for appt in appointments if appt.start_time >= now]
+        if not result.get('data'):
+            return []
 
-        return [appt.to_dict() for appt in appointments]
\ No newline at end of file
+        return [Appointment.from_db(appt_data).to_dict() for appt_data in result['data']]
\ No newline at end of file
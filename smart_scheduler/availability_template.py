@@ -0,0 +1,101 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import List, Dict, Tuple, Iterable, Union
+
+from models import DoctorAvailability
+
+logger = logging.getLogger(__name__)
+
+
+class WeeklyAvailability:
+    """
+    One doctor's availability rules compiled into a weekly template
+
+    weekly[weekday] holds the recurring rows for that weekday and overrides[date]
+    holds every row that applies to a date with specific_date rows, so the rows
+    for any date are a single dictionary or tuple lookup. Rows keep the order they
+    were given in, same as filtering the rows with availability_applies().
+    """
+
+    def __init__(self, rows: Iterable[DoctorAvailability]):
+        rows = list(rows)
+        weekly = [[] for _ in range(7)]
+        dated = defaultdict(list)
+
+        for position, avail in enumerate(rows):
+            if avail.recurring and 0 <= avail.day_of_week < 7:
+                weekly[avail.day_of_week].append((position, avail))
+            if avail.specific_date:
+                dated[avail.specific_date].append((position, avail))
+
+        self.weekly: Tuple[Tuple[DoctorAvailability, ...], ...] = tuple(
+            tuple(avail for _, avail in day_rows) for day_rows in weekly
+        )
+
+        # Specific-date rows are added on top of the recurring rows of that weekday
+        self.overrides: Dict[date, Tuple[DoctorAvailability, ...]] = {}
+        for date_obj, date_rows in dated.items():
+            merged = {position: avail for position, avail in weekly[date_obj.weekday()]}
+            merged.update(date_rows)
+            self.overrides[date_obj] = tuple(merged[position] for position in sorted(merged))
+
+    def for_date(self, date_obj: date) -> Tuple[DoctorAvailability, ...]:
+        """Availability rows that apply to date_obj"""
+        rows = self.overrides.get(date_obj)
+        if rows is None:
+            rows = self.weekly[date_obj.weekday()]
+        return rows
+
+
+class AvailabilityTemplateCache:
+    """
+    Compiled WeeklyAvailability per doctor
+
+    Same versioning scheme as FreeSlotCache: read version() before loading the
+    rows and pass it to put(), so a template compiled from rows read before a
+    concurrent create_doctor_availability is never stored.
+    """
+
+    def __init__(self):
+        self._templates: Dict[int, WeeklyAvailability] = {}
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def version(self, doctor_id: int) -> int:
+        return self._versions[doctor_id]
+
+    def get(self, doctor_id: int):
+        return self._templates.get(doctor_id)
+
+    def put(self, doctor_id: int, template: WeeklyAvailability, version: int):
+        with self._lock:
+            if self._versions[doctor_id] == version:
+                self._templates[doctor_id] = template
+
+    def invalidate_doctor(self, doctor_id: int):
+        with self._lock:
+            self._versions[doctor_id] += 1
+            self._templates.pop(doctor_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+def compile_templates(
+        doctor_ids: List[int],
+        availability_rows: Iterable[Union[dict, DoctorAvailability]]
+) -> Dict[int, WeeklyAvailability]:
+    """Compile a template for each doctor (empty if they have none) from row dicts or DoctorAvailability objects"""
+    rows_by_doctor = defaultdict(list)
+    for avail_data in availability_rows:
+        avail = avail_data if isinstance(avail_data, DoctorAvailability) else DoctorAvailability.from_dict(avail_data)
+        rows_by_doctor[avail.doctor_id].append(avail)
+
+    return {doctor_id: WeeklyAvailability(rows_by_doctor.get(doctor_id, [])) for doctor_id in doctor_ids}
+
+
+# Shared by every scheduler in the process
+availability_templates = AvailabilityTemplateCache()
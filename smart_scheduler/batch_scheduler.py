@@ -0,0 +1,347 @@
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, time
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from models import AppointmentSlot
+from interval_index import IntervalIndex
+from config import BUFFER_BETWEEN_APPOINTMENTS, BATCH_CANDIDATES_PER_REQUEST
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchRequest:
+    """One patient waiting for an appointment"""
+    patient_id: int
+    appointment_type: str
+    urgency_level: int = 3
+    preferred_time: Optional[time] = None
+    doctor_ids: Optional[List[int]] = None  # candidate doctors, all active doctors if not given
+    notes: Optional[str] = None
+
+
+@dataclass
+class BatchAssignment:
+    request: BatchRequest
+    slot: Optional[AppointmentSlot] = None  # None if the request could not be placed
+
+
+def auction_assignment(benefit: np.ndarray, epsilon: float = 1e-3) -> np.ndarray:
+    """
+    Maximum-benefit assignment of rows to distinct columns (forward auction)
+
+    benefit is an (n, m) matrix with n <= m where -inf marks forbidden pairs, and
+    every row must have at least one finite entry in a column no other row can
+    use. All unassigned rows bid at once (Jacobi bidding), and prices start at
+    zero so columns nobody bid on stay the cheapest, which keeps the result
+    within n * epsilon of the optimum for rectangular problems too. Returns the
+    column assigned to each row.
+    """
+    n, m = benefit.shape
+    rows = np.arange(n)
+    prices = np.zeros(m)
+    row_to_col = np.full(n, -1)
+    col_to_row = np.full(m, -1)
+
+    while True:
+        unassigned = rows[row_to_col < 0]
+        if unassigned.size == 0:
+            return row_to_col
+
+        values = benefit[unassigned] - prices
+        positions = np.arange(unassigned.size)
+
+        best = np.argmax(values, axis=1)
+        best_value = values[positions, best]
+        values[positions, best] = -np.inf
+        second_value = values.max(axis=1)
+        second_value = np.where(np.isfinite(second_value), second_value, best_value)
+
+        bids = prices[best] + (best_value - second_value) + epsilon
+
+        # Highest bid per column wins, the previous owner goes back to bidding
+        order = np.lexsort((-bids, best))
+        bid_cols = best[order]
+        is_winner = np.concatenate(([True], bid_cols[1:] != bid_cols[:-1]))
+        win_rows = unassigned[order[is_winner]]
+        win_cols = bid_cols[is_winner]
+
+        displaced = col_to_row[win_cols]
+        row_to_col[displaced[displaced >= 0]] = -1
+        row_to_col[win_rows] = win_cols
+        col_to_row[win_cols] = win_rows
+        prices[win_cols] = bids[order[is_winner]]
+
+
+class _Pool:
+    """
+    Candidate slots from one search, shared by every request it was run for
+
+    columns holds each slot's column in the assignment problem (one per distinct
+    doctor and time across all pools), free whether the slot's doctor is still
+    free, and hour_index each slot's position in hour_times, the distinct
+    weekday and hour of day the slots start at.
+    """
+
+    def __init__(self, slots: List[AppointmentSlot], columns: Dict[Tuple[int, datetime, datetime], int],
+                 column_slots: List[AppointmentSlot]):
+        self.slots = slots
+        self.scores = np.array([slot.score for slot in slots], dtype=float)
+        self.columns = np.empty(len(slots), dtype=np.intp)
+        for position, slot in enumerate(slots):
+            key = (slot.doctor_id, slot.start_time, slot.end_time)
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = len(column_slots)
+                column_slots.append(slot)
+            self.columns[position] = column
+        self.free = np.ones(len(slots), dtype=bool)
+
+        hours: Dict[Tuple[int, int], int] = {}
+        self.hour_times: List[datetime] = []
+        self.hour_index = np.empty(len(slots), dtype=np.intp)
+        for position, slot in enumerate(slots):
+            key = (slot.start_time.weekday(), slot.start_time.hour)
+            index = hours.get(key)
+            if index is None:
+                index = hours[key] = len(self.hour_times)
+                self.hour_times.append(slot.start_time)
+            self.hour_index[position] = index
+
+
+@dataclass
+class _Candidates:
+    """A request's candidate slots: a pool, the request's score for each slot and which are still free for it"""
+    pool: _Pool
+    scores: np.ndarray
+    free: np.ndarray
+
+
+class BatchScheduler:
+    """
+    Assigns a whole waitlist of requests to slots in one optimization pass
+
+    Requests that differ only in the patient share one search for candidate
+    slots, scored with the same weights as a single search. Each request then
+    rescores the shared pool with its patient's time preference. The pools are
+    combined into one benefit matrix and solved as one assignment problem, so
+    requests competing for the same slots are traded off globally instead of
+    first-come first-served. Candidate slots overlap each other (15-minute steps,
+    buffers), so accepted assignments are checked against each other and the
+    displaced requests are solved again with the slots that are still free. A
+    request whose pool runs out gets new candidates from a search with the
+    accepted slots blocked, and is only left unplaced when that search finds none.
+    """
+
+    def __init__(self, scheduler, candidates_per_request: int = BATCH_CANDIDATES_PER_REQUEST):
+        self.scheduler = scheduler
+        self.candidates_per_request = candidates_per_request
+
+    def plan(
+            self,
+            requests: List[BatchRequest],
+            default_doctor_ids: List[int],
+            start_date: datetime,
+            end_date: datetime
+    ) -> List[BatchAssignment]:
+        """Build a conflict-free plan, in request order"""
+        columns: Dict[Tuple[int, datetime, datetime], int] = {}
+        column_slots: List[AppointmentSlot] = []
+        candidates = self._candidate_pools(requests, default_doctor_ids, start_date, end_date, columns, column_slots)
+
+        accepted: Dict[int, AppointmentSlot] = {}
+        doctor_indexes = defaultdict(IntervalIndex)
+        patient_indexes = defaultdict(IntervalIndex)
+        active = [i for i in range(len(requests)) if candidates[i].free.any()]
+
+        while active:
+            assignment = self._solve(active, candidates, column_slots)
+
+            # Accept the best assignments first, skipping any that collide with one already accepted
+            assigned = sorted(
+                ((request_index, slot) for request_index, slot in assignment.items() if slot is not None),
+                key=lambda item: item[1].score,
+                reverse=True
+            )
+            if not assigned:
+                break
+
+            booked_doctors = set()
+            booked_patients = set()
+            for request_index, slot in assigned:
+                if self._is_free(slot, requests[request_index], doctor_indexes, patient_indexes):
+                    accepted[request_index] = slot
+                    doctor_indexes[slot.doctor_id].insert(request_index, slot.start_time, slot.end_time)
+                    patient_indexes[requests[request_index].patient_id].insert(
+                        request_index, slot.start_time, slot.end_time
+                    )
+                    booked_doctors.add(slot.doctor_id)
+                    booked_patients.add(requests[request_index].patient_id)
+
+            active = [request_index for request_index in active if request_index not in accepted]
+
+            # Drop candidates that are no longer free, once per pool for the doctors
+            # and per request for patients who just got a slot
+            for pool in {id(candidates[i].pool): candidates[i].pool for i in active}.values():
+                for position in np.flatnonzero(pool.free):
+                    slot = pool.slots[position]
+                    if slot.doctor_id in booked_doctors and doctor_indexes[slot.doctor_id].overlaps(
+                            slot.start_time, slot.end_time, BUFFER_BETWEEN_APPOINTMENTS):
+                        pool.free[position] = False
+
+            # Searching again once a request's pool is used up, then solve again for the rest
+            still_active = []
+            for request_index in active:
+                request = requests[request_index]
+                request_candidates = candidates[request_index]
+                free = request_candidates.free & request_candidates.pool.free
+                if request.patient_id in booked_patients:
+                    patient_index = patient_indexes[request.patient_id]
+                    for position in np.flatnonzero(free):
+                        slot = request_candidates.pool.slots[position]
+                        if patient_index.overlaps(slot.start_time, slot.end_time):
+                            free[position] = False
+                request_candidates.free = free
+
+                if not free.any():
+                    def is_free(slot):
+                        return self._is_free(slot, request, doctor_indexes, patient_indexes)
+
+                    pool = _Pool(
+                        self._refill(request, default_doctor_ids, start_date, end_date, is_free),
+                        columns, column_slots
+                    )
+                    candidates[request_index] = _Candidates(pool, pool.scores, pool.free.copy())
+                if candidates[request_index].free.any():
+                    still_active.append(request_index)
+            active = still_active
+
+        unplaced = len(requests) - len(accepted)
+        if unplaced:
+            logger.warning(f"Batch plan could not place {unplaced} of {len(requests)} requests")
+
+        return [BatchAssignment(request=request, slot=accepted.get(i)) for i, request in enumerate(requests)]
+
+    def _candidate_pools(self, requests, default_doctor_ids, start_date, end_date, columns,
+                         column_slots) -> List[_Candidates]:
+        """
+        Top-scored candidate slots per request
+
+        Requests that differ only in the patient share one search without a
+        patient, whose pool grows with the number of requests competing for it so
+        that each of them can still be placed. Each request then rescores the pool
+        with its patient's time preference.
+        """
+        keys = [
+            (
+                request.appointment_type,
+                tuple(request.doctor_ids or default_doctor_ids),
+                request.urgency_level,
+                request.preferred_time
+            )
+            for request in requests
+        ]
+        group_sizes = Counter(keys)
+
+        pools = {}
+        candidates = []
+        for request, key in zip(requests, keys):
+            pool = pools.get(key)
+            if pool is None:
+                pool = pools[key] = _Pool(
+                    self._search(
+                        request, default_doctor_ids, start_date, end_date,
+                        self.candidates_per_request * group_sizes[key]
+                    ),
+                    columns, column_slots
+                )
+            candidates.append(_Candidates(pool, self._rescore(pool, request), pool.free.copy()))
+
+        return candidates
+
+    def _rescore(self, pool: _Pool, request: BatchRequest) -> np.ndarray:
+        """Scores of a pool searched without a patient, for request's patient"""
+        # An explicit preferred time replaces the patient's preference
+        if request.preferred_time or not request.patient_id:
+            return pool.scores
+
+        time_preference_score = self.scheduler._time_preference_score
+        difference = np.array([
+            time_preference_score(slot_time, patient_id=request.patient_id) - time_preference_score(slot_time)
+            for slot_time in pool.hour_times
+        ])
+        return pool.scores + self.scheduler._combine_scores(0.0, difference, 0.0)[pool.hour_index]
+
+    def _search(self, request, default_doctor_ids, start_date, end_date, max_slots,
+                patient_id: Optional[int] = None) -> List[AppointmentSlot]:
+        return self.scheduler.find_optimal_slots(
+            doctor_ids=list(request.doctor_ids or default_doctor_ids),
+            start_date=start_date,
+            end_date=end_date,
+            appointment_type=request.appointment_type,
+            patient_id=patient_id,
+            urgency_level=request.urgency_level,
+            preferred_time=request.preferred_time,
+            max_slots=max_slots
+        )
+
+    def _refill(self, request, default_doctor_ids, start_date, end_date, is_free) -> List[AppointmentSlot]:
+        """
+        New candidates for a request whose pool ran out: the best slots that
+        is_free() accepts (i.e. with the slots accepted so far blocked). The
+        search is widened until it has candidates_per_request of them or has
+        returned every slot in the range.
+        """
+        max_slots = self.candidates_per_request
+        while True:
+            slots = self._search(request, default_doctor_ids, start_date, end_date, max_slots, request.patient_id)
+            free = [slot for slot in slots if is_free(slot)]
+            if len(free) >= self.candidates_per_request or len(slots) < max_slots:
+                return free[:self.candidates_per_request]
+            max_slots *= 2
+
+    def _solve(self, active: List[int], candidates: List[_Candidates],
+               column_slots: List[AppointmentSlot]) -> Dict[int, Optional[AppointmentSlot]]:
+        """One assignment round over the active requests"""
+        positions = [np.flatnonzero(candidates[request_index].free) for request_index in active]
+        rows = np.repeat(np.arange(len(active)), [len(request_positions) for request_positions in positions])
+        columns = np.concatenate([
+            candidates[request_index].pool.columns[request_positions]
+            for request_index, request_positions in zip(active, positions)
+        ])
+        scores = np.concatenate([
+            candidates[request_index].scores[request_positions]
+            for request_index, request_positions in zip(active, positions)
+        ])
+
+        # Only the columns some active request can use, renumbered from 0
+        used_columns, columns = np.unique(columns, return_inverse=True)
+
+        # One private "unassigned" column per request keeps every row feasible
+        benefit = np.full((len(active), len(used_columns) + len(active)), -np.inf)
+        benefit[rows, columns] = scores
+        benefit[np.arange(len(active)), len(used_columns) + np.arange(len(active))] = 0.0
+
+        row_to_col = auction_assignment(benefit)
+
+        assignment = {}
+        for row, request_index in enumerate(active):
+            column = row_to_col[row]
+            if column < len(used_columns):
+                slot = column_slots[used_columns[column]]
+                assignment[request_index] = AppointmentSlot(
+                    slot.start_time, slot.end_time, slot.doctor_id, slot.doctor_name, float(benefit[row, column])
+                )
+            else:
+                assignment[request_index] = None
+        return assignment
+
+    def _is_free(self, slot, request, doctor_indexes, patient_indexes) -> bool:
+        """A slot is free if neither the doctor nor the patient already has an accepted slot overlapping it"""
+        if doctor_indexes[slot.doctor_id].overlaps(slot.start_time, slot.end_time, BUFFER_BETWEEN_APPOINTMENTS):
+            return False
+        return not patient_indexes[request.patient_id].overlaps(slot.start_time, slot.end_time)
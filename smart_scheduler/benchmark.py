@@ -0,0 +1,454 @@
+"""
+Benchmark suite for slot search, booking and schedule lookups
+
+Every scenario regenerates a synthetic database (see synthetic_data.py) of a
+given size and measures each operation repeatedly, reporting latency
+percentiles and the number of SQL statements it ran. Results can be stored as a
+baseline and later runs compared against it:
+
+    python benchmark.py --quick --save-baseline
+    python benchmark.py --quick --compare
+
+The benchmark uses its own database file (SCHEDULER_DB_PATH, a temporary file
+by default) and never touches scheduler.db. --time-storage epoch runs it against
+the integer appointment time columns, --read-mirror with slot search reading
+from the in-memory mirror (compare it against a file-backed baseline; only
+statements run on the database file are counted as queries). The startup/*
+entries time fresh interpreters running the CLI, from launch to exit.
+
+--export DAYS only measures export throughput (rows per second, peak memory)
+over a synthetic practice with DAYS days of appointments, e.g. --export 90 for
+a quarter.
+"""
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time as timer
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BASE_DIR / "benchmark_baseline.json"
+DEFAULT_DB = os.path.join(tempfile.gettempdir(), "scheduler_benchmark.db")
+
+# (doctors, horizon days, density) grids
+SCENARIOS = {
+    "quick": [(10, 7, 0.5), (50, 14, 0.5), (50, 30, 0.8)],
+    "full": [
+        (doctors, days, density)
+        for doctors in (10, 50, 200)
+        for days in (7, 30)
+        for density in (0.3, 0.7)
+    ]
+}
+
+PATIENTS_PER_DOCTOR = 20
+HISTORY_DAYS = 30
+STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+# Fresh interpreters timed from launch until they exit
+STARTUP_COMMANDS = {
+    "main_help": [sys.executable, "main.py", "--help"],
+    "import_and_query": [sys.executable, "-c", "import main; main.db_client.get_doctor(1)"]
+}
+
+
+class QueryCounter:
+    """Counts SQL statements run on any of the client's connections, via sqlite3's trace callback"""
+
+    def __init__(self, db):
+        self.count = 0
+        self._lock = threading.Lock()
+        db.set_trace_callback(self._trace)
+
+    def _trace(self, statement: str):
+        if statement.lstrip()[:6].upper().startswith(STATEMENTS):
+            with self._lock:
+                self.count += 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def measure(
+        operation: Callable[[], object],
+        counter: Optional[QueryCounter],
+        repeat: int,
+        setup: Optional[Callable[[], None]] = None
+) -> Dict[str, float]:
+    """Run operation repeat times (setup before each run is not measured)"""
+    latencies = []
+    queries = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        if counter:
+            counter.count = 0
+        started = timer.perf_counter()
+        operation()
+        latencies.append((timer.perf_counter() - started) * 1000)
+        queries.append(counter.count if counter else 0)
+
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "queries": round(sum(queries) / len(queries), 2)
+    }
+
+
+def run_scenario(doctors: int, days: int, density: float, repeat: int, seed: int) -> Dict[str, Dict[str, float]]:
+    # Imported here so that SCHEDULER_DB_PATH is set before the database client connects
+    from database_sqlite import db_client
+    from appointment_manager import AppointmentManager
+    from slot_cache import free_slot_cache
+    from availability_template import availability_templates
+    import synthetic_data
+
+    synthetic_data.reset()
+    synthetic_data.generate(
+        doctors=doctors,
+        patients=doctors * PATIENTS_PER_DOCTOR,
+        days=days,
+        history_days=HISTORY_DAYS,
+        density=density,
+        seed=seed
+    )
+
+    rng = random.Random(seed)
+    manager = AppointmentManager()
+    doctor_ids = [row['id'] for row in db_client.get_doctors()['data']]
+    patient_ids = [row['id'] for row in db_client.get_patients()['data']]
+    now = datetime.now()
+    end = now + timedelta(days=days)
+    counter = QueryCounter(db_client)
+
+    def clear_caches():
+        free_slot_cache.clear()
+        availability_templates.clear()
+
+    def search(patient_id=None):
+        return manager.scheduler.find_optimal_slots(
+            doctor_ids=doctor_ids,
+            start_date=now,
+            end_date=end,
+            appointment_type="routine_checkup",
+            patient_id=patient_id,
+            max_slots=10
+        )
+
+    results = {
+        "find_slots_cold": measure(lambda: search(rng.choice(patient_ids)), counter, repeat, setup=clear_caches),
+        "find_slots_warm": measure(lambda: search(patient_ids[0]), counter, repeat, setup=None),
+    }
+
+    # Each booking takes the best free slot of a random doctor, found outside the measurement
+    pending = []
+
+    def pick_slot():
+        doctor_id = rng.choice(doctor_ids)
+        slots = manager.scheduler.find_optimal_slots([doctor_id], now, end, "follow_up", max_slots=1)
+        pending.append((doctor_id, slots[0] if slots else None))
+
+    def book():
+        doctor_id, slot = pending.pop()
+        if slot is not None:
+            manager.create_appointment(
+                doctor_id, rng.choice(patient_ids), slot.start_time, slot.end_time, "follow_up"
+            )
+
+    results["book"] = measure(book, counter, repeat, setup=pick_slot)
+    results["doctor_schedule"] = measure(
+        lambda: manager.get_doctor_schedule(rng.choice(doctor_ids), now, end), counter, repeat
+    )
+    results["patient_appointments"] = measure(
+        lambda: manager.get_patient_appointments(rng.choice(patient_ids), include_past=True), counter, repeat
+    )
+
+    db_client.set_trace_callback(None)
+    return results
+
+
+def run_startup(repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Process startup: "main.py --help" must not touch the database at all, the
+    first query pays for connecting and checking the schema
+    """
+    def launch(command):
+        subprocess.run(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    return {
+        name: measure(lambda command=command: launch(command), None, repeat)
+        for name, command in STARTUP_COMMANDS.items()
+    }
+
+
+def run_models(count: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Construction time and memory per object of the models slot search builds
+    in bulk, against unslotted copies of the same dataclasses
+    """
+    from models import Appointment, AppointmentSlot, DoctorAvailability
+
+    start = datetime(2030, 1, 7, 9, 0)
+    rows = [
+        {
+            'id': i, 'doctor_id': i % 50, 'patient_id': i % 1000,
+            'start_time': (start + timedelta(minutes=15 * i)).isoformat(),
+            'end_time': (start + timedelta(minutes=15 * i + 30)).isoformat(),
+            'appointment_type': "routine_checkup", 'urgency_level': 3, 'status': "scheduled",
+            'notes': None, 'google_calendar_event_id': None, 'created_at': None
+        }
+        for i in range(count)
+    ]
+    availability_rows = [
+        {
+            'id': i, 'doctor_id': i % 50, 'day_of_week': i % 7,
+            'start_time': f"{8 + i % 4:02d}:{15 * (i % 4):02d}", 'end_time': f"{13 + i % 5:02d}:00",
+            'recurring': 1, 'specific_date': None, 'created_at': None
+        }
+        for i in range(count)
+    ]
+    slot_args = [(start, start + timedelta(minutes=30), i % 50, "Dr. Example", 0.5) for i in range(count)]
+
+    def unslotted(cls):
+        return dataclasses.make_dataclass(cls.__name__, [(f.name, f.type) for f in dataclasses.fields(cls)])
+
+    PlainSlot = unslotted(AppointmentSlot)
+    PlainAppointment = unslotted(Appointment)
+
+    def legacy_availability(row):
+        # Availability time parsing before timeparse.py: strptime for every row
+        return (datetime.strptime(row['start_time'], "%H:%M").time(),
+                datetime.strptime(row['end_time'], "%H:%M").time())
+
+    def legacy_from_dict(row):
+        # Appointment.from_dict as it was for unslotted models: field list built per call, keyword construction
+        valid_fields = list(Appointment.COLUMNS)
+        data = {k: v for k, v in row.items() if k in valid_fields}
+        data['start_time'] = datetime.fromisoformat(data['start_time'])
+        data['end_time'] = datetime.fromisoformat(data['end_time'])
+        return PlainAppointment(**data)
+
+    cases = {
+        "slot/dict_dataclass": lambda: [PlainSlot(*args) for args in slot_args],
+        "slot/slotted": lambda: [AppointmentSlot(*args) for args in slot_args],
+        "appointment/dict_dataclass_from_dict": lambda: [legacy_from_dict(row) for row in rows],
+        "appointment/from_dict": lambda: [Appointment.from_dict(row) for row in rows],
+        "appointment/from_db": lambda: [Appointment.from_db(row) for row in rows],
+        "availability/strptime_times": lambda: [legacy_availability(row) for row in availability_rows],
+        "availability/from_db": lambda: [DoctorAvailability.from_db(row) for row in availability_rows]
+    }
+
+    results = {}
+    for name, build in cases.items():
+        timings = []
+        for _ in range(repeat):
+            started = timer.perf_counter()
+            build()
+            timings.append(timer.perf_counter() - started)
+
+        tracemalloc.start()
+        objects = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del objects
+
+        results[name] = {
+            "us_per_object": round(percentile(timings, 50) / count * 1e6, 3),
+            "bytes_per_object": round(size / count, 1)
+        }
+    return results
+
+
+def run_export(days: int, repeat: int, seed: int, doctors: int = 50) -> Dict[str, Dict[str, float]]:
+    """
+    Export of every appointment of the last days days to a null file: the
+    streaming NDJSON and CSV encoders against building the list of
+    Appointment.to_dict() dicts first and json.dumps()-ing each
+    """
+    from database_sqlite import db_client
+    from models import Appointment
+    from export import export_appointments
+    import synthetic_data
+
+    synthetic_data.reset()
+    synthetic_data.generate(
+        doctors=doctors,
+        patients=doctors * PATIENTS_PER_DOCTOR,
+        days=1,
+        history_days=days,
+        seed=seed
+    )
+    start = datetime.now() - timedelta(days=days)
+    end = datetime.now() + timedelta(days=1)
+
+    def list_of_dicts(file):
+        rows = db_client.get_appointments_for_doctors(
+            [row['id'] for row in db_client.get_doctors()['data']], start, end
+        )['data']
+        records = [Appointment.from_db(row).to_dict() for row in rows]
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+        return len(records)
+
+    cases = {
+        "export/list_of_dicts": list_of_dicts,
+        "export/ndjson": lambda file: export_appointments(db_client, file, "ndjson", start_date=start, end_date=end),
+        "export/csv": lambda file: export_appointments(db_client, file, "csv", start_date=start, end_date=end)
+    }
+
+    results = {}
+    with open(os.devnull, 'w', newline='') as file:
+        for name, export in cases.items():
+            timings = []
+            for _ in range(repeat):
+                started = timer.perf_counter()
+                rows = export(file)
+                timings.append(timer.perf_counter() - started)
+
+            tracemalloc.start()
+            export(file)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[name] = {
+                "rows": rows,
+                "rows_per_second": round(rows / percentile(timings, 50)),
+                "peak_kib": round(peak / 1024, 1)
+            }
+    return results
+
+
+def run_suite(scenarios, repeat: int, seed: int) -> Dict[str, Dict[str, float]]:
+    from database_sqlite import db_client
+    from migrations import check_query_plans
+
+    for problem in check_query_plans(db_client.conn):
+        print(f"WARNING: {problem}")
+
+    print("Running startup...", flush=True)
+    results = {f"startup/{name}": stats for name, stats in run_startup(repeat).items()}
+    for doctors, days, density in scenarios:
+        name = f"doctors={doctors},days={days},density={density}"
+        print(f"Running {name}...", flush=True)
+        for operation, stats in run_scenario(doctors, days, density, repeat, seed).items():
+            results[f"{name}/{operation}"] = stats
+    return results
+
+
+def print_results(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]] = None,
+                  threshold: float = 1.25) -> List[str]:
+    """Print a results table (with p50 ratios against baseline if given), returns the regressed keys"""
+    regressions = []
+    header = f"{'benchmark':<60} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}"
+    if baseline is not None:
+        header += f" {'vs base':>8}"
+    print(header)
+    print("-" * len(header))
+
+    for key, stats in results.items():
+        line = (f"{key:<60} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                f"{stats['p99_ms']:>9.2f} {stats['queries']:>8.1f}")
+
+        if baseline is not None:
+            base = baseline.get(key)
+            if base is None:
+                line += f" {'new':>8}"
+            else:
+                ratio = stats['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1.0
+                line += f" {ratio:>7.2f}x"
+                if ratio > threshold or stats['queries'] > base['queries']:
+                    line += "  REGRESSION"
+                    regressions.append(key)
+        print(line)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduler benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Small scenario grid")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per operation")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for data and requests")
+    parser.add_argument("--db", type=str, default=DEFAULT_DB, help="Database file to generate data into")
+    parser.add_argument("--baseline", type=str, default=str(DEFAULT_BASELINE), help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare the results with the baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 ratio that counts as a regression")
+    parser.add_argument("--time-storage", choices=["iso", "epoch"], default=None,
+                        help="Appointment time storage to query (default: SCHEDULER_TIME_STORAGE or iso)")
+    parser.add_argument("--models", type=int, metavar="COUNT", default=None,
+                        help="Only run the model construction micro-benchmark over COUNT objects")
+    parser.add_argument("--export", type=int, metavar="DAYS", default=None,
+                        help="Only run the export throughput benchmark over DAYS days of appointments")
+    parser.add_argument("--read-mirror", action="store_true",
+                        help="Serve slot search reads from the in-memory mirror (SCHEDULER_READ_MIRROR)")
+    args = parser.parse_args()
+
+    os.environ["SCHEDULER_DB_PATH"] = args.db
+    if args.time_storage:
+        os.environ["SCHEDULER_TIME_STORAGE"] = args.time_storage
+    if args.read_mirror:
+        os.environ["SCHEDULER_READ_MIRROR"] = "1"
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.models:
+        print(f"{'model benchmark':<45} {'us/object':>10} {'bytes/object':>13}")
+        for name, stats in run_models(args.models, args.repeat).items():
+            print(f"{name:<45} {stats['us_per_object']:>10.3f} {stats['bytes_per_object']:>13.1f}")
+        return
+
+    if args.export:
+        print(f"{'export benchmark':<45} {'rows':>8} {'rows/s':>10} {'peak KiB':>10}")
+        for name, stats in run_export(args.export, args.repeat, args.seed).items():
+            print(f"{name:<45} {stats['rows']:>8} {stats['rows_per_second']:>10} {stats['peak_kib']:>10.1f}")
+        return
+
+    grid = "quick" if args.quick else "full"
+    results = run_suite(SCENARIOS[grid], args.repeat, args.seed)
+
+    baseline = None
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}, run with --save-baseline first")
+            sys.exit(2)
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)["results"]
+
+    print()
+    regressions = print_results(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({
+                "created_at": datetime.now().isoformat(),
+                "grid": grid,
+                "repeat": args.repeat,
+                "python": platform.python_version(),
+                "results": results
+            }, file, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,27 @@ except Exception as e:
     print(f"Error loading Google credentials: {str(e)}")
     GOOGLE_CREDENTIALS = None
 
+# SQLite database file, defaults to scheduler.db next to the code
+DATABASE_PATH = os.environ.get("SCHEDULER_DB_PATH", str(BASE_DIR / "scheduler.db"))
+SQLITE_JOURNAL_MODE = "WAL"  # Readers keep reading while a booking is written
+SQLITE_SYNCHRONOUS = "NORMAL"  # Safe with WAL, fsyncs at checkpoints instead of every commit
+SQLITE_CACHE_SIZE_KB = 16000  # Page cache per connection
+SQLITE_BUSY_TIMEOUT_MS = 5000  # How long a writer waits for the lock before failing
+BULK_INSERT_CHUNK_SIZE = 5000  # Rows per transaction in the create_*_bulk methods (None = one transaction)
+SQLITE_ASYNC_WORKERS = 8  # Threads (each with its own connection) behind the async database client
+SQLITE_STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection (sqlite3 default 128)
+QUERY_SQL_CACHE_SIZE = 512  # TableQuery SQL strings cached by query shape
+LIST_PAGE_SIZE = 100  # Rows per page for listings
+FETCH_BATCH_SIZE = 500  # Rows per fetchmany() call in the iter_* methods
+TIME_PARSE_CACHE_SIZE = 4096  # Distinct time and date strings kept parsed (see timeparse.py)
+DATETIME_PARSE_CACHE_SIZE = 16384  # Distinct datetime strings kept parsed
+# Appointment range queries: "iso" compares the ISO text columns, "epoch" the integer
+# start_minute/end_minute columns (minutes since 1970-01-01 UTC, see epoch_time.py)
+APPOINTMENT_TIME_STORAGE = os.environ.get("SCHEDULER_TIME_STORAGE", "iso")
+# Serve slot search reads (doctors, availability, appointments of the next LOOKAHEAD_DAYS)
+# from an in-memory copy of the database, see read_mirror.py
+SQLITE_READ_MIRROR = os.environ.get("SCHEDULER_READ_MIRROR", "0") == "1"
+
 # Scheduling parameters
 DEFAULT_APPOINTMENT_DURATION = timedelta(minutes=30)
 WORKING_HOURS_START = 9  # 9 AM
@@ -36,6 +57,14 @@ LOOKAHEAD_DAYS = 30  # Schedule appointments up to 30 days in advance
 OPTIMIZATION_WEIGHT_DOCTOR_LOAD = 0.3
 OPTIMIZATION_WEIGHT_TIME_PREFERENCE = 0.2
 OPTIMIZATION_WEIGHT_URGENCY = 0.5
+PATIENT_PREFERENCE_PRIOR = 5  # Booked appointments after which a patient's history counts for half of the time preference score
+SLOT_INTERVAL_MINUTES = 15  # Step between candidate slot start times
+SLOT_SEARCH_ENGINE = "vectorized"  # "vectorized" (NumPy occupancy arrays) or "python" (reference loop)
+SLOT_SEARCH_WORKERS = int(os.environ.get("SLOT_SEARCH_WORKERS", 4))  # Workers for multi-doctor slot search (1 = serial)
+SLOT_SEARCH_EXECUTOR = os.environ.get("SLOT_SEARCH_EXECUTOR", "thread")  # "thread" or "process" worker pool
+PARALLEL_SEARCH_MIN_DOCTORS = 16  # Searches over fewer doctors always run serially
+BATCH_CANDIDATES_PER_REQUEST = 6  # Candidate slots per waitlist request in schedule_batch
+FREE_SLOT_CACHE_SIZE = 5000  # Doctor-days of computed free time kept in memory (0 disables the cache)
 
 # Appointment types and their durations (in minutes)
 APPOINTMENT_TYPES = {
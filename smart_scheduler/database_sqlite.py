@@ -1,35 +1,559 @@
+import asyncio
+import functools
 import sqlite3
 import os
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
+from config import (
+    DATABASE_PATH,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_ASYNC_WORKERS,
+    BULK_INSERT_CHUNK_SIZE,
+    APPOINTMENT_TIME_STORAGE,
+    SQLITE_STATEMENT_CACHE_SIZE,
+    QUERY_SQL_CACHE_SIZE,
+    LIST_PAGE_SIZE,
+    FETCH_BATCH_SIZE,
+    SQLITE_READ_MIRROR
+)
+from epoch_time import to_epoch_minutes, from_epoch_minutes
+from timeparse import parse_datetime
+from models import Doctor, Patient, Appointment, DoctorAvailability
+from appointment_batch import AppointmentBatch
+from migrations import run_migrations, SUPPORTS_GENERATED_COLUMNS
+from slot_cache import free_slot_cache
+from availability_template import availability_templates
+from read_mirror import ReadMirror
+
 logger = logging.getLogger(__name__)
 
+# Stay well below SQLite's host parameter limit for "IN (...)" lists
+MAX_IN_CLAUSE_PARAMS = 500
+
+# INSERT/UPDATE ... RETURNING needs SQLite 3.35, older libraries re-select the row
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Appointment columns whose change frees or takes up a doctor's time
+FREE_TIME_COLUMNS = frozenset({'doctor_id', 'start_time', 'end_time', 'status'})
+
+# "iso" queries appointments by the ISO text columns, "epoch" by start_minute/end_minute
+APPOINTMENT_TIME_STORAGES = ("iso", "epoch")
+
+
+def _chunked(values, size=MAX_IN_CLAUSE_PARAMS):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _encode_patient_json(data):
+    """Serialize the JSON fields of a patient row"""
+    if 'appointment_history' in data:
+        raise ValueError("Patient appointment history is read from the appointments table and can't be written")
+    if 'medical_history' in data and isinstance(data['medical_history'], dict):
+        data['medical_history'] = json.dumps(data['medical_history'])
+    return data
+
+
+def _encode_row(table_name, data):
+    """
+    Row dict as written to table_name: appointment times (datetimes or strings)
+    are normalized to isoformat() text, so that range queries can compare them
+    as strings ("YYYY-MM-DD HH:MM:SS" would sort wrongly against "YYYY-MM-DDTHH:MM")
+    """
+    if table_name != "appointments":
+        return data
+
+    data = dict(data)
+    for column in ('start_time', 'end_time'):
+        if data.get(column) is not None:
+            data[column] = parse_datetime(data[column]).isoformat()
+    return data
+
 
 class SQLiteClient:
+    """
+    Process-wide database client
+
+    Every thread gets its own connection and cursor (opened on first use through
+    the conn and cursor properties), so concurrent callers never share a result
+    set. Connections run in WAL mode, where readers are not blocked by a writer,
+    and wait up to SQLITE_BUSY_TIMEOUT_MS for a competing write lock.
+
+    Creating the client does no I/O: the database file is opened, and its schema
+    created and migrated, by the first query of the process. A forked child
+    drops the connections inherited from its parent and opens its own.
+
+    Write methods commit straight away, unless they run inside a
+    "with db.transaction():" block, which commits all of them at once.
+
+    Appointment times are stored as ISO text, with the start_minute/end_minute
+    epoch-minute columns generated from it by SQLite. With
+    APPOINTMENT_TIME_STORAGE = "epoch" range queries compare the indexed integer
+    columns and returned rows carry start_time/end_time as datetimes built from
+    them, so nothing is parsed on the way out.
+
+    With SQLITE_READ_MIRROR the reads slot search makes (doctors, availability
+    and appointments within the lookahead window) are answered from an
+    in-memory ReadMirror outside of transactions. Writes go to the file first
+    and are copied into the mirror once committed.
+    """
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
+            instance = super().__new__(cls)
+            # Create database file in the project directory (or at SCHEDULER_DB_PATH)
+            instance.db_path = str(Path(DATABASE_PATH))
+            if APPOINTMENT_TIME_STORAGE not in APPOINTMENT_TIME_STORAGES:
+                raise ValueError(f"Invalid appointment time storage: {APPOINTMENT_TIME_STORAGE}")
+            if APPOINTMENT_TIME_STORAGE == "epoch" and not SUPPORTS_GENERATED_COLUMNS:
+                raise ValueError(f"Epoch appointment time storage needs SQLite 3.31, have {sqlite3.sqlite_version}")
+            instance.time_storage = APPOINTMENT_TIME_STORAGE
+            instance._trace_callback = None
+            instance._schema_ready = False
+            instance._inherited_connections = []
+            instance._reset_connections()
+            instance.read_mirror = ReadMirror() if SQLITE_READ_MIRROR else None
+            instance.connected = False
+
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=instance._after_fork)
+            cls._instance = instance
+        return cls._instance
+
+    def _reset_connections(self):
+        self._local = threading.local()
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+
+    def _after_fork(self):
+        """
+        Forget the parent's connections in a forked child, which opens its own on
+        first use. They are kept referenced rather than closed, since SQLite
+        connections must not be touched, not even closed, across a fork.
+        """
+        self._inherited_connections.extend(conn for _, conn in self._connections.values())
+        self._reset_connections()
+        if self.read_mirror is not None:
+            self.read_mirror = ReadMirror(self.read_mirror.lookahead_days)
+
+    def _ensure_schema(self):
+        """Create the tables if they don't exist, then bring the schema up to date (once per process)"""
+        with self._schema_lock:
+            if self._schema_ready:
+                return
             try:
-                # Create database file in the project directory
-                db_path = Path(__file__).resolve().parent / "scheduler.db"
-                cls._instance.conn = sqlite3.connect(str(db_path))
-                cls._instance.conn.row_factory = sqlite3.Row
-                cls._instance.cursor = cls._instance.conn.cursor()
-
-                # Create tables if they don't exist
-                cls._instance._create_tables()
-                cls._instance.connected = True
-                logger.info(f"Connected to SQLite database at {db_path}")
+                self._create_tables()
+                run_migrations(self.conn)
             except Exception as e:
-                cls._instance.connected = False
+                # Drop the connection so the next use tries again
+                self.close()
                 logger.error(f"Failed to connect to SQLite database: {str(e)}")
                 raise
-        return cls._instance
+            self._schema_ready = True
+            self.connected = True
+            logger.info(f"Connected to SQLite database at {self.db_path}")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """This thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+        return conn
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """This thread's cursor"""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            self._connect()
+            cursor = self._local.cursor
+        return cursor
+
+    def _connect(self) -> sqlite3.Connection:
+        # Only the owning thread uses the connection, other threads merely close it once the owner has exited
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        conn.set_trace_callback(self._trace_callback)
+
+        self._local.conn = conn
+        self._local.cursor = conn.cursor()
+
+        with self._connections_lock:
+            # Close connections left behind by threads that have exited
+            for thread, thread_conn in list(self._connections.values()):
+                if not thread.is_alive():
+                    thread_conn.close()
+                    del self._connections[thread.ident]
+            current = threading.current_thread()
+            self._connections[current.ident] = (current, conn)
+
+        if not self._schema_ready:
+            self._ensure_schema()
+        return conn
+
+    def set_trace_callback(self, callback):
+        """Install a sqlite3 trace callback on every thread's connection (None removes it)"""
+        with self._connections_lock:
+            self._trace_callback = callback
+            for _, conn in self._connections.values():
+                conn.set_trace_callback(callback)
+
+    def close(self):
+        """Close this thread's connection (a new one is opened on next use)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+
+        conn.close()
+        self._local.conn = None
+        self._local.cursor = None
+        self._local.transaction_depth = 0
+        self._local.after_commit = []
+        with self._connections_lock:
+            self._connections.pop(threading.get_ident(), None)
+
+    @property
+    def in_transaction(self) -> bool:
+        """Whether this thread is inside a transaction() block"""
+        return getattr(self._local, 'transaction_depth', 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        """
+        Unit of work for this thread's connection
+
+        Writes made inside the block are committed once when it exits, or rolled
+        back together if it raises. The write lock is taken when the block starts
+        (BEGIN IMMEDIATE), so reads inside it see no concurrent changes. A nested
+        block runs as a savepoint of the enclosing one; if it rolls back, the
+        after_commit() callbacks it registered are dropped with its writes.
+        """
+        local = self._local
+        depth = getattr(local, 'transaction_depth', 0)
+        conn = self.conn
+
+        if depth:
+            savepoint = f"sp_{depth}"
+            conn.execute(f"SAVEPOINT {savepoint}")
+            local.transaction_depth = depth + 1
+            pending = len(local.after_commit)
+            try:
+                yield self
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                del local.after_commit[pending:]
+                raise
+            finally:
+                conn.execute(f"RELEASE {savepoint}")
+                local.transaction_depth = depth
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        local.transaction_depth = 1
+        local.after_commit = []
+        try:
+            yield self
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            callbacks = local.after_commit
+            local.transaction_depth = 0
+            local.after_commit = []
+
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        """Run callback once this thread's writes are committed (right away outside a transaction)"""
+        if self.in_transaction:
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    def _commit(self):
+        # Inside transaction() the block commits once at its end
+        if not self.in_transaction:
+            self.conn.commit()
+
+    def _mirror_for(self, table_name, start_date=None, end_date=None):
+        """
+        The read mirror if it can answer a read of table_name (appointments:
+        overlapping [start_date, end_date)), else None. Reads inside a
+        transaction must see its uncommitted writes and always use the file.
+        """
+        mirror = self.read_mirror
+        if mirror is None or self.in_transaction:
+            return None
+        if mirror.covers(self.conn, table_name, start_date, end_date):
+            return mirror
+        return None
+
+    def _fetchall(self, query, params=(), mirror=None):
+        if mirror is not None:
+            return mirror.fetchall(query, params)
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    def _sync_mirror(self, table_name, condition, params=()):
+        """Copy the rows of table_name matching condition into the read mirror once they are committed"""
+        if self.read_mirror is not None:
+            self.after_commit(functools.partial(self._apply_to_mirror, table_name, condition, list(params)))
+
+    def _apply_to_mirror(self, table_name, condition, params):
+        mirror = self.read_mirror
+        if mirror is not None:
+            mirror.apply(self.conn, table_name, condition, params)
+
+    def refresh_read_mirror(self):
+        """Reload the read mirror on next use, after writes that bypassed the client (raw SQL, other processes)"""
+        if self.read_mirror is not None:
+            self.read_mirror.clear()
+
+    def _decode_rows(self, table_name, rows):
+        """Row dicts, with appointment times taken from the minute columns in epoch mode"""
+        rows = [dict(row) for row in rows]
+        if table_name == "appointments" and self.time_storage == "epoch":
+            for row in rows:
+                if row.get('start_minute') is not None:
+                    row['start_time'] = from_epoch_minutes(row['start_minute'])
+                if row.get('end_minute') is not None:
+                    row['end_time'] = from_epoch_minutes(row['end_minute'])
+        return rows
+
+    def _appointment_overlap(self, start_date, end_date):
+        """WHERE conditions and parameters for appointments overlapping [start_date, end_date)"""
+        conditions = []
+        params = []
+
+        if self.time_storage == "epoch":
+            if start_date:
+                conditions.append("end_minute > ?")
+                params.append(to_epoch_minutes(start_date))
+            if end_date:
+                conditions.append("start_minute < ?")
+                params.append(to_epoch_minutes(end_date, round_up=True))
+        else:
+            if start_date:
+                conditions.append("end_time > ?")
+                params.append(start_date.isoformat())
+            if end_date:
+                conditions.append("start_time < ?")
+                params.append(end_date.isoformat())
+
+        return ''.join(f" AND {condition}" for condition in conditions), params
+
+    def _model_columns(self, model):
+        """SELECT list for model.from_row, appointment times from the minute columns in epoch mode"""
+        columns = model.COLUMNS
+        if model is Appointment and self.time_storage == "epoch":
+            columns = tuple(
+                {'start_time': 'start_minute', 'end_time': 'end_minute'}.get(column, column) for column in columns
+            )
+        return ', '.join(columns)
+
+    def _iter_rows(self, query, params=(), batch_size=FETCH_BATCH_SIZE, mirror=None):
+        """
+        Stream plain tuples with fetchmany, batch_size rows at a time
+
+        Uses its own cursor without a row factory, so callers may run other
+        queries between rows and no sqlite3.Row or dict is built per row.
+        The read mirror, if given, is queried in one go instead.
+        """
+        if mirror is not None:
+            yield from mirror.fetchall(query, params, row_factory=None)
+            return
+
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
+    def _iter_models(self, model, query_tail, params=(), batch_size=FETCH_BATCH_SIZE, mirror=None):
+        from_row = model.from_row
+        query = f"SELECT {self._model_columns(model)} {query_tail}"
+        for row in self._iter_rows(query, params, batch_size, mirror):
+            yield from_row(row)
+
+    def iter_doctors(self, batch_size=FETCH_BATCH_SIZE):
+        """Active doctors as Doctor objects, streamed"""
+        return self._iter_models(Doctor, "FROM doctors WHERE active = 1", (), batch_size, self._mirror_for("doctors"))
+
+    def iter_patients(self, batch_size=FETCH_BATCH_SIZE):
+        """Active patients as Patient objects, streamed"""
+        return self._iter_models(Patient, "FROM patients WHERE active = 1", (), batch_size)
+
+    def iter_availability(self, doctor_ids=None, batch_size=FETCH_BATCH_SIZE):
+        """Availability rows as DoctorAvailability objects in id order, streamed (all doctors by default)"""
+        mirror = self._mirror_for("doctor_availability")
+        if doctor_ids is None:
+            yield from self._iter_models(DoctorAvailability, "FROM doctor_availability ORDER BY id", (), batch_size,
+                                         mirror)
+            return
+
+        for chunk in _chunked(doctor_ids):
+            placeholders = ', '.join(['?' for _ in chunk])
+            yield from self._iter_models(
+                DoctorAvailability, f"FROM doctor_availability WHERE doctor_id IN ({placeholders}) ORDER BY id",
+                chunk, batch_size, mirror
+            )
+
+    def iter_appointments(self, doctor_ids=None, start_date=None, end_date=None, patient_id=None,
+                          batch_size=FETCH_BATCH_SIZE):
+        """
+        Appointments as Appointment objects, streamed in no particular order
+
+        Filters are optional: doctor_ids, overlap with [start_date, end_date) as
+        in get_doctor_appointments, and patient_id.
+        """
+        overlap, overlap_params = self._appointment_overlap(start_date, end_date)
+        if patient_id is not None:
+            overlap += " AND patient_id = ?"
+            overlap_params.append(patient_id)
+        mirror = self._mirror_for("appointments", start_date, end_date)
+
+        if doctor_ids is None:
+            yield from self._iter_models(Appointment, f"FROM appointments WHERE 1 = 1{overlap}", overlap_params,
+                                         batch_size, mirror)
+            return
+
+        for chunk in _chunked(doctor_ids):
+            placeholders = ', '.join(['?' for _ in chunk])
+            yield from self._iter_models(
+                Appointment, f"FROM appointments WHERE doctor_id IN ({placeholders}){overlap}",
+                list(chunk) + overlap_params, batch_size, mirror
+            )
+
+    def iter_appointment_records(self, doctor_ids=None, start_date=None, end_date=None, patient_id=None,
+                                 batch_size=FETCH_BATCH_SIZE):
+        """
+        Appointments as plain (id, doctor_id, patient_id, start_time, end_time,
+        appointment_type, urgency_level, status) tuples with the stored ISO time
+        text, for exports. Same optional filters as iter_appointments.
+
+        Streamed from the database file (never the read mirror, which fetches
+        everything at once) in doctor then start time order, or start time
+        order for one patient across all doctors.
+        """
+        select = ("SELECT id, doctor_id, patient_id, start_time, end_time, appointment_type, urgency_level, status "
+                  "FROM appointments")
+        overlap, overlap_params = self._appointment_overlap(start_date, end_date)
+        if patient_id is not None:
+            overlap += " AND patient_id = ?"
+            overlap_params.append(patient_id)
+
+        if doctor_ids is None:
+            order = "start_time, id" if patient_id is not None else "doctor_id, start_time, id"
+            yield from self._iter_rows(f"{select} WHERE 1 = 1{overlap} ORDER BY {order}", overlap_params, batch_size)
+            return
+
+        for chunk in _chunked(sorted(set(doctor_ids))):
+            placeholders = ', '.join(['?' for _ in chunk])
+            yield from self._iter_rows(
+                f"{select} WHERE doctor_id IN ({placeholders}){overlap} ORDER BY doctor_id, start_time, id",
+                list(chunk) + overlap_params, batch_size
+            )
+
+    def get_appointment_batch(self, doctor_ids=None, start_date=None, end_date=None, patient_id=None):
+        """
+        Appointments as an AppointmentBatch, with the same optional filters as
+        iter_appointments. Times are read as epoch seconds computed by SQLite
+        (from the minute columns in epoch mode), so no row is parsed in Python.
+        """
+        if self.time_storage == "epoch":
+            times = "start_minute * 60, end_minute * 60"
+        else:
+            times = "CAST(strftime('%s', start_time) AS INTEGER), CAST(strftime('%s', end_time) AS INTEGER)"
+        select = (f"SELECT id, doctor_id, patient_id, {times}, appointment_type, urgency_level, status "
+                  f"FROM appointments")
+
+        overlap, overlap_params = self._appointment_overlap(start_date, end_date)
+        if patient_id is not None:
+            overlap += " AND patient_id = ?"
+            overlap_params.append(patient_id)
+        mirror = self._mirror_for("appointments", start_date, end_date)
+
+        if doctor_ids is None:
+            return AppointmentBatch.from_rows(self._iter_rows(f"{select} WHERE 1 = 1{overlap}", overlap_params,
+                                                              mirror=mirror))
+
+        rows = []
+        for chunk in _chunked(doctor_ids):
+            placeholders = ', '.join(['?' for _ in chunk])
+            rows.extend(self._iter_rows(f"{select} WHERE doctor_id IN ({placeholders}){overlap}",
+                                        list(chunk) + overlap_params, mirror=mirror))
+        return AppointmentBatch.from_rows(rows)
+
+    def _insert_returning(self, table_name, data):
+        """Insert one row and return it as stored (defaults filled in)"""
+        data = _encode_row(table_name, data)
+        columns = ', '.join(data.keys())
+        placeholders = ', '.join(['?' for _ in data])
+        query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+
+        if SUPPORTS_RETURNING:
+            self.cursor.execute(query + " RETURNING *", list(data.values()))
+            rows = self.cursor.fetchall()
+        else:
+            self.cursor.execute(query, list(data.values()))
+            self.cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (self.cursor.lastrowid,))
+            rows = self.cursor.fetchall()
+        self._commit()
+        if rows:
+            self._sync_mirror(table_name, "id = ?", (rows[0]['id'],))
+
+        return {"data": self._decode_rows(table_name, rows)}
+
+    def _update_returning(self, table_name, item_id, data):
+        """Update one row by id and return it as stored (no data if there is no such row)"""
+        data = _encode_row(table_name, data)
+        set_clause = ', '.join([f"{k} = ?" for k in data.keys()])
+        query = f"UPDATE {table_name} SET {set_clause} WHERE id = ?"
+
+        values = list(data.values())
+        values.append(item_id)
+
+        if SUPPORTS_RETURNING:
+            self.cursor.execute(query + " RETURNING *", values)
+            rows = self.cursor.fetchall()
+        else:
+            self.cursor.execute(query, values)
+            self.cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (item_id,))
+            rows = self.cursor.fetchall()
+        self._commit()
+        self._sync_mirror(table_name, "id = ?", (item_id,))
+
+        return {"data": self._decode_rows(table_name, rows)}
 
     def _create_tables(self):
         # Create doctors table
@@ -54,7 +578,6 @@ class SQLiteClient:
             phone TEXT,
             date_of_birth TEXT,
             medical_history TEXT,
-            appointment_history TEXT,
             active INTEGER DEFAULT 1,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP
         )
@@ -94,6 +617,17 @@ class SQLiteClient:
         )
         ''')
 
+        # Create patient_time_preferences table (hour-of-day and weekday histograms of booked appointments)
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS patient_time_preferences (
+            patient_id INTEGER PRIMARY KEY,
+            hour_counts TEXT NOT NULL,
+            weekday_counts TEXT NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (patient_id) REFERENCES patients (id)
+        )
+        ''')
+
         self.conn.commit()
 
     def get_client(self):
@@ -103,15 +637,23 @@ class SQLiteClient:
         return TableQuery(self, table_name)
 
     def get_doctors(self):
-        self.cursor.execute("SELECT * FROM doctors WHERE active = 1")
-        rows = self.cursor.fetchall()
+        rows = self._fetchall("SELECT * FROM doctors WHERE active = 1", (), self._mirror_for("doctors"))
+        return {"data": [dict(row) for row in rows]}
+
+    def get_doctors_by_ids(self, doctor_ids):
+        mirror = self._mirror_for("doctors")
+        rows = []
+        for chunk in _chunked(doctor_ids):
+            placeholders = ', '.join(['?' for _ in chunk])
+            rows.extend(self._fetchall(f"SELECT * FROM doctors WHERE id IN ({placeholders}) AND active = 1", chunk,
+                                       mirror))
         return {"data": [dict(row) for row in rows]}
 
     def get_doctor(self, doctor_id):
-        self.cursor.execute("SELECT * FROM doctors WHERE id = ? AND active = 1", (doctor_id,))
-        row = self.cursor.fetchone()
-        if row:
-            return {"data": [dict(row)]}
+        rows = self._fetchall("SELECT * FROM doctors WHERE id = ? AND active = 1", (doctor_id,),
+                              self._mirror_for("doctors"))
+        if rows:
+            return {"data": [dict(rows[0])]}
         return {"data": []}
 
     def create_doctor(self, data):
@@ -120,9 +662,10 @@ class SQLiteClient:
         query = f"INSERT INTO doctors ({columns}) VALUES ({placeholders})"
 
         self.cursor.execute(query, list(data.values()))
-        self.conn.commit()
+        self._commit()
 
         doctor_id = self.cursor.lastrowid
+        self._sync_mirror("doctors", "id = ?", (doctor_id,))
         return self.get_doctor(doctor_id)
 
     def update_doctor(self, doctor_id, data):
@@ -133,14 +676,14 @@ class SQLiteClient:
         values.append(doctor_id)
 
         self.cursor.execute(query, values)
-        self.conn.commit()
+        self._commit()
+        self._sync_mirror("doctors", "id = ?", (doctor_id,))
 
         return self.get_doctor(doctor_id)
 
-    def get_patients(self):
-        self.cursor.execute("SELECT * FROM patients WHERE active = 1")
-        rows = self.cursor.fetchall()
-        return {"data": [dict(row) for row in rows]}
+    def get_patients(self, limit=None, after_id=None):
+        """Active patients, all of them or one keyset page (limit rows with id > after_id)"""
+        return self.table("patients").eq("active", 1).after(after_id).limit(limit).execute()
 
     def get_patient(self, patient_id):
         self.cursor.execute("SELECT * FROM patients WHERE id = ? AND active = 1", (patient_id,))
@@ -151,27 +694,21 @@ class SQLiteClient:
 
     def create_patient(self, data):
         # Handle JSON fields
-        if 'medical_history' in data and isinstance(data['medical_history'], dict):
-            data['medical_history'] = json.dumps(data['medical_history'])
-        if 'appointment_history' in data and isinstance(data['appointment_history'], list):
-            data['appointment_history'] = json.dumps(data['appointment_history'])
+        _encode_patient_json(data)
 
         columns = ', '.join(data.keys())
         placeholders = ', '.join(['?' for _ in data])
         query = f"INSERT INTO patients ({columns}) VALUES ({placeholders})"
 
         self.cursor.execute(query, list(data.values()))
-        self.conn.commit()
+        self._commit()
 
         patient_id = self.cursor.lastrowid
         return self.get_patient(patient_id)
 
     def update_patient(self, patient_id, data):
         # Handle JSON fields
-        if 'medical_history' in data and isinstance(data['medical_history'], dict):
-            data['medical_history'] = json.dumps(data['medical_history'])
-        if 'appointment_history' in data and isinstance(data['appointment_history'], list):
-            data['appointment_history'] = json.dumps(data['appointment_history'])
+        _encode_patient_json(data)
 
         set_clause = ', '.join([f"{k} = ?" for k in data.keys()])
         query = f"UPDATE patients SET {set_clause} WHERE id = ?"
@@ -180,104 +717,274 @@ class SQLiteClient:
         values.append(patient_id)
 
         self.cursor.execute(query, values)
-        self.conn.commit()
+        self._commit()
 
         return self.get_patient(patient_id)
 
-    def get_appointments(self):
-        self.cursor.execute("SELECT * FROM appointments")
-        rows = self.cursor.fetchall()
-        return {"data": [dict(row) for row in rows]}
-
-    def get_doctor_appointments(self, doctor_id, start_date=None, end_date=None):
-        query = "SELECT * FROM appointments WHERE doctor_id = ?"
-        params = [doctor_id]
-
-        if start_date:
-            query += " AND start_time >= ?"
-            params.append(start_date.isoformat())
-        if end_date:
-            query += " AND end_time <= ?"
-            params.append(end_date.isoformat())
-
-        self.cursor.execute(query, params)
-        rows = self.cursor.fetchall()
-        return {"data": [dict(row) for row in rows]}
+    def get_appointments(self, limit=None, after_id=None):
+        """All appointments, or one keyset page (limit rows with id > after_id)"""
+        return self.table("appointments").after(after_id).limit(limit).execute()
+
+    def get_doctor_appointments(self, doctor_id, start_date=None, end_date=None, limit=None, offset=0):
+        """
+        A doctor's appointments overlapping [start_date, end_date), either bound
+        optional. With limit, one page of them in start time order.
+        """
+        overlap, overlap_params = self._appointment_overlap(start_date, end_date)
+        query = f"SELECT * FROM appointments WHERE doctor_id = ?{overlap}"
+        params = [doctor_id] + overlap_params
+
+        if limit is not None:
+            query += " ORDER BY start_time, id LIMIT ? OFFSET ?"
+            params += [limit, offset]
+
+        rows = self._fetchall(query, params, self._mirror_for("appointments", start_date, end_date))
+        return {"data": self._decode_rows("appointments", rows)}
+
+    def get_appointments_for_doctors(self, doctor_ids, start_date=None, end_date=None):
+        overlap, overlap_params = self._appointment_overlap(start_date, end_date)
+        mirror = self._mirror_for("appointments", start_date, end_date)
+
+        rows = []
+        for chunk in _chunked(doctor_ids):
+            placeholders = ', '.join(['?' for _ in chunk])
+            rows.extend(self._fetchall(
+                f"SELECT * FROM appointments WHERE doctor_id IN ({placeholders}){overlap}", list(chunk) + overlap_params,
+                mirror
+            ))
+        return {"data": self._decode_rows("appointments", rows)}
 
     def get_patient_appointments(self, patient_id):
-        self.cursor.execute("SELECT * FROM appointments WHERE patient_id = ?", (patient_id,))
+        """The patient's appointment history (all appointments) in start time order"""
+        self.cursor.execute("SELECT * FROM appointments WHERE patient_id = ? ORDER BY start_time, id", (patient_id,))
         rows = self.cursor.fetchall()
-        return {"data": [dict(row) for row in rows]}
+        return {"data": self._decode_rows("appointments", rows)}
+
+    # Appointment writes invalidate the cached free time of the doctors involved
+    # once committed, whoever makes them
+
+    def _appointment_doctor_id(self, appointment_id):
+        row = self.cursor.execute("SELECT doctor_id FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+        return row['doctor_id'] if row else None
 
     def create_appointment(self, data):
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO appointments ({columns}) VALUES ({placeholders})"
+        result = self._insert_returning("appointments", data)
+        self.after_commit(functools.partial(self._invalidate_free_slots, [row['doctor_id'] for row in result['data']]))
+        return result
 
-        self.cursor.execute(query, list(data.values()))
-        self.conn.commit()
+    def update_appointment(self, appointment_id, data):
+        if not FREE_TIME_COLUMNS.intersection(data):
+            return self._update_returning("appointments", appointment_id, data)
 
-        appointment_id = self.cursor.lastrowid
+        # Both the doctor it was booked with and the one it is booked with now
+        doctor_ids = [self._appointment_doctor_id(appointment_id)]
+        result = self._update_returning("appointments", appointment_id, data)
+        doctor_ids.extend(row['doctor_id'] for row in result['data'])
+        self.after_commit(functools.partial(self._invalidate_free_slots, doctor_ids))
+        return result
 
-        self.cursor.execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,))
-        row = self.cursor.fetchone()
-        if row:
-            return {"data": [dict(row)]}
+    def delete_appointment(self, appointment_id):
+        doctor_id = self._appointment_doctor_id(appointment_id)
+        self.cursor.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
+        self._commit()
+        self._sync_mirror("appointments", "id = ?", (appointment_id,))
+        self.after_commit(functools.partial(self._invalidate_free_slots, [doctor_id]))
         return {"data": []}
 
-    def update_appointment(self, appointment_id, data):
-        set_clause = ', '.join([f"{k} = ?" for k in data.keys()])
-        query = f"UPDATE appointments SET {set_clause} WHERE id = ?"
-
-        values = list(data.values())
-        values.append(appointment_id)
+    def get_doctor_availability(self, doctor_id):
+        rows = self._fetchall("SELECT * FROM doctor_availability WHERE doctor_id = ?", (doctor_id,),
+                              self._mirror_for("doctor_availability"))
+        return {"data": [dict(row) for row in rows]}
 
-        self.cursor.execute(query, values)
-        self.conn.commit()
+    def get_availability_for_doctors(self, doctor_ids):
+        mirror = self._mirror_for("doctor_availability")
+        rows = []
+        for chunk in _chunked(doctor_ids):
+            placeholders = ', '.join(['?' for _ in chunk])
+            rows.extend(self._fetchall(
+                f"SELECT * FROM doctor_availability WHERE doctor_id IN ({placeholders}) ORDER BY id", chunk, mirror
+            ))
+        return {"data": [dict(row) for row in rows]}
 
-        self.cursor.execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,))
+    def create_doctor_availability(self, data):
+        result = self._insert_returning("doctor_availability", data)
+        self.after_commit(functools.partial(self._invalidate_availability, [data.get('doctor_id')]))
+        return result
+
+    def _invalidate_availability(self, doctor_ids):
+        for doctor_id in set(doctor_ids):
+            availability_templates.invalidate_doctor(doctor_id)
+            free_slot_cache.invalidate_doctor(doctor_id)
+
+    def _invalidate_free_slots(self, doctor_ids):
+        for doctor_id in set(doctor_ids):
+            if doctor_id is not None:
+                free_slot_cache.invalidate_doctor(doctor_id)
+
+    def create_patients_bulk(self, rows, chunk_size=BULK_INSERT_CHUNK_SIZE, return_rows=True):
+        return self._insert_many("patients", [_encode_patient_json(dict(row)) for row in rows], chunk_size, return_rows)
+
+    def create_appointments_bulk(self, rows, chunk_size=BULK_INSERT_CHUNK_SIZE, return_rows=True):
+        """
+        Insert many appointments at once (see _insert_many)
+
+        Cached free time of the doctors involved is invalidated. Patient time
+        preferences are not updated row by row, rebuild them after a large import.
+        """
+        result = self._insert_many("appointments", rows, chunk_size, return_rows)
+        self.after_commit(functools.partial(self._invalidate_free_slots, [row.get('doctor_id') for row in rows]))
+        return result
+
+    def create_doctor_availability_bulk(self, rows, chunk_size=BULK_INSERT_CHUNK_SIZE, return_rows=True):
+        result = self._insert_many("doctor_availability", rows, chunk_size, return_rows)
+        self.after_commit(functools.partial(self._invalidate_availability, [row.get('doctor_id') for row in rows]))
+        return result
+
+    def _insert_many(self, table_name, rows, chunk_size=BULK_INSERT_CHUNK_SIZE, return_rows=True):
+        """
+        Insert rows (dicts) with executemany
+
+        Every chunk of chunk_size rows is written in one transaction (all rows in
+        a single transaction if chunk_size is None), so a failure rolls back the
+        whole chunk. Inside transaction() the chunks are savepoints and nothing is
+        committed before the block ends. Consecutive rows with the same keys share
+        one statement.
+        With return_rows the inserted rows are read back in insertion order,
+        otherwise only {"data": [], "count": n} is returned.
+        """
+        rows = [_encode_row(table_name, row) for row in rows]
+        inserted = []
+
+        for chunk in _chunked(rows, chunk_size or max(len(rows), 1)):
+            # The transaction holds the write lock from the start, so the ids handed
+            # out in it are exactly the ones after the current maximum
+            with self.transaction():
+                self.cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table_name}")
+                last_id = self.cursor.fetchone()[0]
+
+                start = 0
+                while start < len(chunk):
+                    keys = tuple(chunk[start].keys())
+                    end = start + 1
+                    while end < len(chunk) and tuple(chunk[end].keys()) == keys:
+                        end += 1
+
+                    columns = ', '.join(keys)
+                    placeholders = ', '.join(['?' for _ in keys])
+                    self.cursor.executemany(
+                        f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
+                        [tuple(row[key] for key in keys) for row in chunk[start:end]]
+                    )
+                    start = end
+
+                self._sync_mirror(table_name, "id > ?", (last_id,))
+                if return_rows:
+                    self.cursor.execute(f"SELECT * FROM {table_name} WHERE id > ? ORDER BY id", (last_id,))
+                    inserted.extend(self._decode_rows(table_name, self.cursor.fetchall()))
+
+        if return_rows:
+            return {"data": inserted}
+        return {"data": [], "count": len(rows)}
+
+    def get_patient_time_preference(self, patient_id):
+        self.cursor.execute("SELECT * FROM patient_time_preferences WHERE patient_id = ?", (patient_id,))
         row = self.cursor.fetchone()
         if row:
             return {"data": [dict(row)]}
         return {"data": []}
 
-    def delete_appointment(self, appointment_id):
-        self.cursor.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
-        self.conn.commit()
+    def save_patient_time_preference(self, patient_id, hour_counts, weekday_counts):
+        self.cursor.execute(
+            "INSERT INTO patient_time_preferences (patient_id, hour_counts, weekday_counts) VALUES (?, ?, ?) "
+            "ON CONFLICT(patient_id) DO UPDATE SET hour_counts = excluded.hour_counts, "
+            "weekday_counts = excluded.weekday_counts, updated_at = CURRENT_TIMESTAMP",
+            (patient_id, json.dumps(list(hour_counts)), json.dumps(list(weekday_counts)))
+        )
+        self._commit()
         return {"data": []}
 
-    def get_doctor_availability(self, doctor_id):
-        self.cursor.execute("SELECT * FROM doctor_availability WHERE doctor_id = ?", (doctor_id,))
+    def replace_patient_time_preferences(self, preferences):
+        """Replace every stored histogram with (patient_id, hour_counts, weekday_counts) rows"""
+        with self.transaction():
+            self.cursor.execute("DELETE FROM patient_time_preferences")
+            self.cursor.executemany(
+                "INSERT INTO patient_time_preferences (patient_id, hour_counts, weekday_counts) VALUES (?, ?, ?)",
+                [
+                    (patient_id, json.dumps(list(hour_counts)), json.dumps(list(weekday_counts)))
+                    for patient_id, hour_counts, weekday_counts in preferences
+                ]
+            )
+        return {"data": []}
+
+    def get_patient_time_histograms(self, patient_id=None, exclude_statuses=()):
+        """Appointment counts per (patient_id, weekday, hour), weekday 0 = Monday like date.weekday()"""
+        query = (
+            "SELECT patient_id, "
+            "(CAST(strftime('%w', start_time) AS INTEGER) + 6) % 7 AS weekday, "
+            "CAST(strftime('%H', start_time) AS INTEGER) AS hour, "
+            "COUNT(*) AS count "
+            "FROM appointments WHERE 1 = 1"
+        )
+        params = []
+
+        if patient_id is not None:
+            query += " AND patient_id = ?"
+            params.append(patient_id)
+        if exclude_statuses:
+            query += f" AND status NOT IN ({', '.join(['?' for _ in exclude_statuses])})"
+            params.extend(exclude_statuses)
+
+        query += " GROUP BY patient_id, weekday, hour"
+
+        self.cursor.execute(query, params)
         rows = self.cursor.fetchall()
         return {"data": [dict(row) for row in rows]}
 
-    def create_doctor_availability(self, data):
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO doctor_availability ({columns}) VALUES ({placeholders})"
 
-        self.cursor.execute(query, list(data.values()))
-        self.conn.commit()
+@functools.lru_cache(maxsize=QUERY_SQL_CACHE_SIZE)
+def _select_sql(table_name, columns, conditions, order_by, limited, offset):
+    """
+    SELECT statement for one TableQuery shape. Values are always bound as
+    parameters, so repeated shapes hit this cache and then sqlite3's prepared
+    statement cache, which is keyed by the SQL text.
+    """
+    query = f"SELECT {columns} FROM {table_name}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if order_by:
+        query += " ORDER BY " + ", ".join(order_by)
+    if limited:
+        query += " LIMIT ?"
+    if offset:
+        query += " LIMIT -1 OFFSET ?" if not limited else " OFFSET ?"
+    return query
 
-        availability_id = self.cursor.lastrowid
 
-        self.cursor.execute("SELECT * FROM doctor_availability WHERE id = ?", (availability_id,))
-        row = self.cursor.fetchone()
-        if row:
-            return {"data": [dict(row)]}
-        return {"data": []}
+class TableQuery:
+    """
+    Query builder over one table: filters, projection, ordering and paging
 
+        db.table("patients").select(["id", "name"]).eq("active", 1).order_by("name").limit(20).execute()
+
+    after(id) is keyset pagination: rows with a greater id, in id order, so
+    each page is an index seek however deep it is. pages() walks a whole table
+    that way without holding more than one page.
+    """
 
-class TableQuery:
     def __init__(self, client, table_name):
         self.client = client
         self.table_name = table_name
         self.select_cols = "*"
         self.conditions = []
         self.condition_values = []
+        self.order_columns = []
+        self.limit_value = None
+        self.offset_value = None
+        self.after_id = None
 
     def select(self, cols="*"):
-        self.select_cols = cols
+        """Columns to return, as a comma-separated string or a list of names"""
+        self.select_cols = cols if isinstance(cols, str) else ", ".join(cols)
         return self
 
     def eq(self, column, value):
@@ -300,31 +1007,100 @@ class TableQuery:
         self.condition_values.append(value)
         return self
 
-    def execute(self):
-        query = f"SELECT {self.select_cols} FROM {self.table_name}"
+    def order_by(self, column, desc=False):
+        """Sort by column (call again for tie-breakers)"""
+        self.order_columns.append(f"{column} DESC" if desc else column)
+        return self
 
-        if self.conditions:
-            query += " WHERE " + " AND ".join(self.conditions)
+    def limit(self, count):
+        """Return at most count rows (None for no limit)"""
+        self.limit_value = count
+        return self
 
-        self.client.cursor.execute(query, self.condition_values)
-        rows = self.client.cursor.fetchall()
-        return {"data": [dict(row) for row in rows]}
+    def offset(self, count):
+        """Skip the first count rows"""
+        self.offset_value = count or None
+        return self
 
-    def insert(self, data):
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(['?' for _ in data])
-        query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})"
+    def after(self, item_id):
+        """Only rows with id greater than item_id, ordered by id (None for the first page)"""
+        self.after_id = item_id
+        return self
 
-        self.client.cursor.execute(query, list(data.values()))
-        self.client.conn.commit()
+    def _statement(self, columns):
+        conditions = list(self.conditions)
+        values = list(self.condition_values)
+        order_columns = list(self.order_columns)
+
+        if self.after_id is not None:
+            conditions.append("id > ?")
+            values.append(self.after_id)
+        if self.after_id is not None or (self.limit_value is not None and not order_columns):
+            # Pages need a stable order
+            if "id" not in order_columns:
+                order_columns.append("id")
+
+        if self.limit_value is not None:
+            values.append(self.limit_value)
+        if self.offset_value is not None:
+            values.append(self.offset_value)
+
+        query = _select_sql(
+            self.table_name, columns, tuple(conditions), tuple(order_columns),
+            self.limit_value is not None, self.offset_value is not None
+        )
+        return query, values
 
-        item_id = self.client.cursor.lastrowid
+    def execute(self):
+        query, values = self._statement(self.select_cols)
+        self.client.cursor.execute(query, values)
+        rows = self.client.cursor.fetchall()
+        return {"data": self.client._decode_rows(self.table_name, rows)}
+
+    def iter(self, model=None, batch_size=FETCH_BATCH_SIZE):
+        """
+        Stream the matching rows with fetchmany instead of building a list
+
+        With a model class (Doctor, Patient, Appointment, DoctorAvailability)
+        its COLUMNS are selected and every row is decoded with model.from_row,
+        otherwise rows are plain tuples of the selected columns.
+        """
+        columns = self.client._model_columns(model) if model is not None else self.select_cols
+        query, values = self._statement(columns)
+        rows = self.client._iter_rows(query, values, batch_size)
+        if model is None:
+            return rows
+        return map(model.from_row, rows)
+
+    def count(self):
+        """Number of rows matching the filters (ordering and paging are ignored)"""
+        query = _select_sql(self.table_name, "COUNT(*)", tuple(self.conditions), (), False, False)
+        self.client.cursor.execute(query, self.condition_values)
+        return self.client.cursor.fetchone()[0]
+
+    def pages(self, page_size=LIST_PAGE_SIZE):
+        """
+        Yield the matching rows page by page (lists of dicts), using keyset
+        pagination on id (so the selected columns must include id)
+        """
+        self.order_columns = []
+        self.offset_value = None
+        self.limit_value = page_size
+        while True:
+            page = self.execute()['data']
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            self.after_id = page[-1]['id']
 
-        self.client.cursor.execute(f"SELECT * FROM {self.table_name} WHERE id = ?", (item_id,))
-        row = self.client.cursor.fetchone()
-        if row:
-            return {"data": [dict(row)]}
-        return {"data": []}
+    def insert(self, data):
+        # Appointments and availability go through the client, which invalidates the caches built on them
+        if self.table_name == "appointments":
+            return self.client.create_appointment(data)
+        if self.table_name == "doctor_availability":
+            return self.client.create_doctor_availability(data)
+        return self.client._insert_returning(self.table_name, data)
 
     def update(self, data):
         self.update_data = data
@@ -334,5 +1110,44 @@ class TableQuery:
         return self
 
 
-# Initialize SQLite client
-db_client = SQLiteClient()
\ No newline at end of file
+class AsyncSQLiteClient:
+    """
+    asyncio front end for SQLiteClient
+
+    Every SQLiteClient method is available as a coroutine with the same
+    arguments (await async_db_client.get_doctor(1)). Calls run on a dedicated
+    thread pool, each worker thread with its own connection, so the event loop
+    never blocks on SQLite. run() does the same for any other blocking callable,
+    e.g. a TableQuery chain or a method that queries several times.
+    """
+
+    def __init__(self, client: SQLiteClient, max_workers: int = SQLITE_ASYNC_WORKERS):
+        self.client = client
+        self.max_workers = max_workers
+        self._new_executor()
+        if hasattr(os, "register_at_fork"):
+            # The worker threads don't survive a fork, a child starts a pool of its own
+            os.register_at_fork(after_in_child=self._new_executor)
+
+    def _new_executor(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sqlite")
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return method
+
+
+# Initialize SQLite client (connects on first use)
+db_client = SQLiteClient()
+async_db_client = AsyncSQLiteClient(db_client)
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+Appointment times as integer epoch minutes
+
+The appointments table has start_minute and end_minute (minutes since
+1970-01-01 00:00 UTC) generated from the ISO text columns, see migrations.py.
+Naive datetimes, which the scheduler uses throughout, are taken to be UTC like
+SQLite's strftime does, so a naive time survives the round trip unchanged apart
+from its seconds. Aware datetimes are converted to UTC. AppointmentBatch uses
+whole epoch seconds the same way.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Union
+
+from timeparse import parse_datetime
+
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+SECOND = timedelta(seconds=1)
+
+
+def to_epoch_minutes(value: Union[str, datetime], round_up: bool = False) -> int:
+    """
+    Minutes since the epoch, rounded down (or up with round_up, used for end
+    times so the stored interval always covers the real one)
+    """
+    moment = parse_datetime(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+    minutes, remainder = divmod(moment - EPOCH, MINUTE)
+    if round_up and remainder:
+        minutes += 1
+    return minutes
+
+
+def from_epoch_minutes(minutes: int) -> datetime:
+    return EPOCH + timedelta(minutes=minutes)
+
+
+def to_epoch_seconds(value: Union[str, datetime]) -> int:
+    """Whole seconds since the epoch, rounded down"""
+    moment = parse_datetime(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH) // SECOND
\ No newline at end of file
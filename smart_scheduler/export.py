@@ -0,0 +1,136 @@
+"""
+Streaming NDJSON and CSV export of appointments and slot search results
+
+Records are encoded and written as they come off a database cursor (see
+SQLiteClient.iter_appointment_records), a batch at a time, so an export of any
+size runs in constant memory. The encoder is compiled once per export from the
+column layout: a single str.format template per JSON line and a converter only
+for the columns that need one. Types and statuses are JSON encoded once per
+distinct value.
+"""
+import csv
+import json
+from itertools import islice
+from operator import attrgetter
+from typing import Callable, Iterable, List, Optional, Sequence, TextIO, Tuple
+
+from config import FETCH_BATCH_SIZE
+from appointment_batch import RECORD_KEYS
+from models import AppointmentSlot
+
+FORMATS = ("ndjson", "csv")
+
+# Column kinds: "int" and "float" are written as they are (the column must not
+# be NULL), "iso" is ISO time text or a datetime, "text" any JSON value and
+# "category" text with few distinct values
+APPOINTMENT_COLUMNS: Tuple[Tuple[str, str], ...] = tuple(zip(
+    RECORD_KEYS, ("int", "int", "int", "iso", "iso", "category", "category", "category")
+))
+SLOT_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("start_time", "iso"), ("end_time", "iso"), ("doctor_id", "int"), ("doctor_name", "text"), ("score", "float")
+)
+
+# Distinct values a category column keeps encoded, later ones are encoded per row
+MAX_CATEGORY_VALUES = 1024
+
+
+def _iso_text(value) -> str:
+    return value if value.__class__ is str else value.isoformat()
+
+
+def _category_encoder() -> Callable:
+    encoded = {}
+
+    def encode(value):
+        text = encoded.get(value)
+        if text is None:
+            text = json.dumps(value)
+            if len(encoded) < MAX_CATEGORY_VALUES:
+                encoded[value] = text
+        return text
+    return encode
+
+
+def _compile(template: Optional[str], converters: List[Optional[Callable]]) -> Callable:
+    """Function from a row tuple to its converted values, formatted into template if given"""
+    positions = [(i, convert) for i, convert in enumerate(converters) if convert is not None]
+
+    if not positions:
+        if template is None:
+            return tuple
+        return lambda row: template.format(*row)
+
+    def encode(row):
+        values = list(row)
+        for i, convert in positions:
+            values[i] = convert(values[i])
+        return values if template is None else template.format(*values)
+    return encode
+
+
+class RecordEncoder:
+    """NDJSON and CSV encoding of row tuples with a fixed column layout of (key, kind) pairs"""
+
+    def __init__(self, columns: Sequence[Tuple[str, str]]):
+        self.keys = tuple(key for key, _ in columns)
+
+        fields = []
+        json_converters = []
+        csv_converters = []
+        for key, kind in columns:
+            if kind in ("int", "float"):
+                placeholder, convert = "{}", None
+            elif kind == "iso":
+                placeholder, convert = '"{}"', _iso_text
+            elif kind == "text":
+                placeholder, convert = "{}", json.dumps
+            elif kind == "category":
+                placeholder, convert = "{}", _category_encoder()
+            else:
+                raise ValueError(f"Unknown column kind {kind} for {key}")
+            fields.append(f"{json.dumps(key)}: {placeholder}")
+            json_converters.append(convert)
+            csv_converters.append(_iso_text if kind == "iso" else None)
+
+        # Literal braces of the JSON object are doubled for str.format
+        template = "{{" + ", ".join(fields) + "}}\n"
+        self.ndjson_line = _compile(template, json_converters)
+        self.csv_row = _compile(None, csv_converters)
+
+    def write(self, records: Iterable[Sequence], file: TextIO, fmt: str = "ndjson",
+              batch_size: int = FETCH_BATCH_SIZE) -> int:
+        """Write records to file in fmt ("ndjson" or "csv" with a header row), returns the number of records"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt}. Must be one of: {', '.join(FORMATS)}")
+
+        if fmt == "csv":
+            writer = csv.writer(file)
+            writer.writerow(self.keys)
+            write_batch, encode = writer.writerows, self.csv_row
+        else:
+            write_batch, encode = file.writelines, self.ndjson_line
+
+        count = 0
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                return count
+            write_batch(map(encode, batch))
+            count += len(batch)
+
+
+def export_appointments(db, file: TextIO, fmt: str = "ndjson", doctor_ids=None, start_date=None, end_date=None,
+                        patient_id=None, batch_size: int = FETCH_BATCH_SIZE) -> int:
+    """
+    Stream appointments (filtered as in SQLiteClient.iter_appointment_records)
+    to file with the keys of Appointment.to_dict(), returns the number written
+    """
+    records = db.iter_appointment_records(doctor_ids, start_date, end_date, patient_id, batch_size)
+    return RecordEncoder(APPOINTMENT_COLUMNS).write(records, file, fmt, batch_size)
+
+
+def export_slots(slots: Iterable[AppointmentSlot], file: TextIO, fmt: str = "ndjson") -> int:
+    """Write slot search results to file, returns the number written"""
+    values = attrgetter(*(key for key, _ in SLOT_COLUMNS))
+    return RecordEncoder(SLOT_COLUMNS).write(map(values, slots), file, fmt)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Any, Iterable, Tuple
+
+from models import Appointment
+
+logger = logging.getLogger(__name__)
+
+# Appointments in these statuses no longer occupy the doctor's time
+NON_BLOCKING_STATUSES = {"cancelled"}
+
+
+def is_blocking(appointment: Appointment) -> bool:
+    return appointment.status not in NON_BLOCKING_STATUSES
+
+
+class IntervalIndex:
+    """
+    Sorted interval index for one doctor's appointments
+
+    Intervals are kept ordered by start time, so an overlap query is a bisect for
+    the last interval starting before the query ends plus a short backwards scan,
+    bounded by the longest interval stored. For a doctor's (non-overlapping)
+    appointments that is O(log n) per query.
+    """
+
+    def __init__(self):
+        self._starts: List[datetime] = []
+        self._entries: List[Tuple[datetime, datetime, Any]] = []
+        self._by_key: Dict[Any, Tuple[datetime, datetime]] = {}
+        self._max_length = timedelta(0)
+
+    @classmethod
+    def from_appointments(cls, appointments: Iterable[Appointment]) -> "IntervalIndex":
+        index = cls()
+        for appt in appointments:
+            index.insert(appt.id, appt.start_time, appt.end_time)
+        return index
+
+    @classmethod
+    def from_batch(cls, batch) -> "IntervalIndex":
+        """Index over an AppointmentBatch, sorted in one go instead of inserted one by one"""
+        index = cls()
+        if not len(batch):
+            return index
+
+        batch = batch.sorted_by_start()
+        starts = batch.start_times()
+        ends = batch.end_times()
+        keys = batch.ids.tolist()
+        index._starts = starts
+        index._entries = list(zip(starts, ends, keys))
+        index._by_key = {key: (start, end) for start, end, key in index._entries}
+        index._max_length = timedelta(seconds=int((batch.ends - batch.starts).max()))
+        return index
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._by_key
+
+    def insert(self, key, start: datetime, end: datetime):
+        """Add an interval, replacing any interval already stored under the same key"""
+        if key in self._by_key:
+            self.remove(key)
+
+        position = bisect_right(self._starts, start)
+        self._starts.insert(position, start)
+        self._entries.insert(position, (start, end, key))
+        self._by_key[key] = (start, end)
+        self._max_length = max(self._max_length, end - start)
+
+    def remove(self, key) -> bool:
+        """Remove the interval stored under key, returns False if there is none"""
+        if key not in self._by_key:
+            return False
+
+        start, _ = self._by_key.pop(key)
+        position = bisect_left(self._starts, start)
+        while self._entries[position][2] != key:
+            position += 1
+
+        del self._starts[position]
+        del self._entries[position]
+        return True
+
+    def overlapping(
+            self,
+            start: datetime,
+            end: datetime,
+            buffer: timedelta = timedelta(0),
+            exclude=None
+    ) -> List[Tuple[datetime, datetime, Any]]:
+        """(start, end, key) of all intervals that, widened by buffer on both sides, overlap [start, end)"""
+        entries = list(self._iter_overlapping(start, end, buffer, exclude))
+        entries.reverse()
+        return entries
+
+    def first_overlap(
+            self,
+            start: datetime,
+            end: datetime,
+            buffer: timedelta = timedelta(0),
+            exclude=None
+    ) -> Optional[Any]:
+        """Key of an interval overlapping [start, end), or None if the range is free"""
+        for _, _, key in self._iter_overlapping(start, end, buffer, exclude):
+            return key
+        return None
+
+    def overlaps(
+            self,
+            start: datetime,
+            end: datetime,
+            buffer: timedelta = timedelta(0),
+            exclude=None
+    ) -> bool:
+        return self.first_overlap(start, end, buffer, exclude) is not None
+
+    def _iter_overlapping(self, start, end, buffer, exclude):
+        # Intervals starting at or after end + buffer cannot overlap
+        position = bisect_left(self._starts, end + buffer)
+
+        # Walking backwards, once an interval starts before this bound none of the
+        # earlier ones can reach start - buffer either
+        lower_bound = start - buffer - self._max_length
+
+        while position > 0:
+            position -= 1
+            interval_start, interval_end, key = self._entries[position]
+            if interval_start < lower_bound:
+                break
+            if interval_end + buffer > start and key != exclude:
+                yield interval_start, interval_end, key
\ No newline at end of file
@@ -2,8 +2,9 @@ import logging
 import sys
 import os
 from datetime import datetime, timedelta
+from dataclasses import asdict
 import argparse
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, TextIO
 from pathlib import Path
 
 # Set up base directory
@@ -17,7 +18,9 @@ print("Using SQLite database for offline development")
 from models import Doctor, Patient, Appointment, AppointmentSlot
 from appointment_manager import AppointmentManager
 from calendar_integration import GoogleCalendarService
+from export import FORMATS, export_appointments, export_slots
 from SoplexAITeam.medchatbot.config import BASE_DIR
+from config import LIST_PAGE_SIZE
 
 # Set up logging
 logging.basicConfig(
@@ -48,45 +51,93 @@ class SmartAppointmentScheduler:
 
         logger.info("Smart Appointment Scheduler initialized")
 
-    def list_doctors(self, specialty: Optional[str] = None) -> List[Dict[str, Any]]:
-        """List available doctors"""
-        try:
-            query = self.db.table("doctors").select("*")
+    def _doctor_query(self, specialty: Optional[str] = None):
+        query = self.db.table("doctors").select("*")
+
+        if specialty:
+            query = query.eq("specialty", specialty)
+
+        return query.eq("active", True)
+
+    def _patient_query(self, search: Optional[str] = None):
+        query = self.db.table("patients").select("*")
+
+        if search:
+            # Simple search by name
+            query = query.ilike("name", f"%{search}%")
 
-            if specialty:
-                query = query.eq("specialty", specialty)
+        return query.eq("active", True)
 
-            result = query.eq("active", True).execute()
+    def count_doctors(self, specialty: Optional[str] = None) -> int:
+        return self._doctor_query(specialty).count()
+
+    def count_patients(self, search: Optional[str] = None) -> int:
+        return self._patient_query(search).count()
+
+    def list_doctors(
+            self,
+            specialty: Optional[str] = None,
+            limit: Optional[int] = None,
+            after_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """List available doctors (one page of limit doctors after after_id if given)"""
+        try:
+            result = self._doctor_query(specialty).after(after_id).limit(limit).execute()
 
             doctors = []
             if result.get('data'):
-                doctors = [Doctor.from_dict(doc).__dict__ for doc in result['data']]
+                doctors = [asdict(Doctor.from_db(doc)) for doc in result['data']]
 
             return doctors
         except Exception as e:
             logger.error(f"Error listing doctors: {e}")
             return []
 
-    def list_patients(self, search: Optional[str] = None) -> List[Dict[str, Any]]:
-        """List patients"""
+    def list_patients(
+            self,
+            search: Optional[str] = None,
+            limit: Optional[int] = None,
+            after_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """List patients (one page of limit patients after after_id if given), without medical history"""
         try:
-            query = self.db.table("patients").select("*")
-
-            if search:
-                # Simple search by name
-                query = query.ilike("name", f"%{search}%")
-
-            result = query.eq("active", True).execute()
+            result = self._patient_query(search).after(after_id).limit(limit).execute()
 
             patients = []
             if result.get('data'):
-                patients = [Patient.from_dict(pat).__dict__ for pat in result['data']]
+                patients = [Patient.from_db(pat).to_dict(include_medical_history=False) for pat in result['data']]
 
             return patients
         except Exception as e:
             logger.error(f"Error listing patients: {e}")
             return []
 
+    def _suggest_slots(
+            self,
+            doctor_id: Optional[int],
+            specialty: Optional[str],
+            appointment_type: str,
+            patient_id: Optional[int],
+            date_range_days: int,
+            urgency_level: int
+    ) -> List[AppointmentSlot]:
+        start_date = datetime.now()
+        end_date = start_date + timedelta(days=date_range_days)
+
+        doctor_ids = None
+        if doctor_id:
+            doctor_ids = [doctor_id]
+
+        return self.appointment_manager.suggest_appointment_slots(
+            doctor_ids=doctor_ids,
+            specialty=specialty,
+            appointment_type=appointment_type,
+            patient_id=patient_id,
+            start_date=start_date,
+            end_date=end_date,
+            urgency_level=urgency_level
+        )
+
     def find_available_slots(
             self,
             doctor_id: Optional[int] = None,
@@ -100,28 +151,33 @@ class SmartAppointmentScheduler:
         Find available appointment slots using the AI scheduler
         """
         try:
-            start_date = datetime.now()
-            end_date = start_date + timedelta(days=date_range_days)
-
-            doctor_ids = None
-            if doctor_id:
-                doctor_ids = [doctor_id]
-
-            slots = self.appointment_manager.suggest_appointment_slots(
-                doctor_ids=doctor_ids,
-                specialty=specialty,
-                appointment_type=appointment_type,
-                patient_id=patient_id,
-                start_date=start_date,
-                end_date=end_date,
-                urgency_level=urgency_level
-            )
-
-            return [vars(slot) for slot in slots]
+            slots = self._suggest_slots(doctor_id, specialty, appointment_type, patient_id, date_range_days,
+                                        urgency_level)
+            return [asdict(slot) for slot in slots]
         except Exception as e:
             logger.error(f"Error finding available slots: {e}")
             return []
 
+    def export_available_slots(
+            self,
+            file: TextIO,
+            fmt: str = "ndjson",
+            doctor_id: Optional[int] = None,
+            specialty: Optional[str] = None,
+            appointment_type: str = "routine_checkup",
+            patient_id: Optional[int] = None,
+            date_range_days: int = 14,
+            urgency_level: int = 3
+    ) -> int:
+        """Write the available slots find_available_slots would return to file, returns the number written"""
+        try:
+            slots = self._suggest_slots(doctor_id, specialty, appointment_type, patient_id, date_range_days,
+                                        urgency_level)
+            return export_slots(slots, file, fmt)
+        except Exception as e:
+            logger.error(f"Error exporting available slots: {e}")
+            raise
+
     def book_appointment(
             self,
             doctor_id: int,
@@ -173,32 +229,113 @@ class SmartAppointmentScheduler:
             logger.error(f"Error cancelling appointment: {e}")
             raise
 
-    def get_doctor_schedule(self, doctor_id: int, days: int = 7) -> List[Dict[str, Any]]:
-        """Get a doctor's schedule"""
+    def get_doctor_schedule(
+            self,
+            doctor_id: int,
+            days: int = 7,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            start_date: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Get a doctor's schedule for days days from start_date (default: now)"""
         try:
-            start_date = datetime.now()
+            start_date = start_date or datetime.now()
             end_date = start_date + timedelta(days=days)
 
             return self.appointment_manager.get_doctor_schedule(
                 doctor_id=doctor_id,
                 start_date=start_date,
-                end_date=end_date
+                end_date=end_date,
+                limit=limit,
+                offset=offset
             )
         except Exception as e:
             logger.error(f"Error getting doctor schedule: {e}")
             return []
 
-    def get_patient_appointments(self, patient_id: int, include_past: bool = False) -> List[Dict[str, Any]]:
-        """Get a patient's appointments"""
+    def get_patient_appointments(
+            self,
+            patient_id: int,
+            include_past: bool = False,
+            limit: Optional[int] = None,
+            offset: int = 0,
+            since: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Get a patient's appointments (from since, default now, unless include_past)"""
         try:
             return self.appointment_manager.get_patient_appointments(
                 patient_id=patient_id,
-                include_past=include_past
+                include_past=include_past,
+                limit=limit,
+                offset=offset,
+                since=since
             )
         except Exception as e:
             logger.error(f"Error getting patient appointments: {e}")
             return []
 
+    def export_schedules(
+            self,
+            file: TextIO,
+            fmt: str = "ndjson",
+            start_date: Optional[datetime] = None,
+            days: int = 7,
+            doctor_ids: Optional[List[int]] = None
+    ) -> int:
+        """
+        Stream the appointments of doctor_ids (default: all doctors) overlapping
+        days days from start_date (default: now) to file as NDJSON or CSV,
+        returns the number written
+        """
+        try:
+            start_date = start_date or datetime.now()
+            return export_appointments(self.db, file, fmt, doctor_ids=doctor_ids, start_date=start_date,
+                                       end_date=start_date + timedelta(days=days))
+        except Exception as e:
+            logger.error(f"Error exporting schedules: {e}")
+            raise
+
+    def export_doctor_schedule(self, doctor_id: int, file: TextIO, fmt: str = "ndjson", days: int = 7) -> int:
+        """Stream a doctor's schedule to file (see export_schedules)"""
+        return self.export_schedules(file, fmt, days=days, doctor_ids=[doctor_id])
+
+    def export_patient_appointments(
+            self,
+            patient_id: int,
+            file: TextIO,
+            fmt: str = "ndjson",
+            include_past: bool = False
+    ) -> int:
+        """Stream a patient's appointments (those not over yet unless include_past) to file in start time order"""
+        try:
+            start_date = None if include_past else datetime.now()
+            return export_appointments(self.db, file, fmt, start_date=start_date, patient_id=patient_id)
+        except Exception as e:
+            logger.error(f"Error exporting patient appointments: {e}")
+            raise
+
+
+def keyset_pages(fetch_page, page_size: int):
+    """Rows of fetch_page(limit, after_id) page by page, each page starting after the last id seen"""
+    after_id = None
+    while True:
+        page = fetch_page(page_size, after_id)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]['id']
+
+
+def offset_pages(fetch_page, page_size: int):
+    """Rows of fetch_page(limit, offset) page by page (fetch_page must filter the same way on every call)"""
+    offset = 0
+    while True:
+        page = fetch_page(page_size, offset)
+        yield from page
+        if len(page) < page_size:
+            return
+        offset += page_size
+
 
 def main():
     parser = argparse.ArgumentParser(description="MedNexusAI Smart Appointment Scheduler")
@@ -209,6 +346,8 @@ def main():
     parser.add_argument("--cancel", type=int, help="Cancel appointment by ID")
     parser.add_argument("--doctor-schedule", type=int, help="Get doctor schedule by ID")
     parser.add_argument("--patient-appointments", type=int, help="Get patient appointments by ID")
+    parser.add_argument("--export-schedules", action="store_true",
+                        help="Export all doctors' appointments over --days from --start-date (needs --output)")
 
     # Parameters for find-slots
     parser.add_argument("--doctor-id", type=int, help="Doctor ID")
@@ -217,6 +356,13 @@ def main():
     parser.add_argument("--appointment-type", type=str, default="routine_checkup", help="Appointment type")
     parser.add_argument("--days", type=int, default=14, help="Days to look ahead")
     parser.add_argument("--urgency", type=int, default=3, help="Urgency level (1-5)")
+    parser.add_argument("--page-size", type=int, default=LIST_PAGE_SIZE, help="Rows fetched per query for listings")
+
+    # Parameters for exports: --find-slots, --doctor-schedule and --patient-appointments write
+    # records to --output instead of printing them when --format is given
+    parser.add_argument("--format", choices=FORMATS, help="Export format")
+    parser.add_argument("--output", type=str, help="Export file")
+    parser.add_argument("--start-date", type=str, help="Export start date (ISO format, default: now)")
 
     # Parameters for book
     parser.add_argument("--start-time", type=str, help="Appointment start time (ISO format)")
@@ -224,26 +370,57 @@ def main():
 
     args = parser.parse_args()
 
+    exporting = args.export_schedules or (
+            args.format and (args.find_slots or args.doctor_schedule is not None or args.patient_appointments is not None)
+    )
+    if exporting and not args.output:
+        print("Error: --output is required for exports")
+        sys.exit(1)
+    if args.find_slots and not (args.doctor_id or args.specialty):
+        print("Error: Either --doctor-id or --specialty must be provided")
+        sys.exit(1)
+
     try:
         scheduler = SmartAppointmentScheduler()
 
-        if args.list_doctors:
-            doctors = scheduler.list_doctors(args.specialty)
-            print(f"Found {len(doctors)} doctors:")
+        if exporting:
+            fmt = args.format or "ndjson"
+            with open(args.output, 'w', newline='', encoding='utf-8') as file:
+                if args.export_schedules:
+                    start_date = datetime.fromisoformat(args.start_date) if args.start_date else None
+                    count = scheduler.export_schedules(file, fmt, start_date, args.days)
+                elif args.find_slots:
+                    count = scheduler.export_available_slots(
+                        file, fmt,
+                        doctor_id=args.doctor_id,
+                        specialty=args.specialty,
+                        appointment_type=args.appointment_type,
+                        patient_id=args.patient_id,
+                        date_range_days=args.days,
+                        urgency_level=args.urgency
+                    )
+                elif args.doctor_schedule is not None:
+                    count = scheduler.export_doctor_schedule(args.doctor_schedule, file, fmt, args.days)
+                else:
+                    count = scheduler.export_patient_appointments(args.patient_appointments, file, fmt)
+            print(f"Exported {count} records to {args.output}")
+
+        elif args.list_doctors:
+            print(f"Found {scheduler.count_doctors(args.specialty)} doctors:")
+            doctors = keyset_pages(
+                lambda limit, after_id: scheduler.list_doctors(args.specialty, limit, after_id), args.page_size
+            )
             for doc in doctors:
                 print(f"  ID: {doc['id']}, Name: {doc['name']}, Specialty: {doc['specialty']}")
 
         elif args.list_patients:
-            patients = scheduler.list_patients()
-            print(f"Found {len(patients)} patients:")
+            print(f"Found {scheduler.count_patients()} patients:")
+            patients = keyset_pages(lambda limit, after_id: scheduler.list_patients(None, limit, after_id),
+                                    args.page_size)
             for pat in patients:
                 print(f"  ID: {pat['id']}, Name: {pat['name']}")
 
         elif args.find_slots:
-            if not (args.doctor_id or args.specialty):
-                print("Error: Either --doctor-id or --specialty must be provided")
-                sys.exit(1)
-
             slots = scheduler.find_available_slots(
                 doctor_id=args.doctor_id,
                 specialty=args.specialty,
@@ -300,25 +477,35 @@ def main():
                 sys.exit(1)
 
         elif args.doctor_schedule is not None:
-            appointments = scheduler.get_doctor_schedule(
-                doctor_id=args.doctor_schedule,
-                days=args.days
+            # One start time for every page, so rows don't move between pages as the clock runs
+            now = datetime.now()
+            appointments = offset_pages(
+                lambda limit, offset: scheduler.get_doctor_schedule(args.doctor_schedule, args.days, limit, offset,
+                                                                    now),
+                args.page_size
             )
 
-            print(f"Doctor {args.doctor_schedule} schedule ({len(appointments)} appointments):")
-            for appt in appointments:
+            print(f"Doctor {args.doctor_schedule} schedule:")
+            count = 0
+            for count, appt in enumerate(appointments, 1):
                 start = datetime.fromisoformat(appt['start_time']).strftime('%Y-%m-%d %H:%M')
                 print(f"  {start} - {appt['appointment_type']} - Status: {appt['status']}")
+            print(f"{count} appointments")
 
         elif args.patient_appointments is not None:
-            appointments = scheduler.get_patient_appointments(
-                patient_id=args.patient_appointments
+            now = datetime.now()
+            appointments = offset_pages(
+                lambda limit, offset: scheduler.get_patient_appointments(args.patient_appointments, False, limit,
+                                                                         offset, now),
+                args.page_size
             )
 
-            print(f"Patient {args.patient_appointments} appointments ({len(appointments)}):")
-            for appt in appointments:
+            print(f"Patient {args.patient_appointments} appointments:")
+            count = 0
+            for count, appt in enumerate(appointments, 1):
                 start = datetime.fromisoformat(appt['start_time']).strftime('%Y-%m-%d %H:%M')
                 print(f"  {start} - {appt['appointment_type']} - Status: {appt['status']}")
+            print(f"{count} appointments")
 
         else:
             parser.print_help()
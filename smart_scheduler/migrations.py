@@ -0,0 +1,318 @@
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+from datetime import timedelta
+from typing import Callable, List, Tuple
+
+from config import APPOINTMENT_TYPES, DEFAULT_APPOINTMENT_DURATION
+from timeparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+
+# Migration steps, each gets a cursor inside its own transaction
+
+def _index_appointments_by_doctor(cursor):
+    # Doctor schedule range scans: doctor_id = ? AND start_time >= ? AND end_time <= ?
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_doctor_start "
+        "ON appointments (doctor_id, start_time, end_time)"
+    )
+
+
+def _index_appointments_by_patient(cursor):
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_patient_start "
+        "ON appointments (patient_id, start_time)"
+    )
+
+
+def _index_availability_by_doctor(cursor):
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_doctor_availability_doctor "
+        "ON doctor_availability (doctor_id)"
+    )
+
+
+def _index_doctors_by_specialty(cursor):
+    # Covers the specialty lookup in suggest_appointment_slots (SELECT id ... WHERE specialty = ? AND active = ?)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_doctors_specialty_active "
+        "ON doctors (specialty, active)"
+    )
+
+
+# Generated columns need SQLite 3.31
+SUPPORTS_GENERATED_COLUMNS = sqlite3.sqlite_version_info >= (3, 31, 0)
+
+# Appointment times as epoch minutes (see epoch_time.py), start rounded down and
+# end rounded up to the minute. Naive ISO text is read as UTC.
+APPOINTMENT_MINUTE_COLUMNS = [
+    ("start_minute", "CAST(strftime('%s', start_time) AS INTEGER) / 60"),
+    ("end_minute", "(CAST(strftime('%s', end_time) AS INTEGER) + 59) / 60"),
+]
+
+
+def _store_appointment_minutes(cursor):
+    # Virtual generated columns are computed by SQLite from the ISO text, so every
+    # writer (including plain SQL) keeps them right and existing rows need no
+    # backfill. Only the index below stores the values.
+    if not SUPPORTS_GENERATED_COLUMNS:
+        logger.warning(f"SQLite {sqlite3.sqlite_version} has no generated columns, epoch time storage unavailable")
+        return
+
+    columns = {row[1] for row in cursor.execute("PRAGMA table_xinfo(appointments)").fetchall()}
+    for column, expression in APPOINTMENT_MINUTE_COLUMNS:
+        if column not in columns:
+            cursor.execute(
+                f"ALTER TABLE appointments ADD COLUMN {column} INTEGER GENERATED ALWAYS AS ({expression}) VIRTUAL"
+            )
+
+    # Overlap queries: doctor_id = ? AND end_minute > ? AND start_minute < ?
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_doctor_end_minute "
+        "ON appointments (doctor_id, end_minute, start_minute)"
+    )
+
+
+def _index_appointments_by_doctor_end(cursor):
+    # Overlap queries bound the scan by end_time (from the window start on), a
+    # start_time-first index would scan the doctor's whole history
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_appointments_doctor_end "
+        "ON appointments (doctor_id, end_time, start_time)"
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_appointments_doctor_start")
+
+
+# ALTER TABLE ... DROP COLUMN needs SQLite 3.35
+SUPPORTS_DROP_COLUMN = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def _history_row(patient_id, entry):
+    """appointments row for one appointment_history entry, None if it does not name a doctor and start time"""
+    if not isinstance(entry, dict) or entry.get('doctor_id') is None or not entry.get('start_time'):
+        return None
+    appointment_type = entry.get('appointment_type') or "routine_checkup"
+    start_time = parse_datetime(entry['start_time'])
+    if entry.get('end_time'):
+        end_time = parse_datetime(entry['end_time'])
+    else:
+        duration = APPOINTMENT_TYPES.get(appointment_type)
+        end_time = start_time + (timedelta(minutes=duration) if duration else DEFAULT_APPOINTMENT_DURATION)
+    return (
+        entry['doctor_id'], patient_id, start_time.isoformat(), end_time.isoformat(), appointment_type,
+        entry.get('urgency_level') or 3, entry.get('status') or "completed", entry.get('notes')
+    )
+
+
+def _move_appointment_history(cursor):
+    # Appointment history used to be a JSON list on the patient row, growing with
+    # every visit. Entries not in appointments yet (same patient, doctor and start
+    # time) are copied there, then the column is dropped (emptied on SQLite < 3.35).
+    # Entries that can't be moved, or the whole text if it is not a JSON list, are
+    # kept in patient_appointment_history_archive first so nothing is lost.
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(patients)").fetchall()}
+    if "appointment_history" not in columns:
+        return
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS patient_appointment_history_archive (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER NOT NULL,
+        entry TEXT NOT NULL,
+        archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    archived = []
+
+    moved = skipped = 0
+    histories = cursor.execute(
+        "SELECT id, appointment_history FROM patients "
+        "WHERE appointment_history IS NOT NULL AND appointment_history NOT IN ('', '[]')"
+    ).fetchall()
+    for patient_id, history in histories:
+        try:
+            entries = json.loads(history)
+        except json.JSONDecodeError:
+            entries = None
+        if not isinstance(entries, list):
+            logger.warning(f"Patient {patient_id} has unreadable appointment history, archived as is")
+            archived.append((patient_id, history))
+            skipped += 1
+            continue
+
+        for entry in entries:
+            try:
+                row = _history_row(patient_id, entry)
+            except (TypeError, ValueError):
+                row = None
+            if row is None:
+                archived.append((patient_id, json.dumps(entry)))
+                skipped += 1
+                continue
+            cursor.execute(
+                "INSERT INTO appointments (doctor_id, patient_id, start_time, end_time, appointment_type, "
+                "urgency_level, status, notes) SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS ("
+                "SELECT 1 FROM appointments WHERE patient_id = ? AND doctor_id = ? AND start_time = ?)",
+                row + (patient_id, row[0], row[2])
+            )
+            moved += cursor.rowcount
+
+    cursor.executemany(
+        "INSERT INTO patient_appointment_history_archive (patient_id, entry) VALUES (?, ?)", archived
+    )
+
+    if SUPPORTS_DROP_COLUMN:
+        cursor.execute("ALTER TABLE patients DROP COLUMN appointment_history")
+    else:
+        cursor.execute("UPDATE patients SET appointment_history = NULL")
+    logger.info(
+        f"Moved {moved} appointment history entries to appointments, "
+        f"archived {skipped} in patient_appointment_history_archive"
+    )
+
+
+# (version, description, step) in the order they are applied. Never edit or
+# reorder applied migrations, add a new one with the next version instead.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "Index appointments by doctor and start time", _index_appointments_by_doctor),
+    (2, "Index appointments by patient and start time", _index_appointments_by_patient),
+    (3, "Index doctor availability by doctor", _index_availability_by_doctor),
+    (4, "Index doctors by specialty and active flag", _index_doctors_by_specialty),
+    (5, "Store appointment times as epoch minutes", _store_appointment_minutes),
+    (6, "Index appointments by doctor and end time for overlap queries", _index_appointments_by_doctor_end),
+    (7, "Move patient appointment history into the appointments table", _move_appointment_history),
+]
+
+
+def get_schema_version(conn) -> int:
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn) -> int:
+    """Apply every pending migration in order, returns the resulting schema version"""
+    version = get_schema_version(conn)
+    conn.commit()
+
+    for migration_version, description, step in MIGRATIONS:
+        if migration_version <= version:
+            continue
+
+        with conn:
+            cursor = conn.cursor()
+            step(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (migration_version, description)
+            )
+
+        version = migration_version
+        logger.info(f"Applied migration {migration_version}: {description}")
+
+    return version
+
+
+# Hot queries and the index each one must use, as issued by SQLiteClient
+QUERY_PLAN_CHECKS = [
+    (
+        "get_doctor_appointments",
+        "SELECT * FROM appointments WHERE doctor_id = ? AND end_time > ? AND start_time < ?",
+        (1, "2024-01-01T00:00:00", "2024-01-08T00:00:00"),
+        "idx_appointments_doctor_end"
+    ),
+    (
+        "get_appointments_for_doctors",
+        "SELECT * FROM appointments WHERE doctor_id IN (?, ?, ?) AND end_time > ? AND start_time < ?",
+        (1, 2, 3, "2024-01-01T00:00:00", "2024-01-08T00:00:00"),
+        "idx_appointments_doctor_end"
+    ),
+    (
+        "get_doctor_appointments (epoch)",
+        "SELECT * FROM appointments WHERE doctor_id = ? AND end_minute > ? AND start_minute < ?",
+        (1, 28401120, 28411200),
+        "idx_appointments_doctor_end_minute"
+    ),
+    (
+        "get_appointments_for_doctors (epoch)",
+        "SELECT * FROM appointments WHERE doctor_id IN (?, ?, ?) AND end_minute > ? AND start_minute < ?",
+        (1, 2, 3, 28401120, 28411200),
+        "idx_appointments_doctor_end_minute"
+    ),
+    (
+        "get_patient_appointments",
+        "SELECT * FROM appointments WHERE patient_id = ? ORDER BY start_time, id",
+        (1,),
+        "idx_appointments_patient_start"
+    ),
+    (
+        "get_patient_appointments (upcoming page)",
+        "SELECT * FROM appointments WHERE patient_id = ? AND start_time >= ? ORDER BY start_time, id LIMIT ? OFFSET ?",
+        (1, "2024-01-01T00:00:00", 100, 0),
+        "idx_appointments_patient_start"
+    ),
+    (
+        "get_doctor_availability",
+        "SELECT * FROM doctor_availability WHERE doctor_id = ?",
+        (1,),
+        "idx_doctor_availability_doctor"
+    ),
+    (
+        "get_availability_for_doctors",
+        "SELECT * FROM doctor_availability WHERE doctor_id IN (?, ?, ?) ORDER BY id",
+        (1, 2, 3),
+        "idx_doctor_availability_doctor"
+    ),
+    (
+        "doctors by specialty",
+        "SELECT id FROM doctors WHERE specialty = ? AND active = ?",
+        ("Cardiology", 1),
+        "idx_doctors_specialty_active"
+    ),
+]
+
+
+def check_query_plans(conn) -> List[str]:
+    """
+    Run EXPLAIN QUERY PLAN for every hot query, returns a problem description for
+    each query that does not use its index (an empty list means all is well)
+    """
+    problems = []
+    for name, query, params, index_name in QUERY_PLAN_CHECKS:
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+        if not any(index_name in detail for detail in plan):
+            problems.append(f"{name} does not use {index_name}: {'; '.join(plan)}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduler database migrations")
+    parser.add_argument("--check", action="store_true", help="Verify the hot queries use their indexes")
+    args = parser.parse_args()
+
+    # Connecting runs any pending migrations
+    from database_sqlite import db_client
+
+    print(f"Schema version: {get_schema_version(db_client.conn)}")
+
+    if args.check:
+        problems = check_query_plans(db_client.conn)
+        for problem in problems:
+            print(f"FAIL {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"All {len(QUERY_PLAN_CHECKS)} query plans use their indexes")
+
+
+if __name__ == "__main__":
+    main()
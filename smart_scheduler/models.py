@@ -1,10 +1,24 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, date, time
-from typing import List, Dict, Optional, Any
+from operator import itemgetter
+from typing import Dict, Optional, Any, ClassVar, Tuple
 import json
 
+from epoch_time import from_epoch_minutes
+from timeparse import parse_time, parse_date, parse_datetime
 
-@dataclass
+# Patient.medical_history before its JSON text has been decoded
+_NOT_DECODED = object()
+
+
+def _parse_appointment_time(value) -> datetime:
+    # Epoch minutes when the row was read from start_minute/end_minute
+    if isinstance(value, int):
+        return from_epoch_minutes(value)
+    return parse_datetime(value)
+
+
+@dataclass(slots=True)
 class Doctor:
     id: int
     name: str
@@ -14,11 +28,24 @@ class Doctor:
     active: bool = True
     created_at: Optional[str] = None  # Added created_at field
 
+    # Column order expected by from_row
+    COLUMNS: ClassVar[Tuple[str, ...]] = ('id', 'name', 'email', 'specialty', 'calendar_id', 'active', 'created_at')
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a plain tuple of COLUMNS values, without an intermediate dict"""
+        doctor_id, name, email, specialty, calendar_id, active, created_at = row
+        return cls(doctor_id, name, email, specialty, calendar_id, bool(active), created_at)
+
+    @classmethod
+    def from_db(cls, data):
+        """Build from a row dict read from the database, which has every column"""
+        return cls.from_row(_DOCTOR_VALUES(data))
+
     @classmethod
     def from_dict(cls, data):
         # Filter out unknown fields
-        valid_fields = ['id', 'name', 'email', 'specialty', 'calendar_id', 'active', 'created_at']
-        filtered_data = {k: v for k, v in data.items() if k in valid_fields}
+        filtered_data = {k: v for k, v in data.items() if k in DOCTOR_FIELDS}
 
         # Convert active from integer to boolean if needed
         if 'active' in filtered_data and isinstance(filtered_data['active'], int):
@@ -26,55 +53,133 @@ class Doctor:
         return cls(**filtered_data)
 
 
-@dataclass
+DOCTOR_FIELDS = frozenset(Doctor.COLUMNS)
+_DOCTOR_VALUES = itemgetter(*Doctor.COLUMNS)
+
+
+@dataclass(slots=True, init=False)
 class Patient:
+    """
+    A patient. medical_history is kept as the stored JSON text and only decoded
+    on first access, so listing patients never parses it. Appointment history
+    is not part of the patient, it is the patient's rows in appointments
+    (see get_patient_appointments). An already decoded medical_history can
+    still be passed by keyword, as before medical_history_json existed.
+
+    medical_history_json is the text as read or assigned, changing the decoded
+    dict in place does not update it. Equality compares the decoded value, and
+    to_dict() returns it, so persist a patient through to_dict() or assign
+    medical_history a new dict.
+    """
     id: int
     name: str
     email: str
     phone: str
     date_of_birth: date
-    medical_history: Optional[Dict] = None
-    appointment_history: Optional[List[Dict]] = None
+    medical_history_json: Optional[str] = field(default=None, repr=False, compare=False)
     active: bool = True
     created_at: Optional[str] = None  # Added created_at field
+    _medical_history: Any = field(default=_NOT_DECODED, init=False, repr=False, compare=False)
 
-    @classmethod
-    def from_dict(cls, data):
-        # Filter out unknown fields
-        valid_fields = [
-            'id', 'name', 'email', 'phone', 'date_of_birth',
-            'medical_history', 'appointment_history', 'active', 'created_at'
-        ]
-        filtered_data = {k: v for k, v in data.items() if k in valid_fields}
+    # Column order expected by from_row
+    COLUMNS: ClassVar[Tuple[str, ...]] = (
+        'id', 'name', 'email', 'phone', 'date_of_birth', 'medical_history', 'active', 'created_at'
+    )
 
-        if 'date_of_birth' in filtered_data and isinstance(filtered_data['date_of_birth'], str):
-            try:
-                filtered_data['date_of_birth'] = datetime.fromisoformat(filtered_data['date_of_birth']).date()
-            except ValueError:
-                # Handle different date formats
-                filtered_data['date_of_birth'] = datetime.strptime(filtered_data['date_of_birth'], "%Y-%m-%d").date()
+    def __init__(self, id: int, name: str, email: str, phone: str, date_of_birth: date,
+                 medical_history_json: Optional[str] = None, active: bool = True, created_at: Optional[str] = None,
+                 *, medical_history: Optional[Dict] = None):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.phone = phone
+        self.date_of_birth = date_of_birth
+        self.medical_history_json = medical_history_json
+        self.active = active
+        self.created_at = created_at
+        self._medical_history = _NOT_DECODED
+        if medical_history is not None:
+            self.medical_history = medical_history
 
-        # Parse JSON strings to dictionaries/lists
-        if 'medical_history' in filtered_data and isinstance(filtered_data['medical_history'], str):
-            try:
-                filtered_data['medical_history'] = json.loads(filtered_data['medical_history'])
-            except json.JSONDecodeError:
-                filtered_data['medical_history'] = {}
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (
+            (self.id, self.name, self.email, self.phone, self.date_of_birth, self.active, self.created_at)
+            == (other.id, other.name, other.email, other.phone, other.date_of_birth, other.active, other.created_at)
+            and self.medical_history == other.medical_history
+        )
 
-        if 'appointment_history' in filtered_data and isinstance(filtered_data['appointment_history'], str):
+    @property
+    def medical_history(self) -> Optional[Dict]:
+        if self._medical_history is _NOT_DECODED:
             try:
-                filtered_data['appointment_history'] = json.loads(filtered_data['appointment_history'])
+                self._medical_history = (
+                    json.loads(self.medical_history_json) if self.medical_history_json is not None else None
+                )
             except json.JSONDecodeError:
-                filtered_data['appointment_history'] = []
+                self._medical_history = {}
+        return self._medical_history
+
+    @medical_history.setter
+    def medical_history(self, value: Optional[Dict]):
+        self._medical_history = value
+        self.medical_history_json = json.dumps(value) if value is not None else None
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a plain tuple of COLUMNS values, without an intermediate dict"""
+        patient_id, name, email, phone, date_of_birth, medical_history, active, created_at = row
+        return cls(
+            patient_id, name, email, phone,
+            parse_date(date_of_birth) if date_of_birth else date_of_birth,
+            medical_history, bool(active), created_at
+        )
+
+    @classmethod
+    def from_db(cls, data):
+        """Build from a row dict read from the database, which has every column"""
+        return cls.from_row(_PATIENT_VALUES(data))
+
+    @classmethod
+    def from_dict(cls, data):
+        # Filter out unknown fields
+        filtered_data = {k: v for k, v in data.items() if k in PATIENT_FIELDS}
+
+        if 'date_of_birth' in filtered_data and isinstance(filtered_data['date_of_birth'], str):
+            filtered_data['date_of_birth'] = parse_date(filtered_data['date_of_birth'])
 
         # Convert active from integer to boolean if needed
         if 'active' in filtered_data and isinstance(filtered_data['active'], int):
             filtered_data['active'] = bool(filtered_data['active'])
 
+        # JSON text is kept as is, an already decoded value is encoded by the constructor
+        if isinstance(filtered_data.get('medical_history'), str):
+            filtered_data['medical_history_json'] = filtered_data.pop('medical_history')
+
         return cls(**filtered_data)
 
+    def to_dict(self, include_medical_history: bool = True):
+        """Plain dict of the patient, without decoding medical_history unless include_medical_history"""
+        result = {
+            'id': self.id,
+            'name': self.name,
+            'email': self.email,
+            'phone': self.phone,
+            'date_of_birth': self.date_of_birth.isoformat() if self.date_of_birth else self.date_of_birth,
+            'active': self.active,
+            'created_at': self.created_at
+        }
+        if include_medical_history:
+            result['medical_history'] = self.medical_history
+        return result
+
 
-@dataclass
+PATIENT_FIELDS = frozenset(Patient.COLUMNS)
+_PATIENT_VALUES = itemgetter(*Patient.COLUMNS)
+
+
+@dataclass(slots=True)
 class DoctorAvailability:
     id: int
     doctor_id: int
@@ -85,25 +190,41 @@ class DoctorAvailability:
     specific_date: Optional[date] = None
     created_at: Optional[str] = None  # Added created_at field
 
+    # Column order expected by from_row
+    COLUMNS: ClassVar[Tuple[str, ...]] = (
+        'id', 'doctor_id', 'day_of_week', 'start_time', 'end_time', 'recurring', 'specific_date', 'created_at'
+    )
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a plain tuple of COLUMNS values, without an intermediate dict"""
+        availability_id, doctor_id, day_of_week, start_time, end_time, recurring, specific_date, created_at = row
+        return cls(
+            availability_id, doctor_id, day_of_week,
+            parse_time(start_time),
+            parse_time(end_time),
+            bool(recurring),
+            parse_date(specific_date) if specific_date else None,
+            created_at
+        )
+
+    @classmethod
+    def from_db(cls, data):
+        """Build from a row dict read from the database, which has every column"""
+        return cls.from_row(_AVAILABILITY_VALUES(data))
+
     @classmethod
     def from_dict(cls, data):
         # Filter out unknown fields
-        valid_fields = [
-            'id', 'doctor_id', 'day_of_week', 'start_time', 'end_time',
-            'recurring', 'specific_date', 'created_at'
-        ]
-        filtered_data = {k: v for k, v in data.items() if k in valid_fields}
+        filtered_data = {k: v for k, v in data.items() if k in AVAILABILITY_FIELDS}
 
         if 'start_time' in filtered_data and isinstance(filtered_data['start_time'], str):
-            filtered_data['start_time'] = datetime.strptime(filtered_data['start_time'], "%H:%M").time()
+            filtered_data['start_time'] = parse_time(filtered_data['start_time'])
         if 'end_time' in filtered_data and isinstance(filtered_data['end_time'], str):
-            filtered_data['end_time'] = datetime.strptime(filtered_data['end_time'], "%H:%M").time()
+            filtered_data['end_time'] = parse_time(filtered_data['end_time'])
         if 'specific_date' in filtered_data and filtered_data['specific_date'] and isinstance(
                 filtered_data['specific_date'], str):
-            try:
-                filtered_data['specific_date'] = datetime.fromisoformat(filtered_data['specific_date']).date()
-            except ValueError:
-                filtered_data['specific_date'] = datetime.strptime(filtered_data['specific_date'], "%Y-%m-%d").date()
+            filtered_data['specific_date'] = parse_date(filtered_data['specific_date'])
 
         # Convert recurring from integer to boolean if needed
         if 'recurring' in filtered_data and isinstance(filtered_data['recurring'], int):
@@ -112,7 +233,11 @@ class DoctorAvailability:
         return cls(**filtered_data)
 
 
-@dataclass
+AVAILABILITY_FIELDS = frozenset(DoctorAvailability.COLUMNS)
+_AVAILABILITY_VALUES = itemgetter(*DoctorAvailability.COLUMNS)
+
+
+@dataclass(slots=True)
 class Appointment:
     id: Optional[int]
     doctor_id: int
@@ -126,29 +251,41 @@ class Appointment:
     google_calendar_event_id: Optional[str] = None
     created_at: Optional[str] = None  # Added created_at field
 
+    # Column order expected by from_row. start_time and end_time may also be
+    # read from start_minute/end_minute, from_row accepts either.
+    COLUMNS: ClassVar[Tuple[str, ...]] = (
+        'id', 'doctor_id', 'patient_id', 'start_time', 'end_time', 'appointment_type',
+        'urgency_level', 'status', 'notes', 'google_calendar_event_id', 'created_at'
+    )
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a plain tuple of COLUMNS values, without an intermediate dict"""
+        (appointment_id, doctor_id, patient_id, start_time, end_time, appointment_type, urgency_level,
+         status, notes, google_calendar_event_id, created_at) = row
+        return cls(
+            appointment_id, doctor_id, patient_id,
+            _parse_appointment_time(start_time), _parse_appointment_time(end_time),
+            appointment_type, urgency_level, status, notes, google_calendar_event_id, created_at
+        )
+
+    @classmethod
+    def from_db(cls, data):
+        """
+        Build from a row dict read from the database, which has every column
+        (start_time/end_time as stored text, or datetimes in epoch mode)
+        """
+        return cls.from_row(_APPOINTMENT_VALUES(data))
+
     @classmethod
     def from_dict(cls, data):
         # Filter out unknown fields
-        valid_fields = [
-            'id', 'doctor_id', 'patient_id', 'start_time', 'end_time',
-            'appointment_type', 'urgency_level', 'status', 'notes',
-            'google_calendar_event_id', 'created_at'
-        ]
-        filtered_data = {k: v for k, v in data.items() if k in valid_fields}
+        filtered_data = {k: v for k, v in data.items() if k in APPOINTMENT_FIELDS}
 
         if 'start_time' in filtered_data and isinstance(filtered_data['start_time'], str):
-            try:
-                filtered_data['start_time'] = datetime.fromisoformat(filtered_data['start_time'])
-            except ValueError:
-                # Try another format if ISO format fails
-                filtered_data['start_time'] = datetime.strptime(filtered_data['start_time'], "%Y-%m-%d %H:%M:%S")
-
+            filtered_data['start_time'] = parse_datetime(filtered_data['start_time'])
         if 'end_time' in filtered_data and isinstance(filtered_data['end_time'], str):
-            try:
-                filtered_data['end_time'] = datetime.fromisoformat(filtered_data['end_time'])
-            except ValueError:
-                # Try another format if ISO format fails
-                filtered_data['end_time'] = datetime.strptime(filtered_data['end_time'], "%Y-%m-%d %H:%M:%S")
+            filtered_data['end_time'] = parse_datetime(filtered_data['end_time'])
 
         return cls(**filtered_data)
 
@@ -171,8 +308,16 @@ class Appointment:
         return result
 
 
-@dataclass
+APPOINTMENT_FIELDS = frozenset(Appointment.COLUMNS)
+_APPOINTMENT_VALUES = itemgetter(*Appointment.COLUMNS)
+
+
+@dataclass(slots=True)
 class AppointmentSlot:
+    """
+    Candidate slot found by the scheduler. Searches build thousands of them,
+    so it is a bare slotted record, best built positionally.
+    """
     start_time: datetime
     end_time: datetime
     doctor_id: int
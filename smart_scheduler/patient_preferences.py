@@ -0,0 +1,184 @@
+import functools
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple
+
+from database_sqlite import db_client
+from models import Appointment
+from interval_index import NON_BLOCKING_STATUSES, is_blocking
+from config import PATIENT_PREFERENCE_PRIOR
+
+logger = logging.getLogger(__name__)
+
+# Share of the preference score that comes from the hour of day (the rest is the weekday)
+HOUR_WEIGHT = 0.7
+
+
+class TimePreference:
+    """
+    Hour-of-day and weekday histogram of a patient's booked appointments
+
+    The per-slot score is precomputed for every (weekday, hour) when the histogram
+    changes, so scoring a slot is a table lookup. With no history the score is the
+    neutral 0.5, and it moves towards the patient's habits as history grows.
+    """
+
+    def __init__(self, hour_counts: Sequence[int] = (0,) * 24, weekday_counts: Sequence[int] = (0,) * 7):
+        self.hour_counts = tuple(hour_counts)
+        self.weekday_counts = tuple(weekday_counts)
+        self.total = sum(self.weekday_counts)
+
+        # How much to trust the history, 0 without appointments and 0.5 at PATIENT_PREFERENCE_PRIOR
+        confidence = self.total / (self.total + PATIENT_PREFERENCE_PRIOR) if self.total > 0 else 0.0
+
+        # Hours next to a habitual hour count half, so 9:00 regulars still like 10:00
+        smoothed = [
+            self.hour_counts[hour]
+            + 0.5 * (self.hour_counts[hour - 1] if hour > 0 else 0)
+            + 0.5 * (self.hour_counts[hour + 1] if hour < 23 else 0)
+            for hour in range(24)
+        ]
+        hour_max = max(smoothed) or 1
+        weekday_max = max(self.weekday_counts) or 1
+
+        self.scores: Tuple[Tuple[float, ...], ...] = tuple(
+            tuple(
+                max(0.1, min(1.0, 0.5 + confidence * (
+                        HOUR_WEIGHT * smoothed[hour] / hour_max
+                        + (1 - HOUR_WEIGHT) * self.weekday_counts[weekday] / weekday_max
+                        - 0.5
+                )))
+                for hour in range(24)
+            )
+            for weekday in range(7)
+        )
+        self.max_score = max(max(row) for row in self.scores)
+
+    def score(self, slot_time: datetime) -> float:
+        return self.scores[slot_time.weekday()][slot_time.hour]
+
+    def with_appointment(self, start_time: datetime, delta: int = 1) -> "TimePreference":
+        """Copy with one appointment at start_time added (delta=1) or removed (delta=-1)"""
+        hour_counts = list(self.hour_counts)
+        weekday_counts = list(self.weekday_counts)
+        hour_counts[start_time.hour] = max(0, hour_counts[start_time.hour] + delta)
+        weekday_counts[start_time.weekday()] = max(0, weekday_counts[start_time.weekday()] + delta)
+        return TimePreference(hour_counts, weekday_counts)
+
+
+class PatientPreferenceStore:
+    """
+    TimePreference per patient, kept in memory and persisted in the
+    patient_time_preferences table
+
+    A patient's histogram is read from the table on first use (and built from
+    their appointments if there is no row yet), then kept up to date with
+    record_booking()/forget_booking() as appointments are booked, moved or
+    cancelled. rebuild() recomputes every patient in one aggregate query.
+    """
+
+    def __init__(self, db, preferences: Optional[Dict[int, TimePreference]] = None):
+        self.db = db
+        self._preferences: Dict[int, TimePreference] = dict(preferences or {})
+        self._lock = threading.RLock()
+
+    def get(self, patient_id: int) -> Optional[TimePreference]:
+        preference = self._preferences.get(patient_id)
+        if preference is not None or self.db is None:
+            return preference
+
+        with self._lock:
+            preference = self._preferences.get(patient_id)
+            if preference is None:
+                preference = self._load(patient_id)
+                self._preferences[patient_id] = preference
+            return preference
+
+    def record_booking(self, appointment: Appointment):
+        """Count a booked appointment (cancelled ones are ignored)"""
+        if is_blocking(appointment):
+            self._update(appointment.patient_id, appointment.start_time, 1)
+
+    def forget_booking(self, appointment: Appointment):
+        """Undo record_booking() for an appointment that was cancelled or moved"""
+        if is_blocking(appointment):
+            self._update(appointment.patient_id, appointment.start_time, -1)
+
+    def rebuild(self) -> int:
+        """Recompute every patient's histogram from the appointments table, returns the number of patients"""
+        counts = defaultdict(lambda: ([0] * 24, [0] * 7))
+        histogram_result = self.db.get_patient_time_histograms(exclude_statuses=NON_BLOCKING_STATUSES)
+        for row in histogram_result.get('data') or []:
+            hour_counts, weekday_counts = counts[row['patient_id']]
+            hour_counts[row['hour']] += row['count']
+            weekday_counts[row['weekday']] += row['count']
+
+        with self._lock:
+            self.db.replace_patient_time_preferences([
+                (patient_id, hour_counts, weekday_counts)
+                for patient_id, (hour_counts, weekday_counts) in counts.items()
+            ])
+            self._preferences = {
+                patient_id: TimePreference(hour_counts, weekday_counts)
+                for patient_id, (hour_counts, weekday_counts) in counts.items()
+            }
+
+        logger.info(f"Rebuilt time preferences for {len(counts)} patients")
+        return len(counts)
+
+    def _load(self, patient_id: int) -> TimePreference:
+        preference = self._load_saved(patient_id)
+        if preference is not None:
+            return preference
+
+        hour_counts, weekday_counts = [0] * 24, [0] * 7
+        histogram_result = self.db.get_patient_time_histograms(
+            patient_id=patient_id, exclude_statuses=NON_BLOCKING_STATUSES
+        )
+        for row in histogram_result.get('data') or []:
+            hour_counts[row['hour']] += row['count']
+            weekday_counts[row['weekday']] += row['count']
+
+        self.db.save_patient_time_preference(patient_id, hour_counts, weekday_counts)
+        return TimePreference(hour_counts, weekday_counts)
+
+    def _load_saved(self, patient_id: int) -> Optional[TimePreference]:
+        result = self.db.get_patient_time_preference(patient_id)
+        if not result.get('data'):
+            return None
+
+        row = result['data'][0]
+        return TimePreference(json.loads(row['hour_counts']), json.loads(row['weekday_counts']))
+
+    def _update(self, patient_id: int, start_time: datetime, delta: int):
+        """
+        Apply one booking change to the saved histogram. The in-memory copy only
+        takes it once the write commits, so a rolled back booking leaves no trace.
+        """
+        if self.db is None:
+            return
+
+        with self._lock:
+            if self.db.in_transaction:
+                # The saved row already holds this transaction's earlier changes, the memory copy does not
+                preference = self._load_saved(patient_id) or self._preferences.get(patient_id)
+            else:
+                preference = self._preferences.get(patient_id) or self._load_saved(patient_id)
+            if preference is None:
+                # Built from the appointments table on first use, which already has this change
+                return
+
+            preference = preference.with_appointment(start_time, delta)
+            self.db.save_patient_time_preference(patient_id, preference.hour_counts, preference.weekday_counts)
+            self.db.after_commit(functools.partial(self._set, patient_id, preference))
+
+    def _set(self, patient_id: int, preference: TimePreference):
+        with self._lock:
+            self._preferences[patient_id] = preference
+
+
+# Shared by every scheduler in the process
+patient_preferences = PatientPreferenceStore(db_client)
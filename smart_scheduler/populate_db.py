@@ -1,4 +1,5 @@
 from database_sqlite import db_client
+from patient_preferences import patient_preferences
 from datetime import datetime, timedelta
 
 
@@ -45,31 +46,32 @@ def populate_sample_data():
     }
 
     print("Adding patients...")
-    db_client.create_patient(patient1)
-    db_client.create_patient(patient2)
+    db_client.create_patients_bulk([patient1, patient2], return_rows=False)
 
     # Add doctor availability
+    availability = []
+
     # Monday to Friday, 9 AM to 5 PM for Dr. Smith
     for day in range(5):
-        availability = {
+        availability.append({
             "doctor_id": 1,
             "day_of_week": day,
             "start_time": "09:00",
             "end_time": "17:00",
             "recurring": 1
-        }
-        db_client.create_doctor_availability(availability)
+        })
 
     # Monday, Wednesday, Friday for Dr. Johnson
     for day in [0, 2, 4]:
-        availability = {
+        availability.append({
             "doctor_id": 2,
             "day_of_week": day,
             "start_time": "10:00",
             "end_time": "18:00",
             "recurring": 1
-        }
-        db_client.create_doctor_availability(availability)
+        })
+
+    db_client.create_doctor_availability_bulk(availability, return_rows=False)
 
     # Add some appointments
     today = datetime.now()
@@ -93,8 +95,10 @@ def populate_sample_data():
     }
 
     print("Adding appointments...")
-    db_client.create_appointment(appointment1)
-    db_client.create_appointment(appointment2)
+    db_client.create_appointments_bulk([appointment1, appointment2], return_rows=False)
+
+    print("Building patient time preferences...")
+    patient_preferences.rebuild()
 
     print("Sample data added successfully!")
 
@@ -0,0 +1,139 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime, date, time, timedelta
+from typing import Optional
+
+from config import LOOKAHEAD_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Tables slot search reads, everything else is dropped from the mirror
+MIRROR_TABLES = ("doctors", "doctor_availability", "appointments")
+
+
+class ReadMirror:
+    """
+    In-memory copy of the tables slot search reads
+
+    load() copies the database file into a ":memory:" database with the sqlite3
+    backup API and keeps doctors, availability and the appointments overlapping
+    the window from today's midnight to LOOKAHEAD_DAYS days after it. The window
+    rolls forward (by loading again) on the first read of a new day.
+
+    The client applies its own committed writes with apply(), which copies the
+    affected rows from the file again, so rows written by other processes or by
+    raw SQL only show up after clear(). All access goes through one connection
+    under a lock, every read being a short, fully fetched in-memory query.
+    """
+
+    def __init__(self, lookahead_days: int = LOOKAHEAD_DAYS):
+        self.lookahead_days = lookahead_days
+        self.conn: Optional[sqlite3.Connection] = None
+        self.window_start: Optional[datetime] = None
+        self.window_end: Optional[datetime] = None
+        self._columns = {}
+        self._lock = threading.RLock()
+
+    def load(self, source: sqlite3.Connection):
+        """Copy the source database and cut it down to the mirrored tables and window"""
+        with self._lock:
+            window_start = datetime.combine(date.today(), time(0, 0))
+            window_end = window_start + timedelta(days=self.lookahead_days + 1)
+
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            source.backup(conn)
+
+            tables = [
+                row['name'] for row in
+                conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+            ]
+            for table_name in tables:
+                if table_name not in MIRROR_TABLES:
+                    conn.execute(f"DROP TABLE {table_name}")
+            conn.execute(
+                "DELETE FROM appointments WHERE julianday(end_time) <= julianday(?) "
+                "OR julianday(start_time) >= julianday(?)",
+                (window_start.isoformat(), window_end.isoformat())
+            )
+            conn.commit()
+
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = conn
+            self.window_start = window_start
+            self.window_end = window_end
+            self._columns = {}
+            logger.info(f"Loaded read mirror for {window_start.date()} to {window_end.date()}")
+
+    def clear(self):
+        """Drop the copy, the next read loads it again"""
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            self.window_start = self.window_end = None
+
+    def covers(self, source: sqlite3.Connection, table_name: str,
+               start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> bool:
+        """
+        Whether a read of table_name can be answered from the mirror, loading or
+        rolling it first if needed. Appointment reads must be bounded by
+        [start_date, end_date) inside the window.
+        """
+        if table_name not in MIRROR_TABLES:
+            return False
+
+        with self._lock:
+            if self.conn is None or self.window_start.date() != date.today():
+                self.load(source)
+            if table_name != "appointments":
+                return True
+            return (
+                start_date is not None and end_date is not None
+                and self.window_start <= start_date and end_date <= self.window_end
+            )
+
+    def fetchall(self, query: str, params=(), row_factory=sqlite3.Row) -> list:
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.row_factory = row_factory
+            try:
+                return cursor.execute(query, params).fetchall()
+            finally:
+                cursor.close()
+
+    def apply(self, source: sqlite3.Connection, table_name: str, condition: str, params=()):
+        """
+        Replace the mirrored rows of table_name matching condition (a WHERE
+        clause) with the committed rows of the source, e.g. "id IN (?, ?)"
+        after a write. Rows deleted from the source disappear from the mirror.
+        """
+        if table_name not in MIRROR_TABLES:
+            return
+
+        with self._lock:
+            if self.conn is None:
+                return
+
+            columns = self._columns.get(table_name)
+            if columns is None:
+                # table_info leaves out generated columns, which can't be inserted
+                columns = [row['name'] for row in self.conn.execute(f"PRAGMA table_info({table_name})")]
+                self._columns[table_name] = columns
+            column_list = ', '.join(columns)
+            placeholders = ', '.join(['?' for _ in columns])
+
+            rows = source.execute(f"SELECT {column_list} FROM {table_name} WHERE {condition}", params).fetchall()
+            self.conn.execute(f"DELETE FROM {table_name} WHERE {condition}", params)
+            self.conn.executemany(
+                f"INSERT INTO {table_name} ({column_list}) VALUES ({placeholders})", [tuple(row) for row in rows]
+            )
+            if table_name == "appointments":
+                self.conn.execute(
+                    f"DELETE FROM appointments WHERE ({condition}) AND (julianday(end_time) <= julianday(?) "
+                    f"OR julianday(start_time) >= julianday(?))",
+                    list(params) + [self.window_start.isoformat(), self.window_end.isoformat()]
+                )
+            self.conn.commit()
\ No newline at end of file
@@ -0,0 +1,165 @@
+import logging
+from datetime import datetime, timedelta, date, time
+from typing import List, Dict, Tuple, Optional
+
+from models import Doctor, DoctorAvailability
+from interval_index import IntervalIndex
+from appointment_batch import AppointmentBatch
+from availability_template import WeeklyAvailability, AvailabilityTemplateCache, availability_templates, compile_templates
+
+logger = logging.getLogger(__name__)
+
+
+def availability_applies(avail: DoctorAvailability, date_obj: date) -> bool:
+    """Check if an availability row applies to a specific date"""
+    # Check for specific date availability
+    if avail.specific_date and avail.specific_date == date_obj:
+        return True
+    # Check for recurring availability on this day of the week (0 = Monday, 6 = Sunday)
+    return bool(avail.recurring and avail.day_of_week == date_obj.weekday())
+
+
+class ScheduleSnapshot:
+    """
+    Doctors, availability and appointments for a set of doctors over a date range
+
+    The (blocking) appointments stay one columnar AppointmentBatch, split by
+    doctor and counted per (doctor_id, date) up front.
+    """
+
+    def __init__(
+            self,
+            doctors: Dict[int, Doctor],
+            templates: Dict[int, WeeklyAvailability],
+            appointments: AppointmentBatch
+    ):
+        self.doctors = doctors
+        self.templates = templates
+        self.appointments = appointments
+        self._interval_indexes: Dict[int, IntervalIndex] = {}
+
+        self._doctor_appointments: Dict[int, AppointmentBatch] = appointments.by_doctor()
+        self._day_counts: Dict[Tuple[int, date], int] = appointments.count_by_doctor_day()
+
+    def get_doctor(self, doctor_id: int) -> Optional[Doctor]:
+        return self.doctors.get(doctor_id)
+
+    def get_availability(self, doctor_id: int, date_obj: date) -> Tuple[DoctorAvailability, ...]:
+        template = self.templates.get(doctor_id)
+        if template is None:
+            return ()
+        return template.for_date(date_obj)
+
+    def get_appointments(self, doctor_id: int, date_obj: date) -> AppointmentBatch:
+        """The doctor's appointments starting on date_obj"""
+        appointments = self._doctor_appointments.get(doctor_id)
+        if appointments is None:
+            return AppointmentBatch.empty()
+        return appointments.starting_on(date_obj)
+
+    def count_appointments(self, doctor_id: int, date_obj: date) -> int:
+        return self._day_counts.get((doctor_id, date_obj), 0)
+
+    def subset(self, doctor_ids) -> "ScheduleSnapshot":
+        """Snapshot restricted to doctor_ids, e.g. to hand one partition to a worker"""
+        doctor_ids = set(doctor_ids)
+        return ScheduleSnapshot(
+            {doctor_id: doctor for doctor_id, doctor in self.doctors.items() if doctor_id in doctor_ids},
+            {doctor_id: template for doctor_id, template in self.templates.items() if doctor_id in doctor_ids},
+            self.appointments.for_doctors(doctor_ids)
+        )
+
+    def get_interval_index(self, doctor_id: int) -> IntervalIndex:
+        """Interval index over all of the doctor's appointments in the range, built on first use"""
+        index = self._interval_indexes.get(doctor_id)
+        if index is None:
+            index = IntervalIndex.from_batch(self._doctor_appointments.get(doctor_id, AppointmentBatch.empty()))
+            self._interval_indexes[doctor_id] = index
+        return index
+
+
+class ScheduleLoader:
+    """
+    Range-prefetch data loader for slot search
+
+    Loads every doctor, availability row and appointment needed for a search in a
+    fixed number of queries (one per table), independent of the length of the
+    date range, instead of two queries per doctor per day.
+    """
+
+    def __init__(self, db, templates: AvailabilityTemplateCache = availability_templates):
+        self.db = db
+        self.templates = templates
+
+    def load_doctors(self, doctor_ids: List[int]) -> Dict[int, Doctor]:
+        """Active doctors among doctor_ids, by ID"""
+        doctors_result = self.db.get_doctors_by_ids(doctor_ids)
+        doctors = {}
+        for doctor_data in doctors_result.get('data') or []:
+            doctor = Doctor.from_db(doctor_data)
+            doctors[doctor.id] = doctor
+        return doctors
+
+    def load_templates(self, doctor_ids: List[int]) -> Dict[int, WeeklyAvailability]:
+        """Compiled weekly availability by doctor ID, only querying doctors that are not cached yet"""
+        templates = {}
+        missing = []
+        for doctor_id in doctor_ids:
+            template = self.templates.get(doctor_id)
+            if template is None:
+                missing.append(doctor_id)
+            else:
+                templates[doctor_id] = template
+
+        if missing:
+            versions = {doctor_id: self.templates.version(doctor_id) for doctor_id in missing}
+            compiled = compile_templates(missing, self.db.iter_availability(missing))
+            for doctor_id, template in compiled.items():
+                self.templates.put(doctor_id, template, versions[doctor_id])
+            templates.update(compiled)
+
+        return templates
+
+    def load(
+            self,
+            doctor_ids: List[int],
+            start_date: datetime,
+            end_date: datetime,
+            schedule_doctor_ids: Optional[List[int]] = None,
+            doctors: Optional[Dict[int, Doctor]] = None
+    ) -> ScheduleSnapshot:
+        """
+        Load a snapshot for doctor_ids over the date range
+
+        Availability and appointments are only loaded for schedule_doctor_ids
+        (default: all doctors), e.g. to skip doctors whose days are already cached.
+        Pass doctors from load_doctors() to avoid fetching them again.
+        """
+        first_day = start_date.date()
+        last_day = end_date.date()
+        days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+        if doctors is None:
+            doctors = self.load_doctors(doctor_ids)
+
+        if schedule_doctor_ids is None:
+            schedule_doctor_ids = list(doctors)
+        else:
+            schedule_doctor_ids = [doctor_id for doctor_id in schedule_doctor_ids if doctor_id in doctors]
+
+        if not schedule_doctor_ids:
+            return ScheduleSnapshot(doctors, {}, AppointmentBatch.empty())
+
+        # Availability: compiled weekly templates, expanded per day on lookup
+        templates = self.load_templates(schedule_doctor_ids)
+
+        # Appointments overlapping the range, as columns. One that starts before the
+        # range (or runs past midnight) still blocks time through the doctor's
+        # interval index.
+        range_start = datetime.combine(first_day, time(0, 0))
+        range_end = datetime.combine(last_day, time(0, 0)) + timedelta(days=1)
+        appointments = self.db.get_appointment_batch(schedule_doctor_ids, range_start, range_end).blocking()
+
+        logger.debug(f"Prefetched {len(doctors)} doctors and {len(appointments)} appointments over {len(days)} days")
+
+        return ScheduleSnapshot(doctors, templates, appointments)
@@ -1,11 +1,21 @@
+import heapq
+import math
+import threading
 import numpy as np
-from datetime import datetime, timedelta, time
+from bisect import bisect_right
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import islice
+from datetime import datetime, timedelta, time, date
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 
 # Use SQLite database
 from database_sqlite import db_client
 from models import Doctor, Patient, Appointment, AppointmentSlot, DoctorAvailability
+from schedule_loader import ScheduleLoader, ScheduleSnapshot
+from interval_index import IntervalIndex
+from slot_cache import FreeDay, FreeSlotCache, free_slot_cache
+from patient_preferences import PatientPreferenceStore, TimePreference, patient_preferences
 from config import (
     APPOINTMENT_TYPES,
     WORKING_HOURS_START,
@@ -13,11 +23,36 @@ from config import (
     BUFFER_BETWEEN_APPOINTMENTS,
     OPTIMIZATION_WEIGHT_DOCTOR_LOAD,
     OPTIMIZATION_WEIGHT_TIME_PREFERENCE,
-    OPTIMIZATION_WEIGHT_URGENCY
+    OPTIMIZATION_WEIGHT_URGENCY,
+    SLOT_INTERVAL_MINUTES,
+    SLOT_SEARCH_ENGINE,
+    SLOT_SEARCH_WORKERS,
+    SLOT_SEARCH_EXECUTOR,
+    PARALLEL_SEARCH_MIN_DOCTORS
 )
 
 logger = logging.getLogger(__name__)
 
+SLOT_SEARCH_ENGINES = ("python", "vectorized")
+SLOT_SEARCH_EXECUTORS = ("thread", "process")
+MINUTES_PER_DAY = 24 * 60
+
+# Worker pools for parallel slot search, shared by every scheduler in the process
+_executors: Dict[Tuple[str, int], Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(kind: str, workers: int) -> Executor:
+    with _executors_lock:
+        executor = _executors.get((kind, workers))
+        if executor is None:
+            if kind == "thread":
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slot-search")
+            else:
+                executor = ProcessPoolExecutor(max_workers=workers)
+            _executors[(kind, workers)] = executor
+        return executor
+
 
 class AppointmentScheduler:
     """
@@ -28,40 +63,42 @@ class AppointmentScheduler:
     4. Balanced doctor workload
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            engine: Optional[str] = None,
+            cache: Optional[FreeSlotCache] = free_slot_cache,
+            workers: Optional[int] = None,
+            executor: Optional[str] = None,
+            preferences: Optional[PatientPreferenceStore] = None
+    ):
         self.db = db_client
-
-    def get_doctor_appointments(self, doctor_id, start_date, end_date):
-        """Get all appointments for a doctor within a date range"""
-        result = self.db.get_doctor_appointments(doctor_id, start_date, end_date)
+        self.loader = ScheduleLoader(self.db)
+        self.cache = cache
+        self.preferences = preferences or patient_preferences
+        self.engine = engine or SLOT_SEARCH_ENGINE
+        self.workers = SLOT_SEARCH_WORKERS if workers is None else workers
+        self.executor = executor or SLOT_SEARCH_EXECUTOR
+
+        if self.engine not in SLOT_SEARCH_ENGINES:
+            raise ValueError(f"Invalid slot search engine: {self.engine}")
+        if self.executor not in SLOT_SEARCH_EXECUTORS:
+            raise ValueError(f"Invalid slot search executor: {self.executor}")
+
+    def get_doctor_appointments(self, doctor_id, start_date, end_date, limit=None, offset=0):
+        """Get all appointments for a doctor within a date range (one page of them with limit)"""
+        result = self.db.get_doctor_appointments(doctor_id, start_date, end_date, limit=limit, offset=offset)
         appointments = []
 
         if 'data' in result and result['data']:
             for appt_data in result['data']:
-                appointments.append(Appointment.from_dict(appt_data))
+                appointments.append(Appointment.from_db(appt_data))
 
         return appointments
 
     def get_doctor_availability(self, doctor_id, date_obj):
         """Get doctor's availability for a specific date"""
-        result = self.db.get_doctor_availability(doctor_id)
-        availabilities = []
-
-        if 'data' in result and result['data']:
-            for avail_data in result['data']:
-                avail = DoctorAvailability.from_dict(avail_data)
-
-                # Check if this availability applies to our date
-                day_of_week = date_obj.weekday()  # 0 = Monday, 6 = Sunday
-
-                # Check for specific date availability
-                if avail.specific_date and avail.specific_date == date_obj:
-                    availabilities.append(avail)
-                # Check for recurring availability on this day of the week
-                elif avail.recurring and avail.day_of_week == day_of_week:
-                    availabilities.append(avail)
-
-        return availabilities
+        template = self.loader.load_templates([doctor_id])[doctor_id]
+        return list(template.for_date(date_obj))
 
     def find_optimal_slots(
             self,
@@ -92,107 +129,595 @@ class AppointmentScheduler:
         """
         logger.info(f"Finding optimal slots for {appointment_type} appointment between {start_date} and {end_date}")
 
+        duration_minutes, days, doctors_by_id, doctors = self._prepare_search(
+            doctor_ids, start_date, end_date, appointment_type
+        )
+
+        if max_slots <= 0:
+            return []
+
+        lookup = self._free_day_lookup(doctor_ids, start_date, end_date, days, doctors_by_id)
+        search = (duration_minutes, urgency_level, preferred_time, patient_id, max_slots)
+
+        if self.workers > 1 and len(doctors) >= PARALLEL_SEARCH_MIN_DOCTORS:
+            entries = self._parallel_top_entries(doctors, days, lookup, *search)
+        else:
+            get_free_day, _, _ = lookup
+            entries = self._top_entries(
+                self._search_days(doctors, days, get_free_day, duration_minutes, urgency_level, preferred_time, patient_id),
+                max_slots, urgency_level, preferred_time, patient_id
+            )
+
+        # Return top slots, sorted by score (descending)
+        return [entry[4] for entry in entries]
+
+    def _top_entries(
+            self,
+            search_days,
+            max_slots: int,
+            urgency_level: int,
+            preferred_time: Optional[time],
+            patient_id: Optional[int]
+    ) -> List[tuple]:
+        """
+        Best max_slots (score, -doctor_position, -day_index, -position, slot)
+        entries of a search, sorted best first
+        """
+        # Bounded min-heap of the best slots seen so far. Ties are broken by
+        # (doctor, day, position) so the result matches a stable sort of all slots.
+        best = []
+
+        for day_index, date_obj, doctor_day_slots in search_days:
+            # Scores never increase with the date, so once no later day can beat
+            # the current k-th best slot the rest of the range can be skipped
+            if len(best) == max_slots and self._score_upper_bound(
+                    date_obj, urgency_level, preferred_time, patient_id) < best[0][0]:
+                logger.debug(f"Stopping slot search early at {date_obj}")
+                break
+
+            for doctor_position, slots in doctor_day_slots:
+                for position, slot in enumerate(slots):
+                    entry = (slot.score, -doctor_position, -day_index, -position, slot)
+                    if len(best) < max_slots:
+                        heapq.heappush(best, entry)
+                    elif entry[:4] > best[0][:4]:
+                        heapq.heapreplace(best, entry)
+
+        best.sort(key=lambda entry: entry[:4], reverse=True)
+        return best
+
+    def _parallel_top_entries(
+            self,
+            doctors: List[Tuple[int, Doctor]],
+            days: List[date],
+            lookup,
+            duration_minutes: int,
+            urgency_level: int,
+            preferred_time: Optional[time],
+            patient_id: Optional[int],
+            max_slots: int
+    ) -> List[tuple]:
+        """
+        Split the doctors across the worker pool, take the top max_slots of every
+        partition and k-way merge them
+
+        Entries keep the doctor's position in the original doctor_ids, so the
+        merged result is the same as the serial search.
+        """
+        get_free_day, get_snapshot, versions = lookup
+        # Load the patient's preference once here rather than in every worker
+        preference = self._patient_preference(patient_id)
+        partitions = [doctors[i::self.workers] for i in range(min(self.workers, len(doctors)))]
+        executor = _get_executor(self.executor, self.workers)
+
+        if self.executor == "thread":
+            futures = [
+                executor.submit(
+                    self._top_entries,
+                    self._search_days(
+                        partition, days, get_free_day, duration_minutes, urgency_level, preferred_time, patient_id
+                    ),
+                    max_slots, urgency_level, preferred_time, patient_id
+                )
+                for partition in partitions
+            ]
+            results = [future.result() for future in futures]
+        else:
+            # Worker processes have no access to the cache, so cached days are sent
+            # along and days they compute are stored here afterwards
+            cached = {}
+            for _, doctor in doctors:
+                for date_obj in days:
+                    free_day = self.cache.get(doctor.id, date_obj) if self.cache is not None else None
+                    if free_day is not None:
+                        cached[(doctor.id, date_obj)] = free_day
+
+            snapshot = None
+            if len(cached) < len(doctors) * len(days):
+                snapshot = get_snapshot()
+
+            futures = []
+            for partition in partitions:
+                partition_ids = {doctor.id for _, doctor in partition}
+                futures.append(executor.submit(
+                    _search_partition,
+                    self.engine,
+                    {patient_id: preference} if preference is not None else {},
+                    partition,
+                    days,
+                    {key: free_day for key, free_day in cached.items() if key[0] in partition_ids},
+                    snapshot.subset(partition_ids) if snapshot is not None else None,
+                    duration_minutes, urgency_level, preferred_time, patient_id, max_slots
+                ))
+
+            results = []
+            for future in futures:
+                entries, computed = future.result()
+                results.append(entries)
+                if self.cache is not None:
+                    for (doctor_id, date_obj), free_day in computed.items():
+                        self.cache.put(doctor_id, date_obj, free_day, versions[doctor_id])
+
+        merged = heapq.merge(*results, key=lambda entry: entry[:4], reverse=True)
+        return list(islice(merged, max_slots))
+
+    def iter_optimal_slots(
+            self,
+            doctor_ids: List[int],
+            start_date: datetime,
+            end_date: datetime,
+            appointment_type: str,
+            patient_id: Optional[int] = None,
+            urgency_level: int = 3,
+            preferred_time: Optional[time] = None
+    ) -> Iterator[AppointmentSlot]:
+        """
+        Lazily yield every free, scored slot in the range, day by day
+
+        Slots are generated one doctor-day at a time as the caller consumes them,
+        in date order (doctors in the given order within a day), not sorted by score.
+        """
+        search_days = self._iter_search_days(
+            doctor_ids, start_date, end_date, appointment_type, patient_id, urgency_level, preferred_time
+        )
+
+        return (
+            slot
+            for _, _, doctor_day_slots in search_days
+            for _, slots in doctor_day_slots
+            for slot in slots
+        )
+
+    def _iter_search_days(
+            self,
+            doctor_ids: List[int],
+            start_date: datetime,
+            end_date: datetime,
+            appointment_type: str,
+            patient_id: Optional[int] = None,
+            urgency_level: int = 3,
+            preferred_time: Optional[time] = None
+    ) -> Iterator[Tuple[int, date, Iterator[Tuple[int, List[AppointmentSlot]]]]]:
+        """
+        Validate a search and return a lazy iterator over its days
+
+        Each day is yielded as (day_index, date, doctor_day_slots), where
+        doctor_day_slots lazily yields (doctor_position, slots) for every doctor.
+        """
+        duration_minutes, days, doctors_by_id, doctors = self._prepare_search(
+            doctor_ids, start_date, end_date, appointment_type
+        )
+        get_free_day, _, _ = self._free_day_lookup(doctor_ids, start_date, end_date, days, doctors_by_id)
+
+        return self._search_days(
+            doctors, days, get_free_day, duration_minutes, urgency_level, preferred_time, patient_id
+        )
+
+    def _prepare_search(
+            self,
+            doctor_ids: List[int],
+            start_date: datetime,
+            end_date: datetime,
+            appointment_type: str
+    ) -> Tuple[int, List[date], Dict[int, Doctor], List[Tuple[int, Doctor]]]:
+        """Validate a search and load its doctors: (duration_minutes, days, doctors_by_id, doctors)"""
         # Get appointment duration
         if appointment_type not in APPOINTMENT_TYPES:
             raise ValueError(f"Invalid appointment type: {appointment_type}")
 
         duration_minutes = APPOINTMENT_TYPES[appointment_type]
-        duration = timedelta(minutes=duration_minutes)
 
-        # Collect all possible slots
-        all_slots = []
+        days = []
+        current_date = start_date.date()
+        while current_date <= end_date.date():
+            days.append(current_date)
+            current_date += timedelta(days=1)
+
+        doctors_by_id = self.loader.load_doctors(doctor_ids)
+        return duration_minutes, days, doctors_by_id, self._ordered_doctors(doctor_ids, doctors_by_id)
 
-        for doctor_id in doctor_ids:
-            # Get doctor info
-            doctor_result = self.db.get_doctor(doctor_id)
+    def _ordered_doctors(self, doctor_ids: List[int], doctors_by_id: Dict[int, Doctor]) -> List[Tuple[int, Doctor]]:
+        """(position in doctor_ids, doctor) for every doctor that was found"""
+        doctors = []
+        for doctor_position, doctor_id in enumerate(doctor_ids):
+            doctor = doctors_by_id.get(doctor_id)
 
-            if not doctor_result['data'] or not doctor_result['data'][0]:
+            if not doctor:
                 logger.warning(f"Doctor ID {doctor_id} not found. Skipping.")
                 continue
 
-            doctor = Doctor.from_dict(doctor_result['data'][0])
-
-            # Iterate through each day in the range
-            current_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-            while current_date.date() <= end_date.date():
-                # Get doctor's availability for this day
-                availabilities = self.get_doctor_availability(doctor_id, current_date.date())
-
-                if not availabilities:
-                    # Use default working hours if no specific availability is set
-                    default_start = time(hour=WORKING_HOURS_START, minute=0)
-                    default_end = time(hour=WORKING_HOURS_END, minute=0)
-
-                    availabilities = [
-                        DoctorAvailability(
-                            id=-1,
-                            doctor_id=doctor_id,
-                            day_of_week=current_date.weekday(),
-                            start_time=default_start,
-                            end_time=default_end,
-                            recurring=True,
-                            specific_date=None
-                        )
+            doctors.append((doctor_position, doctor))
+
+        return doctors
+
+    def _free_day_lookup(
+            self,
+            doctor_ids: List[int],
+            start_date: datetime,
+            end_date: datetime,
+            days: List[date],
+            doctors_by_id: Dict[int, Doctor]
+    ):
+        """
+        Return (get_free_day, get_snapshot, versions)
+
+        get_free_day(doctor, date) serves FreeDay entries from the cache where
+        possible and otherwise computes them from the snapshot, which get_snapshot()
+        loads on the first miss. versions are the cache versions read up front.
+        """
+        # Versions are read before any schedule data is loaded, so a write that
+        # happens during the search invalidates what it stores in the cache
+        versions = {}
+        if self.cache is not None:
+            versions = {doctor_id: self.cache.version(doctor_id) for doctor_id in doctors_by_id}
+
+        loaded = []
+        load_lock = threading.Lock()
+
+        def get_snapshot():
+            # Load availability and appointments on the first cache miss, and only
+            # for doctors that still have uncached days in the range. Parallel
+            # search workers share the snapshot, so only one of them loads it.
+            with load_lock:
+                if not loaded:
+                    schedule_doctor_ids = [
+                        doctor_id for doctor_id in doctors_by_id
+                        if self.cache is None or not all(self.cache.contains(doctor_id, day) for day in days)
                     ]
+                    loaded.append(self.loader.load(
+                        doctor_ids, start_date, end_date,
+                        schedule_doctor_ids=schedule_doctor_ids,
+                        doctors=doctors_by_id
+                    ))
+                return loaded[0]
+
+        def get_free_day(doctor, date_obj):
+            free_day = None
+            if self.cache is not None:
+                free_day = self.cache.get(doctor.id, date_obj)
+
+            if free_day is None:
+                free_day = self._free_day_from_snapshot(get_snapshot(), doctor.id, date_obj)
+
+                if self.cache is not None:
+                    self.cache.put(doctor.id, date_obj, free_day, versions[doctor.id])
+
+            return free_day
+
+        return get_free_day, get_snapshot, versions
+
+    def _free_day_from_snapshot(self, snapshot: ScheduleSnapshot, doctor_id: int, date_obj) -> FreeDay:
+        # Get doctor's availability for this day
+        availabilities = snapshot.get_availability(doctor_id, date_obj)
+
+        if not availabilities:
+            # Use default working hours if no specific availability is set
+            availabilities = [self._default_availability(doctor_id, date_obj)]
+
+        return self._compute_free_day(
+            date_obj,
+            availabilities,
+            snapshot.count_appointments(doctor_id, date_obj),
+            snapshot.get_interval_index(doctor_id)
+        )
 
-                # Get existing appointments for this day
-                day_start = datetime.combine(current_date.date(), time(0, 0))
-                day_end = day_start + timedelta(days=1)
-                existing_appointments = self.get_doctor_appointments(doctor_id, day_start, day_end)
-
-                # Generate slots for each availability block
-                for avail in availabilities:
-                    # Convert availability to datetime objects
-                    avail_start = datetime.combine(current_date.date(), avail.start_time)
-                    avail_end = datetime.combine(current_date.date(), avail.end_time)
-
-                    # Generate all possible time slots
-                    slot_start = avail_start
-                    while slot_start + duration <= avail_end:
-                        slot_end = slot_start + duration
-
-                        # Check for conflicts with existing appointments
-                        is_conflict = False
-                        for appt in existing_appointments:
-                            # Add buffer time between appointments
-                            appt_start_with_buffer = appt.start_time - BUFFER_BETWEEN_APPOINTMENTS
-                            appt_end_with_buffer = appt.end_time + BUFFER_BETWEEN_APPOINTMENTS
-
-                            if (slot_start < appt_end_with_buffer and slot_end > appt_start_with_buffer):
-                                is_conflict = True
-                                break
-
-                        if not is_conflict:
-                            # Calculate slot score
-                            score = self._calculate_slot_score(
-                                slot_start,
-                                doctor_id,
-                                existing_appointments,
-                                urgency_level,
-                                preferred_time,
-                                patient_id
-                            )
-
-                            all_slots.append(AppointmentSlot(
-                                start_time=slot_start,
-                                end_time=slot_end,
-                                doctor_id=doctor_id,
-                                doctor_name=doctor.name,
-                                score=score
-                            ))
-
-                        # Move to next slot
-                        slot_start += timedelta(minutes=15)  # 15-minute intervals
-
-                # Move to next day
-                current_date += timedelta(days=1)
-
-        # Sort slots by score (descending)
-        all_slots.sort(key=lambda x: x.score, reverse=True)
-
-        # Return top slots
-        return all_slots[:max_slots]
+    def _search_days(
+            self,
+            doctors: List[Tuple[int, Doctor]],
+            days: List[date],
+            get_free_day,
+            duration_minutes: int,
+            urgency_level: int,
+            preferred_time: Optional[time],
+            patient_id: Optional[int]
+    ) -> Iterator[Tuple[int, date, Iterator[Tuple[int, List[AppointmentSlot]]]]]:
+        """Lazy (day_index, date, doctor_day_slots) iterator over the given doctors"""
+        def doctor_day_slots(date_obj):
+            for doctor_position, doctor in doctors:
+                # Generate and score the free slots for this day
+                yield doctor_position, self._generate_day_slots(
+                    doctor,
+                    date_obj,
+                    get_free_day(doctor, date_obj),
+                    duration_minutes,
+                    urgency_level,
+                    preferred_time,
+                    patient_id
+                )
+
+        # Iterate through each day in the range
+        for day_index, date_obj in enumerate(days):
+            yield day_index, date_obj, doctor_day_slots(date_obj)
+
+    def _default_availability(self, doctor_id: int, date_obj) -> DoctorAvailability:
+        """Default working hours for days without any availability set"""
+        return DoctorAvailability(
+            id=-1,
+            doctor_id=doctor_id,
+            day_of_week=date_obj.weekday(),
+            start_time=time(hour=WORKING_HOURS_START, minute=0),
+            end_time=time(hour=WORKING_HOURS_END, minute=0),
+            recurring=True,
+            specific_date=None
+        )
+
+    def _compute_free_day(
+            self,
+            date_obj,
+            availabilities: List[DoctorAvailability],
+            appointment_count: int,
+            conflict_index: IntervalIndex
+    ) -> FreeDay:
+        """Work out the free time of one doctor-day with the configured engine"""
+        blocks = tuple(
+            (avail.start_time.hour * 60 + avail.start_time.minute,
+             avail.end_time.hour * 60 + avail.end_time.minute)
+            for avail in availabilities
+        )
+
+        day_start = datetime.combine(date_obj, time(0, 0))
+        booked = [
+            (start, end) for start, end, _ in
+            conflict_index.overlapping(day_start, day_start + timedelta(days=1), BUFFER_BETWEEN_APPOINTMENTS)
+        ]
+
+        if self.engine == "vectorized":
+            free = self._free_intervals_vectorized(day_start, booked)
+        else:
+            free = self._free_intervals_python(day_start, booked)
+
+        return FreeDay(blocks=blocks, free=free, appointment_count=appointment_count)
+
+    def _free_intervals_python(
+            self,
+            day_start: datetime,
+            intervals: List[Tuple[datetime, datetime]]
+    ) -> Tuple[Tuple[int, int], ...]:
+        """Reference engine: merge the buffered appointments and take the gaps between them"""
+        buffer_minutes = BUFFER_BETWEEN_APPOINTMENTS.total_seconds() / 60.0
+
+        busy = []
+        for interval_start, interval_end in intervals:
+            start_minute = (interval_start - day_start).total_seconds() / 60.0 - buffer_minutes
+            end_minute = (interval_end - day_start).total_seconds() / 60.0 + buffer_minutes
+            first = min(max(math.floor(start_minute), 0), MINUTES_PER_DAY)
+            last = min(max(math.ceil(end_minute), 0), MINUTES_PER_DAY)
+            if first < last:
+                busy.append((first, last))
+
+        busy.sort()
+
+        free = []
+        cursor = 0
+        for first, last in busy:
+            if first > cursor:
+                free.append((cursor, first))
+            cursor = max(cursor, last)
+
+        if cursor < MINUTES_PER_DAY:
+            free.append((cursor, MINUTES_PER_DAY))
+
+        return tuple(free)
+
+    def _free_intervals_vectorized(
+            self,
+            day_start: datetime,
+            intervals: List[Tuple[datetime, datetime]]
+    ) -> Tuple[Tuple[int, int], ...]:
+        """NumPy engine: runs of unoccupied minutes in the day's occupancy array"""
+        occupied = self._day_occupancy(day_start, intervals)
+
+        edges = np.diff(np.concatenate(([True], occupied, [True])).astype(np.int8))
+        free_starts = np.flatnonzero(edges == -1)
+        free_ends = np.flatnonzero(edges == 1)
+
+        return tuple(zip(free_starts.tolist(), free_ends.tolist()))
+
+    def _generate_day_slots(
+            self,
+            doctor: Doctor,
+            date_obj,
+            free_day: FreeDay,
+            duration_minutes: int,
+            urgency_level: int,
+            preferred_time: Optional[time] = None,
+            patient_id: Optional[int] = None
+    ) -> List[AppointmentSlot]:
+        """Generate the scored, conflict-free slots of one doctor-day with the configured engine"""
+        if self.engine == "vectorized":
+            return self._generate_day_slots_vectorized(
+                doctor, date_obj, free_day, duration_minutes, urgency_level, preferred_time, patient_id
+            )
+
+        return self._generate_day_slots_python(
+            doctor, date_obj, free_day, duration_minutes, urgency_level, preferred_time, patient_id
+        )
+
+    def _generate_day_slots_python(
+            self,
+            doctor: Doctor,
+            date_obj,
+            free_day: FreeDay,
+            duration_minutes: int,
+            urgency_level: int,
+            preferred_time: Optional[time] = None,
+            patient_id: Optional[int] = None
+    ) -> List[AppointmentSlot]:
+        """Reference engine: step through every candidate start and look up the free range it falls in"""
+        day_start = datetime.combine(date_obj, time(0, 0))
+        duration = timedelta(minutes=duration_minutes)
+        free_starts = [start for start, _ in free_day.free]
+
+        workload_score = self._workload_score(free_day.appointment_count)
+        urgency_score = self._urgency_score(date_obj, urgency_level)
+
+        slots = []
+
+        # Generate slots for each availability block
+        for block_start, block_end in free_day.blocks:
+            # Generate all possible time slots
+            start_minute = block_start
+            while start_minute + duration_minutes <= block_end:
+                # The slot is conflict-free (buffers included) if it fits inside one free range
+                position = bisect_right(free_starts, start_minute) - 1
+
+                if position >= 0 and free_day.free[position][1] >= start_minute + duration_minutes:
+                    slot_start = day_start + timedelta(minutes=start_minute)
+
+                    # Calculate slot score
+                    score = self._combine_scores(
+                        workload_score,
+                        self._time_preference_score(slot_start, preferred_time, patient_id),
+                        urgency_score
+                    )
+
+                    slots.append(AppointmentSlot(slot_start, slot_start + duration, doctor.id, doctor.name, score))
+
+                # Move to next slot
+                start_minute += SLOT_INTERVAL_MINUTES
+
+        return slots
+
+    def _generate_day_slots_vectorized(
+            self,
+            doctor: Doctor,
+            date_obj,
+            free_day: FreeDay,
+            duration_minutes: int,
+            urgency_level: int,
+            preferred_time: Optional[time] = None,
+            patient_id: Optional[int] = None
+    ) -> List[AppointmentSlot]:
+        """
+        NumPy engine: the day is a minute-resolution occupancy array.
+
+        A cumulative sum over the array turns "is [start, start + duration) free"
+        into one subtraction per candidate, and every feasible candidate of the
+        day is scored in one pass. Produces exactly the same slots, in the same
+        order, as the reference engine.
+        """
+        day_start = datetime.combine(date_obj, time(0, 0))
+
+        free_edges = np.zeros(MINUTES_PER_DAY + 1, dtype=np.int32)
+        for free_start, free_end in free_day.free:
+            free_edges[free_start] += 1
+            free_edges[free_end] -= 1
+
+        occupied = np.cumsum(free_edges[:MINUTES_PER_DAY]) == 0
+        occupied_prefix = np.concatenate(([0], np.cumsum(occupied)))
+
+        # Candidate start minutes for every availability block, in block order
+        candidate_blocks = []
+        for block_start, block_end in free_day.blocks:
+            if block_end - block_start >= duration_minutes:
+                candidate_blocks.append(
+                    np.arange(block_start, block_end - duration_minutes + 1, SLOT_INTERVAL_MINUTES)
+                )
+
+        if not candidate_blocks:
+            return []
+
+        starts = np.concatenate(candidate_blocks)
+        is_free = occupied_prefix[starts + duration_minutes] == occupied_prefix[starts]
+        starts = starts[is_free]
+
+        if starts.size == 0:
+            return []
+
+        scores = self._calculate_slot_scores(
+            starts,
+            date_obj,
+            free_day.appointment_count,
+            urgency_level,
+            preferred_time,
+            patient_id
+        )
+
+        duration = timedelta(minutes=duration_minutes)
+        slots = []
+        for start_minute, score in zip(starts.tolist(), scores.tolist()):
+            slot_start = day_start + timedelta(minutes=start_minute)
+            slots.append(AppointmentSlot(slot_start, slot_start + duration, doctor.id, doctor.name, score))
+
+        return slots
+
+    def _day_occupancy(self, day_start: datetime, intervals: List[Tuple[datetime, datetime]]) -> np.ndarray:
+        """
+        Minute-resolution occupancy of a day, with every interval dilated by the buffer
+
+        Minute m is occupied when [m, m + 1) intersects an interval widened by
+        BUFFER_BETWEEN_APPOINTMENTS on both sides, so a whole-minute slot is free
+        exactly when none of its minutes are occupied.
+        """
+        # Pad both ends by the buffer so appointments just outside the day still dilate into it
+        pad = max(BUFFER_BETWEEN_APPOINTMENTS // timedelta(minutes=1), 0)
+        size = MINUTES_PER_DAY + 2 * pad
+        booked = np.zeros(size + 1, dtype=np.int32)
+
+        for interval_start, interval_end in intervals:
+            start_minute = (interval_start - day_start).total_seconds() / 60.0
+            end_minute = (interval_end - day_start).total_seconds() / 60.0
+            first = min(max(int(np.floor(start_minute)) + pad, 0), size)
+            last = min(max(int(np.ceil(end_minute)) + pad, 0), size)
+            booked[first] += 1
+            booked[last] -= 1
+
+        booked = np.cumsum(booked[:size]) > 0
+
+        if pad == 0:
+            return booked
+
+        # Dilate: minute m is occupied if any booked minute lies in [m - pad, m + pad]
+        booked_prefix = np.concatenate(([0], np.cumsum(booked)))
+        minutes = np.arange(pad, pad + MINUTES_PER_DAY)
+
+        return booked_prefix[minutes + pad + 1] > booked_prefix[minutes - pad]
+
+    def _calculate_slot_scores(
+            self,
+            start_minutes: np.ndarray,
+            date_obj,
+            daily_appointment_count: int,
+            urgency_level: int,
+            preferred_time: Optional[time] = None,
+            patient_id: Optional[int] = None
+    ) -> np.ndarray:
+        """Vectorized _calculate_slot_score for many start minutes on the same day"""
+        workload_score = self._workload_score(daily_appointment_count)
+        urgency_score = self._urgency_score(date_obj, urgency_level)
+
+        if preferred_time:
+            slot_hour = (start_minutes // 60) + ((start_minutes % 60) / 60.0)
+            preferred_hour = preferred_time.hour + (preferred_time.minute / 60.0)
+            time_pref_score = np.clip(1.0 - (np.abs(slot_hour - preferred_hour) / 8.0), 0.1, 1.0)
+        else:
+            preference = self._patient_preference(patient_id)
+            if preference is not None:
+                time_pref_score = np.asarray(preference.scores[date_obj.weekday()])[start_minutes // 60]
+            else:
+                time_pref_score = np.full(start_minutes.shape, 0.5)
+
+        return self._combine_scores(workload_score, time_pref_score, urgency_score)
 
     def _calculate_slot_score(
             self,
@@ -212,16 +737,56 @@ class AppointmentScheduler:
         2. Patient time preference (if provided)
         3. Urgency level (higher urgency = prefer sooner slots)
         """
-        score = 0.0
-
-        # 1. Doctor workload - fewer appointments on the day = higher score
         daily_appointment_count = sum(1 for a in existing_appointments
                                       if a.start_time.date() == slot_time.date())
 
+        workload_score = self._workload_score(daily_appointment_count)
+        time_pref_score = self._time_preference_score(slot_time, preferred_time, patient_id)
+        urgency_score = self._urgency_score(slot_time.date(), urgency_level)
+
+        return self._combine_scores(workload_score, time_pref_score, urgency_score)
+
+    def _combine_scores(self, workload_score, time_pref_score, urgency_score):
+        """Combine scores with weights (works on floats and NumPy arrays alike)"""
+        return (
+                OPTIMIZATION_WEIGHT_DOCTOR_LOAD * workload_score +
+                OPTIMIZATION_WEIGHT_TIME_PREFERENCE * time_pref_score +
+                OPTIMIZATION_WEIGHT_URGENCY * urgency_score
+        )
+
+    def _score_upper_bound(
+            self,
+            date_obj,
+            urgency_level: int,
+            preferred_time: Optional[time] = None,
+            patient_id: Optional[int] = None
+    ) -> float:
+        """Highest score any slot on date_obj or a later day can reach"""
+        # Urgency is non-increasing from today on, and past days score lowest
+        urgency_score = self._urgency_score(max(date_obj, datetime.now().date()), urgency_level)
+
+        preference = self._patient_preference(patient_id)
+        if preferred_time:
+            time_pref_score = 1.0
+        elif preference is not None:
+            time_pref_score = preference.max_score
+        else:
+            time_pref_score = 0.5
+
+        return self._combine_scores(1.0, time_pref_score, urgency_score)
+
+    def _workload_score(self, daily_appointment_count: int) -> float:
+        """Doctor workload - fewer appointments on the day = higher score"""
         workload_score = 1.0 - (daily_appointment_count / 10)  # Assuming 10 appointments is a full day
-        workload_score = max(0.1, min(1.0, workload_score))  # Keep between 0.1 and 1.0
+        return max(0.1, min(1.0, workload_score))  # Keep between 0.1 and 1.0
 
-        # 2. Patient time preference
+    def _time_preference_score(
+            self,
+            slot_time: datetime,
+            preferred_time: Optional[time] = None,
+            patient_id: Optional[int] = None
+    ) -> float:
+        """Patient time preference - closer to the preferred time of day = higher score"""
         time_pref_score = 0.5  # Default middle score
 
         if preferred_time:
@@ -234,13 +799,22 @@ class AppointmentScheduler:
             time_pref_score = 1.0 - (hour_diff / 8.0)  # Within 8 hours is the range
             time_pref_score = max(0.1, min(1.0, time_pref_score))
         elif patient_id:
-            # If we have a patient but no explicit preference,
-            # we could analyze their past appointments to infer a preference
-            # This would be implemented here
-            pass
-
-        # 3. Urgency - higher urgency prefers sooner slots
-        days_from_now = (slot_time.date() - datetime.now().date()).days
+            # No explicit preference: score the slot against the times the patient usually books
+            preference = self._patient_preference(patient_id)
+            if preference is not None:
+                time_pref_score = preference.score(slot_time)
+
+        return time_pref_score
+
+    def _patient_preference(self, patient_id: Optional[int]) -> Optional[TimePreference]:
+        """The patient's booking-time histogram (O(1) once loaded), None without a patient"""
+        if not patient_id:
+            return None
+        return self.preferences.get(patient_id)
+
+    def _urgency_score(self, date_obj, urgency_level: int) -> float:
+        """Urgency - higher urgency prefers sooner slots"""
+        days_from_now = (date_obj - datetime.now().date()).days
         if days_from_now < 0:
             # Past slots should not be considered
             urgency_score = 0.0
@@ -251,13 +825,40 @@ class AppointmentScheduler:
             # Modest preference for sooner slots
             urgency_score = 0.8 - (min(days_from_now, 14) / 20.0)
 
-        urgency_score = max(0.1, min(1.0, urgency_score))
-
-        # Combine scores with weights
-        score = (
-                OPTIMIZATION_WEIGHT_DOCTOR_LOAD * workload_score +
-                OPTIMIZATION_WEIGHT_TIME_PREFERENCE * time_pref_score +
-                OPTIMIZATION_WEIGHT_URGENCY * urgency_score
-        )
+        return max(0.1, min(1.0, urgency_score))
+
+
+def _search_partition(
+        engine: str,
+        preferences: Dict[int, TimePreference],
+        doctors: List[Tuple[int, Doctor]],
+        days: List[date],
+        cached: Dict[Tuple[int, date], FreeDay],
+        snapshot: Optional[ScheduleSnapshot],
+        duration_minutes: int,
+        urgency_level: int,
+        preferred_time: Optional[time],
+        patient_id: Optional[int],
+        max_slots: int
+):
+    """
+    Top entries for one partition of doctors, run in a worker process
 
-        return score
\ No newline at end of file
+    Returns (entries, computed) where computed holds the FreeDay entries that were
+    not in cached, for the parent process to store in its cache.
+    """
+    scheduler = AppointmentScheduler(engine=engine, cache=None, preferences=PatientPreferenceStore(None, preferences))
+    computed = {}
+
+    def get_free_day(doctor, date_obj):
+        key = (doctor.id, date_obj)
+        free_day = cached.get(key) or computed.get(key)
+        if free_day is None:
+            free_day = scheduler._free_day_from_snapshot(snapshot, doctor.id, date_obj)
+            computed[key] = free_day
+        return free_day
+
+    search_days = scheduler._search_days(
+        doctors, days, get_free_day, duration_minutes, urgency_level, preferred_time, patient_id
+    )
+    return scheduler._top_entries(search_days, max_slots, urgency_level, preferred_time, patient_id), computed
\ No newline at end of file
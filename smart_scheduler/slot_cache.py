@@ -0,0 +1,86 @@
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Tuple, Optional
+
+from config import FREE_SLOT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FreeDay:
+    """Free time of one doctor-day, independent of the appointment duration searched for"""
+    blocks: Tuple[Tuple[int, int], ...]  # availability blocks as (start, end) minutes of the day, in row order
+    free: Tuple[Tuple[int, int], ...]  # (start, end) minutes not blocked by an appointment or its buffer, sorted
+    appointment_count: int  # appointments booked on the day, for workload scoring
+
+
+class FreeSlotCache:
+    """
+    In-process LRU cache of FreeDay entries keyed by (doctor_id, date)
+
+    Every doctor has a version counter. Entries are stored with the version they
+    were computed from, and any write that changes a doctor's appointments or
+    availability bumps the counter, so stale doctor-days are simply never hit
+    again and age out of the LRU.
+    """
+
+    def __init__(self, maxsize: int = FREE_SLOT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def version(self, doctor_id: int) -> int:
+        return self._versions[doctor_id]
+
+    def invalidate_doctor(self, doctor_id: int):
+        """Bump the doctor's version after any change to their appointments or availability"""
+        with self._lock:
+            self._versions[doctor_id] += 1
+
+    def contains(self, doctor_id: int, date_obj: date) -> bool:
+        """Check for a current entry without touching the LRU order or hit statistics"""
+        with self._lock:
+            entry = self._entries.get((doctor_id, date_obj))
+            return entry is not None and entry[0] == self._versions[doctor_id]
+
+    def get(self, doctor_id: int, date_obj: date) -> Optional[FreeDay]:
+        key = (doctor_id, date_obj)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self._versions[doctor_id]:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, doctor_id: int, date_obj: date, free_day: FreeDay, version: int):
+        """Store an entry computed from the data as of version"""
+        if self.maxsize <= 0:
+            return
+
+        key = (doctor_id, date_obj)
+        with self._lock:
+            self._entries[key] = (version, free_day)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared by every scheduler in the process
+free_slot_cache = FreeSlotCache()
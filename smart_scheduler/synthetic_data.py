@@ -0,0 +1,224 @@
+import argparse
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from database_sqlite import db_client
+from slot_cache import free_slot_cache
+from availability_template import availability_templates
+from patient_preferences import PatientPreferenceStore, patient_preferences
+from config import APPOINTMENT_TYPES, BUFFER_BETWEEN_APPOINTMENTS, SLOT_INTERVAL_MINUTES
+
+logger = logging.getLogger(__name__)
+
+SPECIALTIES = ["General Practice", "Cardiology", "Neurology", "Pediatrics", "Dermatology", "Orthopedics"]
+
+# Weekly shapes doctors are drawn from, as (weekday, start hour, end hour) blocks
+WEEKLY_TEMPLATES = [
+    [(day, 9, 17) for day in range(5)],
+    [(day, 8, 12) for day in range(5)] + [(day, 13, 17) for day in range(5)],
+    [(day, 10, 18) for day in range(4)] + [(5, 9, 13)],
+    [(day, 7, 15) for day in (0, 2, 4)] + [(day, 12, 20) for day in (1, 3)],
+]
+
+# How often each appointment type is booked
+TYPE_WEIGHTS = {
+    "routine_checkup": 4,
+    "follow_up": 5,
+    "consultation": 3,
+    "procedure": 1,
+    "emergency": 1
+}
+
+TABLES = ["patient_time_preferences", "appointments", "doctor_availability", "patients", "doctors"]
+
+
+def reset(db=db_client):
+    """Delete every row from the scheduler tables"""
+    with db.transaction():
+        for table in TABLES:
+            db.cursor.execute(f"DELETE FROM {table}")
+            db.cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+
+    free_slot_cache.clear()
+    availability_templates.clear()
+    db.refresh_read_mirror()
+
+
+def generate(
+        doctors: int = 50,
+        patients: int = 1000,
+        days: int = 30,
+        history_days: int = 30,
+        density: float = 0.5,
+        cancelled_rate: float = 0.05,
+        seed: int = 0,
+        start_date: Optional[datetime] = None,
+        db=db_client
+) -> Dict[str, int]:
+    """
+    Fill the database with a synthetic practice
+
+    Doctors get one of WEEKLY_TEMPLATES as recurring availability plus the odd
+    extra specific-date shift. Every doctor-day from history_days in the past to
+    days ahead is booked up to roughly density of its available time with
+    non-overlapping appointments (buffers respected), past ones completed and
+    cancelled_rate of them cancelled. Returns the number of rows per table.
+    """
+    rng = random.Random(seed)
+    start_date = (start_date or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    created = datetime.now().isoformat()
+
+    doctor_rows = [
+        (f"Dr. Synthetic {i}", f"doctor{seed}_{i}@synthetic.example", rng.choice(SPECIALTIES), None, 1, created)
+        for i in range(doctors)
+    ]
+    patient_rows = [
+        (f"Patient {i}", f"patient{seed}_{i}@synthetic.example", f"555-{i:07d}", "1980-01-01", "{}", 1, created)
+        for i in range(patients)
+    ]
+
+    with db.transaction():
+        db.cursor.executemany(
+            "INSERT INTO doctors (name, email, specialty, calendar_id, active, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            doctor_rows
+        )
+        # AUTOINCREMENT ids, so the rows just inserted are the newest ones
+        db.cursor.execute("SELECT id FROM doctors ORDER BY id DESC LIMIT ?", (len(doctor_rows),))
+        doctor_ids = sorted(row[0] for row in db.cursor.fetchall())
+
+        db.cursor.executemany(
+            "INSERT INTO patients (name, email, phone, date_of_birth, medical_history, active, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            patient_rows
+        )
+        db.cursor.execute("SELECT id FROM patients ORDER BY id DESC LIMIT ?", (len(patient_rows),))
+        patient_ids = sorted(row[0] for row in db.cursor.fetchall())
+
+        availability_rows = []
+        appointment_rows = []
+        types = list(TYPE_WEIGHTS)
+        weights = [TYPE_WEIGHTS[appointment_type] for appointment_type in types]
+        buffer_minutes = int(BUFFER_BETWEEN_APPOINTMENTS.total_seconds() // 60)
+
+        for doctor_id in doctor_ids:
+            template = rng.choice(WEEKLY_TEMPLATES)
+            blocks_by_weekday = {}
+            for weekday, start_hour, end_hour in template:
+                availability_rows.append(
+                    (doctor_id, weekday, f"{start_hour:02d}:00", f"{end_hour:02d}:00", 1, None, created)
+                )
+                blocks_by_weekday.setdefault(weekday, []).append((start_hour * 60, end_hour * 60))
+
+            extra_shifts = {}
+            for _ in range(rng.randint(0, 2)):
+                shift_date = start_date + timedelta(days=rng.randint(0, max(days - 1, 0)))
+                extra_shifts[shift_date.date()] = (14 * 60, 19 * 60)
+                availability_rows.append(
+                    (doctor_id, shift_date.weekday(), "14:00", "19:00", 0, shift_date.date().isoformat(), created)
+                )
+
+            for offset in range(-history_days, days):
+                day = start_date + timedelta(days=offset)
+                blocks = list(blocks_by_weekday.get(day.weekday(), []))
+                if day.date() in extra_shifts:
+                    blocks.append(extra_shifts[day.date()])
+
+                for block_start, block_end in blocks:
+                    budget = density * (block_end - block_start)
+                    minute = block_start
+                    while budget > 0:
+                        # Leave a random gap so free time is spread through the block
+                        minute += SLOT_INTERVAL_MINUTES * rng.randint(0, max(int((1 - density) * 4), 0))
+                        appointment_type = rng.choices(types, weights)[0]
+                        duration = APPOINTMENT_TYPES[appointment_type]
+                        if minute + duration > block_end:
+                            break
+
+                        appointment_start = day + timedelta(minutes=minute)
+                        if rng.random() < cancelled_rate:
+                            status = "cancelled"
+                        elif appointment_start < datetime.now():
+                            status = "completed"
+                        else:
+                            status = "scheduled"
+
+                        appointment_rows.append((
+                            doctor_id,
+                            rng.choice(patient_ids),
+                            appointment_start.isoformat(),
+                            (appointment_start + timedelta(minutes=duration)).isoformat(),
+                            appointment_type,
+                            rng.randint(1, 5),
+                            status,
+                            created
+                        ))
+
+                        budget -= duration
+                        # Next start on the slot grid after the buffer
+                        minute += duration + buffer_minutes
+                        minute += -minute % SLOT_INTERVAL_MINUTES
+
+        db.cursor.executemany(
+            "INSERT INTO doctor_availability (doctor_id, day_of_week, start_time, end_time, recurring, "
+            "specific_date, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            availability_rows
+        )
+        db.cursor.executemany(
+            "INSERT INTO appointments (doctor_id, patient_id, start_time, end_time, appointment_type, "
+            "urgency_level, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            appointment_rows
+        )
+
+    # Rows were written behind the caches' backs
+    free_slot_cache.clear()
+    availability_templates.clear()
+    db.refresh_read_mirror()
+    # The shared store also keeps its in-memory copy, any other database gets a store of its own
+    store = patient_preferences if db is patient_preferences.db else PatientPreferenceStore(db)
+    store.rebuild()
+
+    counts = {
+        "doctors": len(doctor_rows),
+        "patients": len(patient_rows),
+        "doctor_availability": len(availability_rows),
+        "appointments": len(appointment_rows)
+    }
+    logger.info(f"Generated synthetic data: {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic scheduler database")
+    parser.add_argument("--doctors", type=int, default=50, help="Number of doctors")
+    parser.add_argument("--patients", type=int, default=1000, help="Number of patients")
+    parser.add_argument("--days", type=int, default=30, help="Days of appointments ahead of today")
+    parser.add_argument("--history-days", type=int, default=30, help="Days of past appointments")
+    parser.add_argument("--density", type=float, default=0.5, help="Share of available time that is booked (0-1)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--reset", action="store_true", help="Delete all existing rows before generating")
+    args = parser.parse_args()
+
+    # The default database is the live one, synthetic rows only go into a file named explicitly
+    if not os.environ.get("SCHEDULER_DB_PATH"):
+        parser.error("set SCHEDULER_DB_PATH to the database file to fill, refusing to write to scheduler.db")
+
+    if args.reset:
+        reset()
+
+    counts = generate(
+        doctors=args.doctors,
+        patients=args.patients,
+        days=args.days,
+        history_days=args.history_days,
+        density=args.density,
+        seed=args.seed
+    )
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Memoized parsing of the time, date and datetime text stored in the database
+
+Decoding the same few hundred availability times ("09:00", "17:00", ...) and
+the appointment times shared by many doctors over and over is the bulk of
+model decoding, so every parser keeps a bounded LRU cache of its results (the
+values are immutable and safe to share). The canonical ISO layouts take the C
+fromisoformat() parsers, strptime() is only a fallback for other layouts.
+"""
+import functools
+from datetime import datetime, date, time
+from typing import Union
+
+from config import TIME_PARSE_CACHE_SIZE, DATETIME_PARSE_CACHE_SIZE
+
+
+@functools.lru_cache(maxsize=TIME_PARSE_CACHE_SIZE)
+def parse_time(value: str) -> time:
+    """time from "HH:MM" (or any ISO time) text"""
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        # Hours without a leading zero, e.g. "9:00"
+        return datetime.strptime(value, "%H:%M").time()
+
+
+@functools.lru_cache(maxsize=TIME_PARSE_CACHE_SIZE)
+def parse_date(value: str) -> date:
+    """date from "YYYY-MM-DD" text, or the date part of an ISO datetime"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return datetime.fromisoformat(value).date()
+
+
+@functools.lru_cache(maxsize=DATETIME_PARSE_CACHE_SIZE)
+def _parse_datetime(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+
+def parse_datetime(value: Union[str, datetime]) -> datetime:
+    """Datetime from a stored ISO string (or sqlite3's default "YYYY-MM-DD HH:MM:SS" format)"""
+    if isinstance(value, datetime):
+        return value
+    return _parse_datetime(value)
\ No newline at end of file